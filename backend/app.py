@@ -2,8 +2,10 @@
 Flask Application Entry Point
 """
 import os
+import sqlalchemy as sa
 from app import create_app, db
 from app.models import User, Quiz, Question, Subscription, File
+from app.models.user import hash_password
 from flask.cli import with_appcontext
 import click
 
@@ -58,9 +60,9 @@ def create_admin():
     admin.set_password(password)
     
     db.session.add(admin)
-    db.session.commit()
+    db.session.flush()  # Assign admin.id without committing
     
-    # Create subscription
+    # Create subscription (commits the admin user in the same transaction)
     Subscription.create_free_subscription(admin.id)
     
     click.echo(f'Admin user {email} created successfully.')
@@ -70,92 +72,118 @@ def create_admin():
 @with_appcontext
 def seed_data():
     """Seed the database with sample data"""
-    # Create sample users
-    teacher1 = User(
-        email='teacher1@example.com',
-        first_name='John',
-        last_name='Smith',
-        role='teacher',
-        is_verified=True,
-        school_name='Springfield Elementary',
-        subject_areas='["Mathematics", "Science"]'
-    )
-    teacher1.set_password('password123')
-    
-    teacher2 = User(
-        email='teacher2@example.com',
-        first_name='Jane',
-        last_name='Doe',
-        role='teacher',
-        is_verified=True,
-        school_name='Riverside High School',
-        subject_areas='["English", "Literature"]'
-    )
-    teacher2.set_password('password123')
+    # Create sample users (hashed as User.set_password would)
+    password_hash = hash_password('password123')
+    user_rows = [
+        {
+            'email': 'teacher1@example.com',
+            'password_hash': password_hash,
+            'first_name': 'John',
+            'last_name': 'Smith',
+            'full_name': 'John Smith',  # Bulk inserts skip the User name events
+            'role': 'teacher',
+            'is_verified': True,
+            'school_name': 'Springfield Elementary',
+            'subject_areas': '["Mathematics", "Science"]'
+        },
+        {
+            'email': 'teacher2@example.com',
+            'password_hash': password_hash,
+            'first_name': 'Jane',
+            'last_name': 'Doe',
+            'full_name': 'Jane Doe',
+            'role': 'teacher',
+            'is_verified': True,
+            'school_name': 'Riverside High School',
+            'subject_areas': '["English", "Literature"]'
+        }
+    ]
     
-    db.session.add(teacher1)
-    db.session.add(teacher2)
-    db.session.commit()
+    user_ids = db.session.scalars(
+        sa.insert(User).returning(User.id, sort_by_parameter_order=True),
+        user_rows
+    ).all()
+    teacher1_id = user_ids[0]
     
     # Create subscriptions
-    Subscription.create_free_subscription(teacher1.id)
-    Subscription.create_free_subscription(teacher2.id)
+    db.session.execute(sa.insert(Subscription), [
+        {
+            'user_id': user_id,
+            'plan_name': 'free',
+            'status': 'active',
+            'amount': 0,
+            'currency': 'usd',
+            'interval': 'month'
+        }
+        for user_id in user_ids
+    ])
     
     # Create sample quiz
-    quiz = Quiz(
-        title='Introduction to Photosynthesis',
-        description='A quiz covering the basics of photosynthesis in plants',
-        source_text='Photosynthesis is the process by which plants convert light energy into chemical energy...',
-        difficulty_level='medium',
-        total_questions=5,
-        user_id=teacher1.id,
-        status='published'
+    quiz_id = db.session.scalar(
+        sa.insert(Quiz).returning(Quiz.id),
+        {
+            'title': 'Introduction to Photosynthesis',
+            'description': 'A quiz covering the basics of photosynthesis in plants',
+            'source_text': 'Photosynthesis is the process by which plants convert light energy into chemical energy...',
+            'difficulty_level': 'medium',
+            'question_types': ['multiple_choice', 'true_false'],
+            'total_questions': 5,
+            'question_count': 2,  # Bulk inserts skip the Question count events
+            'user_id': teacher1_id,
+            'status': 'published'
+        }
     )
-    quiz.set_question_types_list(['multiple_choice', 'true_false'])
-    
-    db.session.add(quiz)
-    db.session.commit()
     
     # Create sample questions
-    questions = [
-        Question(
-            question_text='What is the primary purpose of photosynthesis?',
-            question_type='multiple_choice',
-            correct_answer='To convert light energy into chemical energy',
-            explanation='Photosynthesis converts light energy from the sun into chemical energy stored in glucose.',
-            topic='Photosynthesis Basics',
-            difficulty_level='easy',
-            quiz_id=quiz.id,
-            order_index=1
-        ),
-        Question(
-            question_text='Photosynthesis occurs in the chloroplasts of plant cells.',
-            question_type='true_false',
-            correct_answer='true',
-            explanation='Chloroplasts contain chlorophyll and are the site of photosynthesis.',
-            topic='Plant Cell Structure',
-            difficulty_level='medium',
-            quiz_id=quiz.id,
-            order_index=2
-        )
-    ]
-    
-    # Set options for multiple choice question
-    questions[0].set_options_list([
-        'To convert light energy into chemical energy',
-        'To break down glucose for energy',
-        'To produce oxygen as waste',
-        'To absorb carbon dioxide'
+    db.session.execute(sa.insert(Question), [
+        {
+            'question_text': 'What is the primary purpose of photosynthesis?',
+            'question_type': 'multiple_choice',
+            'options': [
+                'To convert light energy into chemical energy',
+                'To break down glucose for energy',
+                'To produce oxygen as waste',
+                'To absorb carbon dioxide'
+            ],
+            'correct_answer': 'To convert light energy into chemical energy',
+            'explanation': 'Photosynthesis converts light energy from the sun into chemical energy stored in glucose.',
+            'topic': 'Photosynthesis Basics',
+            'difficulty_level': 'easy',
+            'quiz_id': quiz_id,
+            'order_index': 1
+        },
+        {
+            'question_text': 'Photosynthesis occurs in the chloroplasts of plant cells.',
+            'question_type': 'true_false',
+            'options': None,
+            'correct_answer': 'true',
+            'explanation': 'Chloroplasts contain chlorophyll and are the site of photosynthesis.',
+            'topic': 'Plant Cell Structure',
+            'difficulty_level': 'medium',
+            'quiz_id': quiz_id,
+            'order_index': 2
+        }
     ])
     
-    for question in questions:
-        db.session.add(question)
-    
     db.session.commit()
     
     click.echo('Sample data created successfully.')
 
 
+@app.cli.command()
+@with_appcontext
+def backfill_question_counts():
+    """Recompute every quiz's stored question count"""
+    count_query = (
+        sa.select(sa.func.count(Question.id))
+        .where(Question.quiz_id == Quiz.id)
+        .scalar_subquery()
+    )
+    result = db.session.execute(sa.update(Quiz).values(question_count=count_query))
+    db.session.commit()
+    click.echo(f'Question counts updated for {result.rowcount} quizzes.')
+
+
 @app.cli.command()
 @with_appcontext
 def reset_db():
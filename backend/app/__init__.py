@@ -2,6 +2,11 @@
 Flask Application Factory
 """
 import os
+import atexit
+import importlib
+import queue
+import sqlite3
+from logging.handlers import QueueHandler, QueueListener
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
@@ -11,8 +16,11 @@ from flask_mail import Mail
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from celery import Celery
+from celery.signals import worker_process_init
 import redis
 from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 # Load environment variables
 load_dotenv()
@@ -33,6 +41,23 @@ redis_client = redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 # Celery instance
 celery = Celery(__name__)
 
+# Flask app bound to Celery tasks in this process, set by configure_celery
+_celery_flask_app = None
+
+# Background log listeners started by configure_logging, as (queue handler, listener)
+_log_listeners = []
+
+# Route blueprints as (module path, blueprint attribute, URL prefix)
+BLUEPRINTS = (
+    ('app.routes.auth', 'auth_bp', '/api/auth'),
+    ('app.routes.users', 'users_bp', '/api/users'),
+    ('app.routes.quizzes', 'quizzes_bp', '/api/quizzes'),
+    ('app.routes.questions', 'questions_bp', '/api/questions'),
+    ('app.routes.subscriptions', 'subscriptions_bp', '/api/subscriptions'),
+    ('app.routes.files', 'files_bp', '/api/files'),
+    ('app.routes.ai', 'ai_bp', '/api/ai'),
+)
+
 
 def create_app(config_name='development'):
     """Application factory pattern"""
@@ -41,6 +66,13 @@ def create_app(config_name='development'):
     # Configuration
     app.config.from_object(f'app.config.{config_name.title()}Config')
     
+    # Logging
+    configure_logging(app)
+    
+    # JSON encoding
+    from app.utils.json_provider import OrjsonProvider
+    app.json = OrjsonProvider(app)
+    
     # Initialize extensions
     db.init_app(app)
     migrate.init_app(app, db)
@@ -48,28 +80,23 @@ def create_app(config_name='development'):
     mail.init_app(app)
     limiter.init_app(app)
     
+    # Password hashing cost
+    from app.models.user import configure_password_hasher
+    configure_password_hasher(app.config)
+    
+    # Document extraction
+    from app.ai.document_processor import configure_pdf_extraction
+    configure_pdf_extraction(app.config)
+    
     # CORS configuration
     CORS(app, origins=app.config.get('CORS_ORIGINS', ['http://localhost:3000']))
     
     # Configure Celery
     configure_celery(app, celery)
     
-    # Register blueprints
-    from app.routes.auth import auth_bp
-    from app.routes.users import users_bp
-    from app.routes.quizzes import quizzes_bp
-    from app.routes.questions import questions_bp
-    from app.routes.subscriptions import subscriptions_bp
-    from app.routes.files import files_bp
-    from app.routes.ai import ai_bp
-    
-    app.register_blueprint(auth_bp, url_prefix='/api/auth')
-    app.register_blueprint(users_bp, url_prefix='/api/users')
-    app.register_blueprint(quizzes_bp, url_prefix='/api/quizzes')
-    app.register_blueprint(questions_bp, url_prefix='/api/questions')
-    app.register_blueprint(subscriptions_bp, url_prefix='/api/subscriptions')
-    app.register_blueprint(files_bp, url_prefix='/api/files')
-    app.register_blueprint(ai_bp, url_prefix='/api/ai')
+    # Register blueprints (skipped for apps that never serve HTTP)
+    if not app.config.get('SKIP_BLUEPRINTS'):
+        register_blueprints(app)
     
     # Error handlers
     from app.utils.error_handlers import register_error_handlers
@@ -85,16 +112,83 @@ def create_app(config_name='development'):
     return app
 
 
+class DeferredQueueHandler(QueueHandler):
+    """Queue log records as they are, leaving message and traceback formatting to the listener"""
+    
+    def prepare(self, record):
+        # Records stay in this process, so they needn't be made picklable here
+        return record
+
+
+def configure_logging(app):
+    """Format and write app log records on a background thread instead of the request thread"""
+    # Apps share the logger of this package, so later create_app calls find it set up
+    if any(isinstance(handler, DeferredQueueHandler) for handler in app.logger.handlers):
+        return
+    
+    handlers = list(app.logger.handlers)  # Flask's default stream handler unless configured
+    for handler in handlers:
+        app.logger.removeHandler(handler)
+    
+    queue_handler = DeferredQueueHandler(queue.SimpleQueue())
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    app.logger.addHandler(queue_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    _log_listeners.append((queue_handler, listener))
+
+
+def _restart_log_listeners():
+    """Give a forked worker its own queues and listener threads (threads don't survive fork)"""
+    for queue_handler, listener in _log_listeners:
+        queue_handler.queue = listener.queue = queue.SimpleQueue()
+        listener._thread = None  # The parent's thread object; start() refuses to replace it on 3.12+
+        listener.start()
+
+
+os.register_at_fork(after_in_child=_restart_log_listeners)
+
+
+def register_blueprints(app):
+    """Import and register the route blueprints"""
+    for module_path, blueprint_name, url_prefix in BLUEPRINTS:
+        module = importlib.import_module(module_path)
+        app.register_blueprint(getattr(module, blueprint_name), url_prefix=url_prefix)
+
+
 def configure_celery(app, celery):
     """Configure Celery with Flask app context"""
+    global _celery_flask_app
+    _celery_flask_app = app
+    
     celery.conf.update(
         broker_url=app.config.get('CELERY_BROKER_URL'),
         result_backend=app.config.get('CELERY_RESULT_BACKEND'),
+        include=['app.tasks'],
         task_serializer='json',
         accept_content=['json'],
         result_serializer='json',
         timezone='UTC',
         enable_utc=True,
+        # Long document/AI tasks: hand out one task at a time so short tasks
+        # aren't queued behind them on a busy worker
+        worker_prefetch_multiplier=1,
+        task_acks_late=True,
+        task_reject_on_worker_lost=True,
+        # External payment API calls get their own queue and worker
+        task_routes={
+            'app.tasks.sync_subscription_cancellation': {'queue': 'stripe'},
+        },
+        beat_schedule={
+            'flush-download-counts': {
+                'task': 'app.tasks.flush_download_counts',
+                'schedule': 60.0,
+            },
+            'flush-view-counts': {
+                'task': 'app.tasks.flush_view_counts',
+                'schedule': 60.0,
+            },
+        },
     )
     
     class ContextTask(celery.Task):
@@ -106,14 +200,32 @@ def configure_celery(app, celery):
     celery.Task = ContextTask
 
 
+@worker_process_init.connect
+def init_celery_worker(**kwargs):
+    """Drop pooled connections a Celery worker process inherited from its parent"""
+    if _celery_flask_app is None:
+        return
+    
+    with _celery_flask_app.app_context():
+        db.engine.dispose()
+
+
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """Enforce foreign keys on SQLite so ON DELETE cascades behave as on PostgreSQL"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
 def configure_jwt(app):
     """Configure JWT settings"""
     @jwt.token_in_blocklist_loader
     def check_if_token_revoked(jwt_header, jwt_payload):
         """Check if JWT token is revoked"""
         jti = jwt_payload['jti']
-        token_in_redis = redis_client.get(f"revoked_token:{jti}")
-        return token_in_redis is not None
+        return redis_client.exists(f"revoked_token:{jti}") > 0
     
     @jwt.expired_token_loader
     def expired_token_callback(jwt_header, jwt_payload):
@@ -125,6 +237,11 @@ def configure_jwt(app):
         """Handle invalid tokens"""
         return {'message': 'Invalid token'}, 401
     
+    @jwt.revoked_token_loader
+    def revoked_token_callback(jwt_header, jwt_payload):
+        """Handle revoked tokens"""
+        return {'message': 'Token has been revoked'}, 401
+    
     @jwt.unauthorized_loader
     def missing_token_callback(error):
         """Handle missing tokens"""
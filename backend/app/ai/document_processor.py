@@ -4,31 +4,117 @@ Document Processing Service
 import os
 import re
 import hashlib
-from typing import Optional, Dict, Any
-import magic
-import fitz  # PyMuPDF
-import pdfplumber
-from docx import Document
-import bleach
+import mmap
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Dict, Any, List
+
+# Heavy extraction libraries (PyMuPDF, pdfplumber, python-docx, libmagic,
+# bleach) are imported inside the methods that use them so that importing
+# this module stays cheap for CLI commands and workers that never touch them.
+_bleach = None
+
+# Bytes read from the start of an upload for MIME type detection
+MIME_SNIFF_BYTES = 64 * 1024
+
+# With PDF_PARALLEL_EXTRACTION on, PDFs with at least this many pages are
+# extracted by a process pool. MuPDF is not thread-safe, so each worker process
+# opens its own document.
+PARALLEL_PDF_MIN_PAGES = 50
+PARALLEL_PDF_MAX_WORKERS = 4
+
+# Off by default: extraction runs in Celery workers, which already parallelize
+# across documents, and forking a pool from a threaded or daemonic process is fragile
+_parallel_pdf_extraction = False
+
+
+def configure_pdf_extraction(config):
+    """Enable or disable process-pool extraction of large PDFs from the app config"""
+    global _parallel_pdf_extraction
+    _parallel_pdf_extraction = config['PDF_PARALLEL_EXTRACTION']
+
+
+def _extract_pdf_page_range(file_path: str, start: int, stop: int) -> List[str]:
+    """Extract text from pages [start, stop) of a PDF with PyMuPDF"""
+    import fitz  # PyMuPDF
+    
+    with fitz.open(file_path) as doc:
+        return [doc[page_num].get_text() for page_num in range(start, stop)]
+
+
+def _extract_pdf_pages_parallel(file_path: str, page_count: int) -> List[str]:
+    """Extract text from all pages of a PDF using a pool of worker processes"""
+    workers = min(PARALLEL_PDF_MAX_WORKERS, os.cpu_count() or 1)
+    chunk_size = -(-page_count // workers)  # Ceiling division
+    ranges = [(start, min(start + chunk_size, page_count))
+              for start in range(0, page_count, chunk_size)]
+    
+    with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+        futures = [executor.submit(_extract_pdf_page_range, file_path, start, stop)
+                   for start, stop in ranges]
+        return [page_text for future in futures for page_text in future.result()]
 
 
 class DocumentProcessor:
     """Service for processing and extracting text from various document formats"""
     
+    ALLOWED_EXTENSIONS = frozenset({'txt', 'pdf', 'docx', 'doc', 'md', 'rtf'})
+    ALLOWED_MIME_TYPES = frozenset({
+        'text/plain',
+        'application/pdf',
+        'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        'application/msword',
+        'text/markdown',
+        'application/rtf'
+    })
+    
+    # Extraction method for each supported file extension
+    _EXTRACTORS = {
+        'txt': '_extract_from_txt',
+        'pdf': '_extract_from_pdf',
+        'docx': '_extract_from_docx',
+        'doc': '_extract_from_docx',
+        'md': '_extract_from_markdown',
+        'rtf': '_extract_from_rtf',
+    }
+    
+    # Markdown formatting, stripped in a single pass
+    _MARKDOWN_RE = re.compile(
+        r'(?P<code_block>(?s:```.*?```))'  # Code blocks
+        r'|(?P<header>#{1,6}\s+)'  # Headers
+        r'|\*\*(?P<bold>.*?)\*\*'  # Bold
+        r'|\*(?P<italic>.*?)\*'  # Italic
+        r'|`(?P<inline_code>.*?)`'  # Inline code
+        r'|\[(?P<link>[^\]]+)\]\([^\)]+\)'  # Links
+    )
+    _MARKDOWN_DROPPED = frozenset({'code_block', 'header'})
+    
+    # Whitespace and punctuation runs, normalized in a single pass
+    _NORMALIZE_RE = re.compile(r'(?P<whitespace>\s+)|(?P<dots>[.]{3,})|(?P<dashes>[-]{3,})')
+    _NORMALIZE_REPLACEMENTS = {'whitespace': ' ', 'dots': '...', 'dashes': '---'}
+    
+    # Start of an HTML tag, comment or doctype
+    _HTML_TAG_RE = re.compile(r'<[a-zA-Z/!]')
+    
+    # Control characters (except tab and newline) mapped to None for str.translate
+    _CONTROL_CHARS_TABLE = dict.fromkeys(
+        [code for code in range(32) if chr(code) not in '\n\t'] + [127]
+    )
+    
+    # RTF control words and group braces, used when striprtf is unavailable
+    _RTF_CONTROL_RE = re.compile(r'\\[a-z]+\d*\s?|[{}]|\\\w+')
+    
     def __init__(self):
         self.max_file_size = 16 * 1024 * 1024  # 16MB
-        self.allowed_extensions = {'txt', 'pdf', 'docx', 'doc', 'md', 'rtf'}
-        self.allowed_mime_types = {
-            'text/plain',
-            'application/pdf',
-            'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            'application/msword',
-            'text/markdown',
-            'application/rtf'
-        }
+        
+        # libmagic handle, loaded on first use and shared across calls
+        self._magic = None
+        self._magic_lock = threading.Lock()
     
-    def validate_file(self, file_path: str, original_filename: str) -> Dict[str, Any]:
-        """Validate uploaded file"""
+    def validate_file(self, file_path: str, original_filename: str,
+                      content_hash: Optional[str] = None,
+                      file_size: Optional[int] = None) -> Dict[str, Any]:
+        """Validate uploaded file, reusing a hash and size already taken while saving it"""
         result = {
             'is_valid': False,
             'error': None,
@@ -36,13 +122,15 @@ class DocumentProcessor:
         }
         
         try:
-            # Check if file exists
-            if not os.path.exists(file_path):
-                result['error'] = 'File not found'
-                return result
+            # Check if file exists (one stat serves both checks)
+            if file_size is None:
+                try:
+                    file_size = os.stat(file_path).st_size
+                except FileNotFoundError:
+                    result['error'] = 'File not found'
+                    return result
             
             # Check file size
-            file_size = os.path.getsize(file_path)
             if file_size > self.max_file_size:
                 result['error'] = f'File too large. Maximum size is {self.max_file_size // (1024*1024)}MB'
                 return result
@@ -57,30 +145,33 @@ class DocumentProcessor:
                 return result
             
             extension = original_filename.rsplit('.', 1)[1].lower()
-            if extension not in self.allowed_extensions:
-                result['error'] = f'File type not allowed. Allowed types: {", ".join(self.allowed_extensions)}'
+            if extension not in self.ALLOWED_EXTENSIONS:
+                result['error'] = f'File type not allowed. Allowed types: {", ".join(self.ALLOWED_EXTENSIONS)}'
                 return result
             
-            # Check MIME type
-            try:
-                mime_type = magic.from_file(file_path, mime=True)
-                if mime_type not in self.allowed_mime_types:
-                    result['error'] = f'Invalid file type detected: {mime_type}'
-                    return result
-            except Exception as e:
-                print(f"MIME type detection failed: {e}")
-                # Continue without MIME type check if magic fails
-                mime_type = None
-            
-            # Calculate file hash for deduplication
-            file_hash = self._calculate_file_hash(file_path)
+            with open(file_path, 'rb') as f:
+                # Check MIME type from the head of the already-open file
+                try:
+                    mime_type = self._detect_mime_type(f.read(MIME_SNIFF_BYTES))
+                    if mime_type not in self.ALLOWED_MIME_TYPES:
+                        result['error'] = f'Invalid file type detected: {mime_type}'
+                        return result
+                except Exception as e:
+                    print(f"MIME type detection failed: {e}")
+                    # Continue without MIME type check if magic fails
+                    mime_type = None
+                
+                # Calculate file hash for deduplication
+                if content_hash is None:
+                    f.seek(0)
+                    content_hash = self._hash_file_object(f)
             
             result['is_valid'] = True
             result['file_info'] = {
                 'size': file_size,
                 'extension': extension,
                 'mime_type': mime_type,
-                'hash': file_hash
+                'hash': content_hash
             }
             
         except Exception as e:
@@ -88,6 +179,16 @@ class DocumentProcessor:
         
         return result
     
+    def _detect_mime_type(self, head: bytes) -> str:
+        """Detect MIME type of file content with a cached libmagic handle"""
+        # libmagic handles are not thread-safe
+        with self._magic_lock:
+            if self._magic is None:
+                import magic
+                self._magic = magic.Magic(mime=True)
+            
+            return self._magic.from_buffer(head)
+    
     def extract_text(self, file_path: str, file_extension: str) -> Dict[str, Any]:
         """Extract text from document"""
         result = {
@@ -98,16 +199,9 @@ class DocumentProcessor:
         }
         
         try:
-            if file_extension.lower() == 'txt':
-                result = self._extract_from_txt(file_path)
-            elif file_extension.lower() == 'pdf':
-                result = self._extract_from_pdf(file_path)
-            elif file_extension.lower() in ['docx', 'doc']:
-                result = self._extract_from_docx(file_path)
-            elif file_extension.lower() == 'md':
-                result = self._extract_from_markdown(file_path)
-            elif file_extension.lower() == 'rtf':
-                result = self._extract_from_rtf(file_path)
+            extractor = self._EXTRACTORS.get(file_extension.lower())
+            if extractor:
+                result = getattr(self, extractor)(file_path)
             else:
                 result['error'] = f'Unsupported file type: {file_extension}'
             
@@ -122,11 +216,21 @@ class DocumentProcessor:
         
         return result
     
+    @staticmethod
+    def _read_text(file_path: str) -> str:
+        """Read a UTF-8 text file, decoding straight from a memory map"""
+        with open(file_path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return ''
+            
+            # Decoding the mapping avoids holding a full bytes copy of the file
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return str(mapped, 'utf-8', 'ignore')
+    
     def _extract_from_txt(self, file_path: str) -> Dict[str, Any]:
         """Extract text from TXT file"""
         try:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
-                text = file.read()
+            text = self._read_text(file_path)
             
             return {
                 'success': True,
@@ -146,60 +250,97 @@ class DocumentProcessor:
     
     def _extract_from_pdf(self, file_path: str) -> Dict[str, Any]:
         """Extract text from PDF file"""
-        text = ''
         metadata = {'format': 'pdf'}
         
+        # Try with PyMuPDF first (much faster than pdfplumber)
         try:
-            # Try with pdfplumber first (better for tables and layout)
-            with pdfplumber.open(file_path) as pdf:
-                metadata['page_count'] = len(pdf.pages)
-                
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + '\n\n'
-            
-            # If pdfplumber didn't extract much text, try PyMuPDF
-            if len(text.strip()) < 100:
-                doc = fitz.open(file_path)
-                text = ''
-                
-                for page_num in range(doc.page_count):
-                    page = doc[page_num]
-                    text += page.get_text() + '\n\n'
-                
-                doc.close()
-            
-            return {
-                'success': True,
-                'text': text,
-                'metadata': metadata
-            }
+            text = self._extract_pdf_text_pymupdf(file_path, metadata)
+        except Exception:
+            text = ''  # Left to pdfplumber below
+        
+        # Fall back to pdfplumber (better for tables and layout) if PyMuPDF failed,
+        # didn't extract much text or the text looks like a table
+        if len(text.strip()) < 100 or self._looks_tabular(text):
+            try:
+                plumber_text = self._extract_pdf_text_pdfplumber(file_path, metadata)
+            except Exception as e:
+                if not text.strip():
+                    return {
+                        'success': False,
+                        'text': '',
+                        'metadata': metadata,
+                        'error': str(e)
+                    }
+            else:
+                if plumber_text.strip():
+                    text = plumber_text
+        
+        return {
+            'success': True,
+            'text': text,
+            'metadata': metadata
+        }
+    
+    @staticmethod
+    def _extract_pdf_text_pymupdf(file_path: str, metadata: Dict[str, Any]) -> str:
+        """Extract the text of a PDF with PyMuPDF, recording its page count"""
+        import fitz  # PyMuPDF
+        
+        with fitz.open(file_path) as doc:
+            page_count = doc.page_count
+            metadata['page_count'] = page_count
             
-        except Exception as e:
-            return {
-                'success': False,
-                'text': '',
-                'metadata': metadata,
-                'error': str(e)
-            }
+            parallel = (
+                _parallel_pdf_extraction
+                and page_count >= PARALLEL_PDF_MIN_PAGES
+                and (os.cpu_count() or 1) >= 2
+            )
+            if not parallel:
+                page_texts = [page.get_text() for page in doc]
+        
+        # Split large PDFs into page ranges extracted in separate processes
+        if parallel:
+            try:
+                page_texts = _extract_pdf_pages_parallel(file_path, page_count)
+            except Exception:
+                # Broken pool, fork refused (e.g. in a daemonic Celery child), pickling...
+                page_texts = _extract_pdf_page_range(file_path, 0, page_count)
+        
+        return '\n\n'.join(page_texts)
+    
+    @staticmethod
+    def _extract_pdf_text_pdfplumber(file_path: str, metadata: Dict[str, Any]) -> str:
+        """Extract the text of a PDF with pdfplumber, recording its page count"""
+        import pdfplumber  # Only needed when PyMuPDF's text isn't good enough
+        
+        with pdfplumber.open(file_path) as pdf:
+            metadata['page_count'] = len(pdf.pages)
+            page_texts = [page.extract_text() for page in pdf.pages]
+        
+        return '\n\n'.join(page_text for page_text in page_texts if page_text)
+    
+    @staticmethod
+    def _looks_tabular(text: str) -> bool:
+        """Check whether extracted text has many space-aligned (table-like) lines"""
+        lines = text[:20000].splitlines()[:200]
+        return sum('  ' in line for line in lines) > 20
     
     def _extract_from_docx(self, file_path: str) -> Dict[str, Any]:
         """Extract text from DOCX file"""
+        from docx import Document
+        
         try:
             doc = Document(file_path)
-            text = ''
             
             # Extract text from paragraphs
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + '\n'
+            parts = [paragraph.text for paragraph in doc.paragraphs]
             
-            # Extract text from tables
+            # Extract text from tables, one line per row
             for table in doc.tables:
                 for row in table.rows:
-                    for cell in row.cells:
-                        text += cell.text + ' '
-                    text += '\n'
+                    parts.append(' '.join(cell.text for cell in row.cells))
+            
+            text = '\n'.join(parts)
             
             metadata = {
                 'format': 'docx',
@@ -224,16 +365,10 @@ class DocumentProcessor:
     def _extract_from_markdown(self, file_path: str) -> Dict[str, Any]:
         """Extract text from Markdown file"""
         try:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
-                text = file.read()
+            text = self._read_text(file_path)
             
             # Remove markdown formatting
-            text = re.sub(r'#{1,6}\s+', '', text)  # Headers
-            text = re.sub(r'\*\*(.*?)\*\*', r'\1', text)  # Bold
-            text = re.sub(r'\*(.*?)\*', r'\1', text)  # Italic
-            text = re.sub(r'`(.*?)`', r'\1', text)  # Inline code
-            text = re.sub(r'```.*?```', '', text, flags=re.DOTALL)  # Code blocks
-            text = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', text)  # Links
+            text = self._MARKDOWN_RE.sub(self._strip_markdown_match, text)
             
             return {
                 'success': True,
@@ -251,17 +386,27 @@ class DocumentProcessor:
                 'error': str(e)
             }
     
+    @classmethod
+    def _strip_markdown_match(cls, match: re.Match) -> str:
+        """Replace a markdown construct with its plain-text content"""
+        if match.lastgroup in cls._MARKDOWN_DROPPED:
+            return ''
+        
+        # Formatting can nest (e.g. a link inside bold text)
+        return cls._MARKDOWN_RE.sub(cls._strip_markdown_match, match.group(match.lastgroup))
+    
     def _extract_from_rtf(self, file_path: str) -> Dict[str, Any]:
         """Extract text from RTF file"""
         try:
-            # Basic RTF text extraction (simplified)
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
-                content = file.read()
+            content = self._read_text(file_path)
             
-            # Remove RTF control words and formatting
-            text = re.sub(r'\\[a-z]+\d*\s?', '', content)
-            text = re.sub(r'[{}]', '', text)
-            text = re.sub(r'\\\w+', '', text)
+            try:
+                from striprtf.striprtf import rtf_to_text
+            except ImportError:
+                # Basic RTF text extraction (simplified): remove control words and groups
+                text = self._RTF_CONTROL_RE.sub('', content)
+            else:
+                text = rtf_to_text(content, errors='ignore')
             
             return {
                 'success': True,
@@ -281,32 +426,44 @@ class DocumentProcessor:
     
     def _clean_text(self, text: str) -> str:
         """Clean and sanitize extracted text"""
+        global _bleach
+        
         if not text:
             return ''
         
-        # Remove HTML tags if any
-        text = bleach.clean(text, tags=[], strip=True)
-        
-        # Normalize whitespace
-        text = re.sub(r'\s+', ' ', text)
-        text = re.sub(r'\n\s*\n', '\n\n', text)
+        # Remove HTML tags if any (a plain '<' check skips the HTML parser
+        # for the vast majority of documents, which contain no markup)
+        if '<' in text and self._HTML_TAG_RE.search(text):
+            if _bleach is None:
+                import bleach
+                _bleach = bleach
+            
+            text = _bleach.clean(text, tags=[], strip=True)
         
-        # Remove excessive punctuation
-        text = re.sub(r'[.]{3,}', '...', text)
-        text = re.sub(r'[-]{3,}', '---', text)
+        # Normalize whitespace and remove excessive punctuation
+        text = self._NORMALIZE_RE.sub(self._normalize_match, text)
         
         # Remove control characters
-        text = ''.join(char for char in text if ord(char) >= 32 or char in '\n\t')
+        text = text.translate(self._CONTROL_CHARS_TABLE)
         
         return text.strip()
     
-    def _calculate_file_hash(self, file_path: str) -> str:
-        """Calculate SHA-256 hash of file"""
-        hash_sha256 = hashlib.sha256()
+    @classmethod
+    def _normalize_match(cls, match: re.Match) -> str:
+        """Replace a whitespace or punctuation run with its normalized form"""
+        return cls._NORMALIZE_REPLACEMENTS[match.lastgroup]
+    
+    @staticmethod
+    def _hash_file_object(f) -> str:
+        """Calculate SHA-256 hash of an open binary file from its current position"""
+        # Stored in File.content_hash and used as the extraction cache key,
+        # so the algorithm must stay stable across uploads
+        if hasattr(hashlib, 'file_digest'):  # Python 3.11+
+            return hashlib.file_digest(f, 'sha256').hexdigest()
         
-        with open(file_path, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_sha256.update(chunk)
+        hash_sha256 = hashlib.sha256()
+        while chunk := f.read(1024 * 1024):
+            hash_sha256.update(chunk)
         
         return hash_sha256.hexdigest()
     
@@ -315,14 +472,22 @@ class DocumentProcessor:
         if len(text) <= max_length:
             return text
         
-        # Simple extractive summarization
-        sentences = text.split('.')
-        summary = ''
+        # Simple extractive summarization: take whole sentences until the
+        # length budget runs out, scanning only as far as needed
+        sentences = []
+        summary_length = 0
+        start = 0
         
-        for sentence in sentences:
-            if len(summary + sentence) <= max_length:
-                summary += sentence + '.'
-            else:
+        while start <= len(text):
+            end = text.find('.', start)
+            if end == -1:
+                end = len(text)
+            
+            if summary_length + (end - start) > max_length:
                 break
+            
+            sentences.append(text[start:end])
+            summary_length += end - start + 1
+            start = end + 1
         
-        return summary.strip()
+        return ''.join(sentence + '.' for sentence in sentences).strip()
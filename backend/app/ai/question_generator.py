@@ -6,35 +6,50 @@ import re
 import json
 import time
 import random
+import asyncio
+import heapq
+import threading
+from collections import defaultdict, namedtuple
+from functools import cached_property
 from typing import List, Dict, Any, Optional
 from dataclasses import dataclass
 
-import spacy
-import openai
-from transformers import pipeline, AutoTokenizer, AutoModelForSeq2SeqLM
-import nltk
-from nltk.tokenize import sent_tokenize, word_tokenize
-from nltk.corpus import stopwords
-from nltk.tag import pos_tag
+# spaCy, the OpenAI client and torch/transformers are imported where they are
+# first used, so importing this module (every app start, test run and CLI
+# command) doesn't pay for them
 
-# Download required NLTK data
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
+# Maximum number of OpenAI requests in flight for one batch of questions
+OPENAI_MAX_CONCURRENT_REQUESTS = 8
 
-try:
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('stopwords')
+# Precision of local transformer models: fp32, fp16 (half precision, GPU only)
+# or int8 (dynamic quantization, CPU only); a setting that doesn't apply to the
+# device a model runs on leaves it at fp32
+MODEL_PRECISION = os.getenv('AI_PRECISION', 'int8').lower()
 
-try:
-    nltk.data.find('taggers/averaged_perceptron_tagger')
-except LookupError:
-    nltk.download('averaged_perceptron_tagger')
+# Fuse attention (BetterTransformer) and compile the model forward pass with
+# torch.compile; opt-in, since compilation adds start-up time and is slowest on
+# the first shapes it sees
+COMPILE_MODELS = os.getenv('AI_COMPILE_MODELS', 'false').lower() == 'true'
 
+# Highlighted input used to trigger compilation before the first real request
+_WARM_UP_INPUT = "generate question: <hl> Paris <hl> is the capital of France."
 
-@dataclass
+# Named entity labels and parts of speech worth asking about
+_ENTITY_LABELS = frozenset({'PERSON', 'ORG', 'GPE', 'EVENT', 'WORK_OF_ART', 'LAW'})
+_KEYWORD_POS = frozenset({'NOUN', 'VERB', 'ADJ'})
+
+# Sentence boundaries, used only when the spaCy model is unavailable
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+
+# Verbs negated when turning a true statement into a false one, in order of
+# preference; every occurrence of the first one found is negated
+_NEGATIONS = ((' is ', ' is not '), (' are ', ' are not '), (' can ', ' cannot '))
+
+# Result of a single NLP pass over a text
+TextAnalysis = namedtuple('TextAnalysis', ['sentences', 'concepts', 'sent_by_concept'])
+
+
+@dataclass(slots=True)
 class GeneratedQuestion:
     """Data class for generated questions"""
     question_text: str
@@ -53,115 +68,245 @@ class GeneratedQuestion:
 class QuestionGenerator:
     """AI-powered question generation service"""
     
-    def __init__(self):
+    def __init__(self, seed: Optional[int] = None):
         self.openai_client = None
-        self.nlp = None
-        self.question_generation_pipeline = None
-        self.summarization_pipeline = None
-        self.stop_words = set(stopwords.words('english'))
+        
+        # Private generator so workers don't contend on the global one and tests can seed it
+        self._rng = random.Random(seed)
         
         self._initialize_models()
     
     def _initialize_models(self):
-        """Initialize AI models"""
+        """Initialize AI models (local models load lazily on first use)"""
         try:
             # Initialize OpenAI client if API key is available
             openai_api_key = os.getenv('OPENAI_API_KEY')
             if openai_api_key:
-                openai.api_key = openai_api_key
-                self.openai_client = openai
-            
-            # Initialize spaCy model
-            try:
-                self.nlp = spacy.load("en_core_web_sm")
-            except OSError:
-                print("spaCy English model not found. Please install with: python -m spacy download en_core_web_sm")
-            
-            # Initialize Hugging Face pipelines
+                import openai
+                self.openai_client = openai.OpenAI(api_key=openai_api_key)
+        
+        except Exception as e:
+            print(f"Error initializing AI models: {e}")
+    
+    def warm_up(self):
+        """Load the local models now rather than on the first request that needs them"""
+        self.nlp
+        question_pipeline = self.question_generation_pipeline
+        
+        if COMPILE_MODELS and question_pipeline:
+            # The first calls through a compiled model capture its graphs
             try:
-                # Question generation model
-                self.question_generation_pipeline = pipeline(
-                    "text2text-generation",
-                    model="valhalla/t5-small-qg-hl",
-                    tokenizer="valhalla/t5-small-qg-hl"
-                )
-                
-                # Summarization model for long texts
-                self.summarization_pipeline = pipeline(
-                    "summarization",
-                    model="facebook/bart-large-cnn"
-                )
+                question_pipeline(_WARM_UP_INPUT, max_length=64)
             except Exception as e:
-                print(f"Error initializing Hugging Face models: {e}")
+                print(f"Model warm-up failed: {e}")
+    
+    @cached_property
+    def nlp(self):
+        """spaCy model, loaded on first use (lemmas are never used)"""
+        import spacy
         
+        try:
+            return spacy.load("en_core_web_sm", disable=["lemmatizer"])
+        except OSError:
+            print("spaCy English model not found. Please install with: python -m spacy download en_core_web_sm")
+            return None
+    
+    @cached_property
+    def question_generation_pipeline(self):
+        """Question generation model, loaded on first use"""
+        return self._load_pipeline(
+            "text2text-generation",
+            model="valhalla/t5-small-qg-hl",
+            tokenizer="valhalla/t5-small-qg-hl"
+        )
+    
+    @cached_property
+    def summarization_pipeline(self):
+        """Summarization model for long texts, loaded on first use"""
+        return self._load_pipeline("summarization", model="facebook/bart-large-cnn")
+    
+    def _load_pipeline(self, task: str, **kwargs):
+        """Load a Hugging Face pipeline, or None if it is unavailable"""
+        try:
+            import torch
+            from transformers import pipeline
+            
+            device = 0 if torch.cuda.is_available() else -1
+            if MODEL_PRECISION == 'fp16' and device >= 0:
+                kwargs['torch_dtype'] = torch.float16
+            
+            model_pipeline = pipeline(task, device=device, **kwargs)
+            return self._compile_pipeline(self._quantize_pipeline(model_pipeline))
         except Exception as e:
-            print(f"Error initializing AI models: {e}")
+            print(f"Error initializing Hugging Face models: {e}")
+            return None
+    
+    @staticmethod
+    def _quantize_pipeline(model_pipeline):
+        """Swap a CPU pipeline's linear layers for dynamically quantized INT8 ones"""
+        if MODEL_PRECISION != 'int8' or model_pipeline.device.type != 'cpu':
+            return model_pipeline
+        
+        try:
+            import torch
+            model_pipeline.model = torch.ao.quantization.quantize_dynamic(
+                model_pipeline.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        except Exception as e:
+            print(f"INT8 quantization failed, using FP32 model: {e}")
+        
+        return model_pipeline
     
-    def extract_key_concepts(self, text: str) -> List[Dict[str, Any]]:
-        """Extract key concepts from text using NLP"""
-        concepts = []
+    @staticmethod
+    def _compile_pipeline(model_pipeline):
+        """Swap in fused attention kernels and compile the pipeline model's forward pass"""
+        if not COMPILE_MODELS:
+            return model_pipeline
         
+        try:
+            from optimum.bettertransformer import BetterTransformer
+            model_pipeline.model = BetterTransformer.transform(model_pipeline.model)
+        except Exception as e:
+            print(f"BetterTransformer unavailable, keeping stock attention: {e}")
+        
+        try:
+            import torch
+            # generate() calls forward on the module itself, so compile forward
+            # rather than wrapping the module
+            model = model_pipeline.model
+            model.forward = torch.compile(model.forward, mode='reduce-overhead', dynamic=True)
+        except Exception as e:
+            print(f"torch.compile failed, using eager model: {e}")
+        
+        return model_pipeline
+    
+    def extract_key_concepts(self, text: str, top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Extract key concepts from text using NLP, optionally only the top_k most important"""
+        return self._rank_concepts(self._analyze(text).concepts, top_k)
+    
+    def _analyze(self, text: str) -> TextAnalysis:
+        """Run the NLP pipeline over the text, collecting its sentences and concepts (not cached)"""
         if not self.nlp:
-            return concepts
+            sentences = [s for s in _SENTENCE_END_RE.split(text.strip()) if s]
+            return TextAnalysis(sentences, [], {})
         
-        doc = self.nlp(text)
+        return self._analyze_doc(self.nlp(text))
+    
+    def _analyze_doc(self, doc) -> TextAnalysis:
+        """Collect sentences and unique concepts from a processed spaCy Doc"""
+        sentences = []
+        sentence_of_token = [None] * len(doc)
+        mentions = defaultdict(set)  # Lowercased text -> indexes of sentences it occurs in
+        keyword_tokens = []
+        
+        for sent in doc.sents:
+            sent_text = sent.text.strip()
+            number = len(sentences) if sent_text else None
+            if sent_text:
+                sentences.append(sent_text)
+            
+            for token in sent:
+                sentence_of_token[token.i] = number
+                if number is not None:
+                    mentions[token.lower_].add(number)
+                if token.pos_ in _KEYWORD_POS and not token.is_stop and len(token.text) > 3:
+                    keyword_tokens.append(token)
+        
+        def add_span_mention(span):
+            """Record the sentence a multi-word span occurs in"""
+            number = sentence_of_token[span.start]
+            if number is not None:
+                mentions[span.text.lower()].add(number)
+        
+        unique_concepts = {}
+        
+        def add_concept(text, importance, **details):
+            """Keep the most important concept seen for each lowercased text"""
+            key = text.lower()
+            current = unique_concepts.get(key)
+            if current is None or importance > current['importance']:
+                unique_concepts[key] = {'text': text, **details, 'importance': importance}
         
         # Extract named entities
         for ent in doc.ents:
-            if ent.label_ in ['PERSON', 'ORG', 'GPE', 'EVENT', 'WORK_OF_ART', 'LAW']:
-                concepts.append({
-                    'text': ent.text,
-                    'type': 'entity',
-                    'label': ent.label_,
-                    'importance': 0.8
-                })
+            if ent.label_ in _ENTITY_LABELS:
+                add_concept(ent.text, 0.8, type='entity', label=ent.label_)
+                add_span_mention(ent)
         
         # Extract noun phrases
         for chunk in doc.noun_chunks:
-            if len(chunk.text.split()) > 1 and chunk.text.lower() not in self.stop_words:
-                concepts.append({
-                    'text': chunk.text,
-                    'type': 'noun_phrase',
-                    'importance': 0.6
-                })
+            if len(chunk.text.split()) > 1 and not all(token.is_stop for token in chunk):
+                add_concept(chunk.text, 0.6, type='noun_phrase')
+                add_span_mention(chunk)
         
         # Extract important keywords
-        tokens = word_tokenize(text.lower())
-        pos_tags = pos_tag(tokens)
-        
-        for word, pos in pos_tags:
-            if (pos.startswith('NN') or pos.startswith('VB') or pos.startswith('JJ')) and \
-               word not in self.stop_words and len(word) > 3:
-                concepts.append({
-                    'text': word,
-                    'type': 'keyword',
-                    'pos': pos,
-                    'importance': 0.4
-                })
-        
-        # Remove duplicates and sort by importance
-        unique_concepts = {}
-        for concept in concepts:
-            key = concept['text'].lower()
-            if key not in unique_concepts or concept['importance'] > unique_concepts[key]['importance']:
-                unique_concepts[key] = concept
+        for token in keyword_tokens:
+            add_concept(token.lower_, 0.4, type='keyword', pos=token.pos_)
         
-        return sorted(unique_concepts.values(), key=lambda x: x['importance'], reverse=True)
+        concepts = list(unique_concepts.values())
+        
+        # Index the sentences mentioning each concept, from where its spans and tokens occur
+        sent_by_concept = {key: sorted(mentions.get(key, ())) for key in unique_concepts}
+        
+        return TextAnalysis(sentences, concepts, sent_by_concept)
+    
+    @staticmethod
+    def _rank_concepts(concepts: List[Dict[str, Any]], top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Order concepts by importance, selecting only the top_k when given"""
+        if top_k:
+            return heapq.nlargest(top_k, concepts, key=lambda x: x['importance'])
+        return sorted(concepts, key=lambda x: x['importance'], reverse=True)
+    
+    @staticmethod
+    def _sentences_with(analysis: TextAnalysis, concept: str) -> List[str]:
+        """Get the sentences of an analyzed text that mention the concept"""
+        key = concept.lower()
+        if key in analysis.sent_by_concept:
+            return [analysis.sentences[i] for i in analysis.sent_by_concept[key]]
+        return [s for s in analysis.sentences if key in s.lower()]
     
-    def generate_multiple_choice_question(self, text: str, concept: str) -> Optional[GeneratedQuestion]:
-        """Generate a multiple choice question"""
+    async def _generate_mc_with_openai_async(self, client, semaphore, text: str,
+                                             concept: str) -> Optional[GeneratedQuestion]:
+        """Generate multiple choice question using the async OpenAI client"""
         try:
-            if self.openai_client:
-                return self._generate_mc_with_openai(text, concept)
-            else:
-                return self._generate_mc_with_transformers(text, concept)
+            async with semaphore:
+                response = await client.chat.completions.create(
+                    **self._mc_completion_params(text, concept)
+                )
+            
+            return self._parse_mc_response(response, text, concept)
+        
         except Exception as e:
-            print(f"Error generating multiple choice question: {e}")
+            print(f"OpenAI API error: {e}")
             return None
     
-    def _generate_mc_with_openai(self, text: str, concept: str) -> Optional[GeneratedQuestion]:
-        """Generate multiple choice question using OpenAI"""
-        prompt = f"""
+    async def _generate_mc_batch_with_openai(self, text: str,
+                                             concepts: List[str]) -> List[Optional[GeneratedQuestion]]:
+        """Generate multiple choice questions for several concepts concurrently"""
+        import openai
+        
+        semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENT_REQUESTS)
+        
+        async with openai.AsyncOpenAI(api_key=self.openai_client.api_key) as client:
+            return await asyncio.gather(*[
+                self._generate_mc_with_openai_async(client, semaphore, text, concept)
+                for concept in concepts
+            ])
+    
+    def _mc_completion_params(self, text: str, concept: str) -> Dict[str, Any]:
+        """Chat completion parameters for a multiple choice question"""
+        return {
+            'model': "gpt-3.5-turbo",
+            'messages': [{"role": "user", "content": self._build_mc_prompt(text, concept)}],
+            'max_tokens': 500,
+            'temperature': 0.7,
+            # JSON mode guarantees the reply parses, so no request is wasted on prose
+            'response_format': {"type": "json_object"}
+        }
+    
+    def _build_mc_prompt(self, text: str, concept: str) -> str:
+        """Build the OpenAI prompt for a multiple choice question"""
+        return f"""
         Based on the following text, create a multiple choice question about "{concept}".
         
         Text: {text[:1000]}
@@ -177,96 +322,126 @@ class QuestionGenerator:
             "topic": "Main topic"
         }}
         """
+    
+    def _parse_mc_response(self, response, text: str, concept: str) -> GeneratedQuestion:
+        """Build a multiple choice question from an OpenAI chat completion"""
+        result = json.loads(response.choices[0].message.content)
         
-        try:
-            response = self.openai_client.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=500,
-                temperature=0.7
-            )
-            
-            result = json.loads(response.choices[0].message.content)
-            
-            return GeneratedQuestion(
-                question_text=result['question'],
-                question_type='multiple_choice',
-                options=result['options'],
-                correct_answer=result['correct_answer'],
-                explanation=result['explanation'],
-                difficulty_level=result.get('difficulty', 'medium'),
-                topic=result.get('topic'),
-                keywords=[concept],
-                confidence_score=0.8,
-                source_sentence=text[:200]
-            )
+        # The difficulty column only accepts these levels
+        difficulty = str(result.get('difficulty', 'medium')).lower()
+        if difficulty not in ('easy', 'medium', 'hard'):
+            difficulty = 'medium'
         
-        except Exception as e:
-            print(f"OpenAI API error: {e}")
-            return None
+        return GeneratedQuestion(
+            question_text=result['question'],
+            question_type='multiple_choice',
+            options=result['options'],
+            correct_answer=result['correct_answer'],
+            explanation=result['explanation'],
+            difficulty_level=difficulty,
+            topic=result.get('topic'),
+            keywords=[concept],
+            confidence_score=0.8,
+            source_sentence=text[:200]
+        )
     
-    def _generate_mc_with_transformers(self, text: str, concept: str) -> Optional[GeneratedQuestion]:
-        """Generate multiple choice question using Transformers"""
-        try:
-            # Create a simple question about the concept
-            sentences = sent_tokenize(text)
-            relevant_sentence = None
-            
-            # Find sentence containing the concept
-            for sentence in sentences:
-                if concept.lower() in sentence.lower():
-                    relevant_sentence = sentence
-                    break
-            
-            if not relevant_sentence:
-                relevant_sentence = sentences[0] if sentences else text[:200]
-            
-            # Generate question using template
-            question_templates = [
-                f"What is {concept}?",
-                f"Which of the following best describes {concept}?",
-                f"What is the main characteristic of {concept}?",
-                f"How is {concept} defined?"
-            ]
-            
-            question = random.choice(question_templates)
-            
-            # Generate plausible distractors
-            correct_answer = self._extract_answer_from_text(relevant_sentence, concept)
-            distractors = self._generate_distractors(concept, correct_answer)
-            
-            options = [correct_answer] + distractors
-            random.shuffle(options)
+    def _generate_mc_batch_with_transformers(self, text: str, concepts: List[str],
+                                             analysis: TextAnalysis) -> List[Optional[GeneratedQuestion]]:
+        """Generate multiple choice questions for several concepts with one batched T5 run"""
+        questions = []
+        t5_inputs = {}
+        
+        for i, concept in enumerate(concepts):
+            try:
+                question, t5_input = self._build_mc_question(text, concept, analysis)
+            except Exception as e:
+                print(f"Error with transformers generation: {e}")
+                question, t5_input = None, None
             
-            return GeneratedQuestion(
-                question_text=question,
-                question_type='multiple_choice',
-                options=options,
-                correct_answer=correct_answer,
-                explanation=f"Based on the text: {relevant_sentence[:100]}...",
-                difficulty_level='medium',
-                topic=concept,
-                keywords=[concept],
-                confidence_score=0.6,
-                source_sentence=relevant_sentence
-            )
+            questions.append(question)
+            if t5_input:
+                t5_inputs[i] = t5_input
         
-        except Exception as e:
-            print(f"Error with transformers generation: {e}")
-            return None
+        # Replace the template wording with T5-generated questions where possible
+        if t5_inputs and self.question_generation_pipeline:
+            try:
+                # Length-sorted so each padded batch wastes few pad tokens
+                order = sorted(t5_inputs, key=lambda i: len(t5_inputs[i]))
+                outputs = self.question_generation_pipeline(
+                    [t5_inputs[i] for i in order], max_length=64, batch_size=8
+                )
+                for i, output in zip(order, outputs):
+                    generated = output['generated_text'].strip()
+                    if generated:
+                        questions[i].question_text = generated
+            except Exception as e:
+                print(f"Error with transformers generation: {e}")
+        
+        return questions
+    
+    def _build_mc_question(self, text: str, concept: str, analysis: TextAnalysis):
+        """Build a template multiple choice question and the T5 input that could reword it"""
+        # Find sentence containing the concept
+        relevant_sentences = self._sentences_with(analysis, concept)
+        
+        if relevant_sentences:
+            relevant_sentence = relevant_sentences[0]
+        else:
+            sentences = analysis.sentences
+            relevant_sentence = sentences[0] if sentences else text[:200]
+        
+        # Generate question using template
+        question_templates = [
+            f"What is {concept}?",
+            f"Which of the following best describes {concept}?",
+            f"What is the main characteristic of {concept}?",
+            f"How is {concept} defined?"
+        ]
+        
+        question = self._rng.choice(question_templates)
+        
+        # Generate plausible distractors
+        correct_answer = self._extract_answer_from_text([relevant_sentence], concept)
+        distractors = self._generate_distractors(concept, correct_answer)
+        
+        options = [correct_answer] + distractors
+        self._rng.shuffle(options)
+        
+        # Highlight the answer in its sentence so T5 can ask about it
+        t5_input = None
+        answer_position = relevant_sentence.find(correct_answer)
+        if answer_position != -1:
+            answer_end = answer_position + len(correct_answer)
+            t5_input = (f"generate question: {relevant_sentence[:answer_position]}<hl> {correct_answer} <hl>"
+                        f"{relevant_sentence[answer_end:]} </s>")
+        
+        generated_question = GeneratedQuestion(
+            question_text=question,
+            question_type='multiple_choice',
+            options=options,
+            correct_answer=correct_answer,
+            explanation=f"Based on the text: {relevant_sentence[:100]}...",
+            difficulty_level='medium',
+            topic=concept,
+            keywords=[concept],
+            confidence_score=0.6,
+            source_sentence=relevant_sentence
+        )
+        
+        return generated_question, t5_input
     
-    def generate_true_false_question(self, text: str, concept: str) -> Optional[GeneratedQuestion]:
-        """Generate a true/false question"""
-        sentences = sent_tokenize(text)
-        relevant_sentences = [s for s in sentences if concept.lower() in s.lower()]
+    def generate_true_false_question(self, text: str, concept: str,
+                                     analysis: Optional[TextAnalysis] = None) -> Optional[GeneratedQuestion]:
+        """Generate a true/false question (analysis: the text's _analyze result, if already run)"""
+        relevant_sentences = self._sentences_with(analysis or self._analyze(text), concept)
         
         if not relevant_sentences:
             return None
         
-        sentence = random.choice(relevant_sentences)
+        sentence = self._rng.choice(relevant_sentences)
         
         # Create true/false variations
-        if random.choice([True, False]):
+        if self._rng.random() < 0.5:
             # True statement
             question = sentence.replace('.', '').strip()
             correct_answer = 'true'
@@ -289,8 +464,9 @@ class QuestionGenerator:
             source_sentence=sentence
         )
     
-    def generate_short_answer_question(self, text: str, concept: str) -> Optional[GeneratedQuestion]:
-        """Generate a short answer question"""
+    def generate_short_answer_question(self, text: str, concept: str,
+                                       analysis: Optional[TextAnalysis] = None) -> Optional[GeneratedQuestion]:
+        """Generate a short answer question (analysis: the text's _analyze result, if already run)"""
         question_starters = [
             f"Define {concept}.",
             f"Explain what {concept} means.",
@@ -299,8 +475,9 @@ class QuestionGenerator:
             f"How does {concept} work?"
         ]
         
-        question = random.choice(question_starters)
-        answer = self._extract_answer_from_text(text, concept)
+        question = self._rng.choice(question_starters)
+        relevant_sentences = self._sentences_with(analysis or self._analyze(text), concept)
+        answer = self._extract_answer_from_text(relevant_sentences, concept)
         
         return GeneratedQuestion(
             question_text=question,
@@ -314,21 +491,23 @@ class QuestionGenerator:
             source_sentence=text[:200]
         )
     
-    def _extract_answer_from_text(self, text: str, concept: str) -> str:
-        """Extract answer from text for a given concept"""
-        sentences = sent_tokenize(text)
+    def _extract_answer_from_text(self, sentences: List[str], concept: str) -> str:
+        """Extract answer from the given sentences for a concept"""
+        key = concept.lower()
         for sentence in sentences:
-            if concept.lower() in sentence.lower():
-                # Extract the part that defines or describes the concept
-                words = sentence.split()
-                concept_index = -1
-                for i, word in enumerate(words):
-                    if concept.lower() in word.lower():
-                        concept_index = i
-                        break
-                
-                if concept_index != -1 and concept_index < len(words) - 3:
-                    return ' '.join(words[concept_index:concept_index + 10])
+            position = sentence.lower().find(key)
+            if position == -1:
+                continue
+            
+            # Extract the part that defines or describes the concept,
+            # starting from the word the concept first appears in
+            words = sentence.split()
+            concept_index = len(sentence[:position].split())
+            if position and not sentence[position - 1].isspace():
+                concept_index -= 1
+            
+            if concept_index < len(words) - 3:
+                return ' '.join(words[concept_index:concept_index + 10])
         
         return f"Information about {concept} from the provided text"
     
@@ -344,14 +523,10 @@ class QuestionGenerator:
     def _create_false_statement(self, sentence: str, concept: str) -> str:
         """Create a false statement by modifying a true one"""
         # Simple negation or modification
-        if " is " in sentence:
-            return sentence.replace(" is ", " is not ")
-        elif " are " in sentence:
-            return sentence.replace(" are ", " are not ")
-        elif " can " in sentence:
-            return sentence.replace(" can ", " cannot ")
-        else:
-            return f"It is incorrect that {sentence.lower()}"
+        for verb, negated in _NEGATIONS:
+            if verb in sentence:
+                return sentence.replace(verb, negated)
+        return f"It is incorrect that {sentence.lower()}"
     
     def generate_questions(self, text: str, num_questions: int = 10, 
                          question_types: List[str] = None, 
@@ -360,34 +535,67 @@ class QuestionGenerator:
         if not question_types:
             question_types = ['multiple_choice', 'true_false', 'short_answer']
         
-        # Extract key concepts
-        concepts = self.extract_key_concepts(text)
+        # One NLP pass, shared by every question generated below
+        analysis = self._analyze(text)
+        
+        # Extract key concepts (only the first num_questions are ever used)
+        concepts = self._rank_concepts(analysis.concepts, top_k=num_questions)
         
         if not concepts:
             return []
         
         questions = []
-        concept_index = 0
         
-        for i in range(num_questions):
-            if concept_index >= len(concepts):
-                concept_index = 0
-            
-            concept = concepts[concept_index]['text']
-            question_type = random.choice(question_types)
-            
+        # Draw every question type up front and cycle through the concepts
+        chosen_types = self._rng.choices(question_types, k=num_questions)
+        chosen_concepts = [concepts[i % len(concepts)]['text'] for i in range(num_questions)]
+        
+        # Generate all multiple choice questions in one batch (concurrent
+        # OpenAI requests, or a single batched T5 run)
+        prefetched = {}
+        if 'multiple_choice' in chosen_types:
+            mc_indexes = [i for i, t in enumerate(chosen_types) if t == 'multiple_choice']
+            mc_concepts = [chosen_concepts[i] for i in mc_indexes]
+            if self.openai_client:
+                mc_questions = asyncio.run(self._generate_mc_batch_with_openai(text, mc_concepts))
+            else:
+                mc_questions = self._generate_mc_batch_with_transformers(text, mc_concepts, analysis)
+            prefetched = dict(zip(mc_indexes, mc_questions))
+        
+        for i, (question_type, concept) in enumerate(zip(chosen_types, chosen_concepts)):
             question = None
             if question_type == 'multiple_choice':
-                question = self.generate_multiple_choice_question(text, concept)
+                question = prefetched[i]
             elif question_type == 'true_false':
-                question = self.generate_true_false_question(text, concept)
+                question = self.generate_true_false_question(text, concept, analysis)
             elif question_type == 'short_answer':
-                question = self.generate_short_answer_question(text, concept)
+                question = self.generate_short_answer_question(text, concept, analysis)
             
             if question:
                 question.difficulty_level = difficulty_level
                 questions.append(question)
-            
-            concept_index += 1
         
         return questions
+
+
+_question_generator = None
+_question_generator_lock = threading.Lock()
+
+
+def _reset_question_generator_lock():
+    """Give a forked child a fresh lock in case the parent forked while holding it"""
+    global _question_generator_lock
+    _question_generator_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_question_generator_lock)
+
+
+def get_question_generator() -> QuestionGenerator:
+    """Get the process-wide QuestionGenerator, creating it on first use"""
+    global _question_generator
+    if _question_generator is None:
+        with _question_generator_lock:
+            if _question_generator is None:
+                _question_generator = QuestionGenerator()
+    return _question_generator
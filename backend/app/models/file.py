@@ -2,14 +2,44 @@
 File Model
 """
 from datetime import datetime, timezone
-from app import db
+from app import db, redis_client
 import os
+import redis
+
+# Characters of extracted text split at a time when counting words
+WORD_COUNT_CHUNK_SIZE = 1024 * 1024
+
+# Upload extensions accepted, in display order, plus a set for membership checks
+ALLOWED_EXTENSIONS = ('txt', 'pdf', 'docx', 'doc', 'md', 'rtf')
+_ALLOWED_EXTENSION_SET = frozenset(ALLOWED_EXTENSIONS)
+
+# Redis hash of file id -> downloads not yet written to the database
+DOWNLOAD_COUNTS_KEY = 'counters:file_downloads'
+
+
+def count_words(text):
+    """Count whitespace-separated words without building a list of every word"""
+    count = 0
+    in_word = False
+    for start in range(0, len(text), WORD_COUNT_CHUNK_SIZE):
+        chunk = text[start:start + WORD_COUNT_CHUNK_SIZE]
+        count += len(chunk.split())
+        
+        # A word spanning the chunk boundary was counted twice
+        if in_word and not chunk[0].isspace():
+            count -= 1
+        in_word = not chunk[-1].isspace()
+    return count
 
 
 class File(db.Model):
     """File model for tracking uploaded documents"""
     
     __tablename__ = 'files'
+    __table_args__ = (
+        db.Index('ix_files_content_hash', 'content_hash'),
+        db.Index('ix_files_user_created', 'user_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     
@@ -46,11 +76,11 @@ class File(db.Model):
     last_accessed = db.Column(db.DateTime(timezone=True))
     
     # Timestamps
-    created_at = db.Column(db.DateTime(timezone=True), default=datetime.now(timezone.utc), nullable=False)
-    updated_at = db.Column(db.DateTime(timezone=True), default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc), nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), nullable=False)
+    updated_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), onupdate=db.func.now(), nullable=False)
     
     # Foreign keys
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     
     def __repr__(self):
         return f'<File {self.original_filename}>'
@@ -92,7 +122,7 @@ class File(db.Model):
         return False
     
     def mark_as_processed(self, success=True, error=None):
-        """Mark file as processed"""
+        """Mark file as processed (caller must commit)"""
         self.is_processed = success
         self.processing_completed_at = datetime.now(timezone.utc)
         
@@ -101,22 +131,35 @@ class File(db.Model):
         else:
             self.extraction_status = 'failed'
             self.extraction_error = error
-        
-        db.session.commit()
     
     def increment_download_count(self):
-        """Increment download count"""
-        self.download_count += 1
-        self.last_accessed = datetime.now(timezone.utc)
-        db.session.commit()
+        """Increment download count (caller must commit)"""
+        # Buffered in Redis and written back in batches by the flush_download_counts task
+        try:
+            redis_client.hincrby(DOWNLOAD_COUNTS_KEY, self.id, 1)
+        except redis.RedisError:
+            File.add_download_counts({self.id: 1})
+    
+    @staticmethod
+    def add_download_counts(counts):
+        """Add a {file id: downloads} mapping to the stored counts in one batch (caller must commit)"""
+        files = File.__table__
+        db.session.execute(
+            db.update(files)
+            .where(files.c.id == db.bindparam('file_id'))
+            .values(
+                download_count=db.func.coalesce(files.c.download_count, 0) + db.bindparam('delta'),
+                last_accessed=datetime.now(timezone.utc)
+            ),
+            # In id order, so concurrent batches lock rows in the same order
+            [{'file_id': file_id, 'delta': delta} for file_id, delta in sorted(counts.items())]
+        )
     
     def calculate_word_count(self):
-        """Calculate word count from extracted text"""
+        """Calculate word count from extracted text (caller must commit)"""
         if self.extracted_text:
-            words = self.extracted_text.split()
-            self.word_count = len(words)
+            self.word_count = count_words(self.extracted_text)
             self.character_count = len(self.extracted_text)
-            db.session.commit()
     
     def is_text_file(self):
         """Check if file is a text file"""
@@ -168,7 +211,7 @@ class File(db.Model):
     @staticmethod
     def get_allowed_extensions():
         """Get list of allowed file extensions"""
-        return ['txt', 'pdf', 'docx', 'doc', 'md', 'rtf']
+        return list(ALLOWED_EXTENSIONS)
     
     @staticmethod
     def is_allowed_file(filename):
@@ -177,7 +220,7 @@ class File(db.Model):
             return False
         
         extension = filename.rsplit('.', 1)[1].lower()
-        return extension in File.get_allowed_extensions()
+        return extension in _ALLOWED_EXTENSION_SET
     
     @staticmethod
     def generate_unique_filename(original_filename):
@@ -1,31 +1,86 @@
 """
 Question Model
 """
-from datetime import datetime, timezone
+from sqlalchemy import event
+from sqlalchemy.orm import Bundle, reconstructor
 from app import db
-import json
+from app.models.quiz import Quiz, evict_shared_quiz
+from app.models.types import DifficultyLevel, JSONList, QuestionType
+
+# Answers accepted as "true" for true/false questions
+_TRUE_VALUES = frozenset(('true', 't', 'yes', 'y', '1'))
+
+_DIFFICULTY_MAP = {
+    'easy': 1,
+    'medium': 2,
+    'hard': 3
+}
+
+_QUESTION_TYPES = (
+    {
+        'value': 'multiple_choice',
+        'label': 'Multiple Choice',
+        'description': 'Questions with 4 answer options'
+    },
+    {
+        'value': 'true_false',
+        'label': 'True/False',
+        'description': 'Questions with true or false answers'
+    },
+    {
+        'value': 'short_answer',
+        'label': 'Short Answer',
+        'description': 'Questions requiring brief written responses'
+    },
+    {
+        'value': 'essay',
+        'label': 'Essay',
+        'description': 'Questions requiring detailed written responses'
+    }
+)
+
+_DIFFICULTY_LEVELS = (
+    {
+        'value': 'easy',
+        'label': 'Easy',
+        'description': 'Basic recall and understanding'
+    },
+    {
+        'value': 'medium',
+        'label': 'Medium',
+        'description': 'Application and analysis'
+    },
+    {
+        'value': 'hard',
+        'label': 'Hard',
+        'description': 'Synthesis and evaluation'
+    }
+)
 
 
 class Question(db.Model):
     """Question model for storing individual quiz questions"""
     
     __tablename__ = 'questions'
+    __table_args__ = (
+        db.Index('ix_questions_quiz_order', 'quiz_id', 'order_index'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     
     # Question content
     question_text = db.Column(db.Text, nullable=False)
-    question_type = db.Column(db.String(50), nullable=False)  # multiple_choice, true_false, short_answer, essay
-    difficulty_level = db.Column(db.String(20), default='medium')  # easy, medium, hard
+    question_type = db.Column(QuestionType, nullable=False)  # multiple_choice, true_false, short_answer, essay
+    difficulty_level = db.Column(DifficultyLevel, default='medium')  # easy, medium, hard
     
     # Answer options (for multiple choice)
-    options = db.Column(db.Text)  # JSON array of options
+    options = db.Column(JSONList)  # JSON array of options
     correct_answer = db.Column(db.Text)  # Correct answer or answer key
     explanation = db.Column(db.Text)  # Explanation for the correct answer
     
     # Question metadata
     topic = db.Column(db.String(200))  # Main topic/subject of the question
-    keywords = db.Column(db.Text)  # JSON array of keywords
+    keywords = db.Column(JSONList)  # JSON array of keywords
     bloom_taxonomy_level = db.Column(db.String(50))  # remember, understand, apply, analyze, evaluate, create
     
     # AI generation metadata
@@ -37,73 +92,76 @@ class Question(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     
     # Timestamps
-    created_at = db.Column(db.DateTime(timezone=True), default=datetime.now(timezone.utc), nullable=False)
-    updated_at = db.Column(db.DateTime(timezone=True), default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc), nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), nullable=False)
+    updated_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), onupdate=db.func.now(), nullable=False)
     
     # Foreign keys
-    quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), nullable=False)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id', ondelete='CASCADE'), nullable=False)
     
     def __repr__(self):
         return f'<Question {self.id}: {self.question_text[:50]}...>'
     
     def get_options_list(self):
         """Get options as a list"""
-        if self.options:
-            try:
-                return json.loads(self.options)
-            except json.JSONDecodeError:
-                return []
-        return []
+        return self.options or []
     
     def set_options_list(self, options_list):
         """Set options from a list"""
-        self.options = json.dumps(options_list)
+        self.options = options_list
     
     def get_keywords_list(self):
         """Get keywords as a list"""
-        if self.keywords:
-            try:
-                return json.loads(self.keywords)
-            except json.JSONDecodeError:
-                return []
-        return []
+        return self.keywords or []
     
     def set_keywords_list(self, keywords_list):
         """Set keywords from a list"""
-        self.keywords = json.dumps(keywords_list)
+        self.keywords = keywords_list
     
     def validate_answer(self, user_answer):
         """Validate a user's answer against the correct answer"""
+        return self._grade_answer(self._answer_key(), user_answer)
+    
+    @reconstructor
+    def _reset_answer_key(self):
+        """Drop the cached answer key when the row is loaded or its answer changes"""
+        self._cached_answer_key = None
+    
+    def _answer_key(self):
+        """Normalize the correct answer into (question_type, answer, key terms), cached per instance"""
+        answer_key = getattr(self, '_cached_answer_key', None)
+        if answer_key is None:
+            correct = str(self.correct_answer).strip().lower()
+            correct_words = frozenset(correct.split()) if self.question_type == 'short_answer' else None
+            answer_key = self._cached_answer_key = (self.question_type, correct, correct_words)
+        return answer_key
+    
+    @staticmethod
+    def _grade_answer(answer_key, user_answer):
+        """Grade a user's answer against a prepared answer key"""
         if not user_answer:
             return False
         
+        question_type, correct, correct_words = answer_key
         user_answer = str(user_answer).strip().lower()
-        correct = str(self.correct_answer).strip().lower()
         
-        if self.question_type == 'multiple_choice':
+        if question_type == 'multiple_choice':
             # For multiple choice, compare exact match
             return user_answer == correct
         
-        elif self.question_type == 'true_false':
+        elif question_type == 'true_false':
             # For true/false, accept various formats
-            true_values = ['true', 't', 'yes', 'y', '1']
-            false_values = ['false', 'f', 'no', 'n', '0']
-            
-            user_bool = user_answer in true_values
-            correct_bool = correct in true_values
+            user_bool = user_answer in _TRUE_VALUES
+            correct_bool = correct in _TRUE_VALUES
             
             return user_bool == correct_bool
         
-        elif self.question_type == 'short_answer':
+        elif question_type == 'short_answer':
             # For short answer, check if key terms are present
-            correct_words = set(correct.split())
-            user_words = set(user_answer.split())
-            
-            # Calculate overlap percentage
             if not correct_words:
                 return False
             
-            overlap = len(correct_words.intersection(user_words))
+            # Calculate overlap percentage
+            overlap = len(correct_words.intersection(user_answer.split()))
             overlap_percentage = overlap / len(correct_words)
             
             # Consider correct if 70% of key terms are present
@@ -115,12 +173,7 @@ class Question(db.Model):
     
     def get_difficulty_score(self):
         """Get numeric difficulty score"""
-        difficulty_map = {
-            'easy': 1,
-            'medium': 2,
-            'hard': 3
-        }
-        return difficulty_map.get(self.difficulty_level, 2)
+        return _DIFFICULTY_MAP.get(self.difficulty_level, 2)
     
     def to_dict(self, include_answer=True):
         """Convert question to dictionary"""
@@ -154,46 +207,99 @@ class Question(db.Model):
     @staticmethod
     def get_question_types():
         """Get available question types"""
-        return [
-            {
-                'value': 'multiple_choice',
-                'label': 'Multiple Choice',
-                'description': 'Questions with 4 answer options'
-            },
-            {
-                'value': 'true_false',
-                'label': 'True/False',
-                'description': 'Questions with true or false answers'
-            },
-            {
-                'value': 'short_answer',
-                'label': 'Short Answer',
-                'description': 'Questions requiring brief written responses'
-            },
-            {
-                'value': 'essay',
-                'label': 'Essay',
-                'description': 'Questions requiring detailed written responses'
-            }
-        ]
+        return list(_QUESTION_TYPES)
     
     @staticmethod
     def get_difficulty_levels():
         """Get available difficulty levels"""
-        return [
-            {
-                'value': 'easy',
-                'label': 'Easy',
-                'description': 'Basic recall and understanding'
-            },
-            {
-                'value': 'medium',
-                'label': 'Medium',
-                'description': 'Application and analysis'
-            },
-            {
-                'value': 'hard',
-                'label': 'Hard',
-                'description': 'Synthesis and evaluation'
-            }
-        ]
+        return list(_DIFFICULTY_LEVELS)
+
+
+# Question columns for read-only listings, loaded as plain rows instead of ORM objects
+QUESTION_ROW = Bundle(
+    'question',
+    Question.id, Question.question_text, Question.question_type,
+    Question.difficulty_level, Question.topic, Question.keywords,
+    Question.bloom_taxonomy_level, Question.confidence_score,
+    Question.order_index, Question.is_active, Question.created_at,
+    Question.quiz_id, Question.options, Question.correct_answer,
+    Question.explanation, Question.source_sentence
+)
+
+
+def question_row_to_dict(row, include_answer=True):
+    """Convert a QUESTION_ROW row to the same dictionary as Question.to_dict"""
+    data = {
+        'id': row.id,
+        'question_text': row.question_text,
+        'question_type': row.question_type,
+        'difficulty_level': row.difficulty_level,
+        'topic': row.topic,
+        'keywords': row.keywords or [],
+        'bloom_taxonomy_level': row.bloom_taxonomy_level,
+        'confidence_score': row.confidence_score,
+        'order_index': row.order_index,
+        'is_active': row.is_active,
+        'created_at': row.created_at.isoformat() if row.created_at else None,
+        'quiz_id': row.quiz_id
+    }
+    
+    # Include options for multiple choice questions
+    if row.question_type == 'multiple_choice':
+        data['options'] = row.options or []
+    
+    # Include answer information if requested
+    if include_answer:
+        data['correct_answer'] = row.correct_answer
+        data['explanation'] = row.explanation
+        data['source_sentence'] = row.source_sentence
+    
+    return data
+
+
+def _adjust_quiz_question_count(connection, quiz_id, delta):
+    """Shift a quiz's stored question count within the current flush"""
+    connection.execute(
+        db.update(Quiz)
+        .where(Quiz.id == quiz_id)
+        .values(question_count=Quiz.question_count + delta)
+    )
+
+
+def _evict_shared_quiz_of(connection, quiz_id):
+    """Drop the cached shared payload of a question's quiz, if the quiz is shared"""
+    share_token = connection.scalar(db.select(Quiz.share_token).where(Quiz.id == quiz_id))
+    evict_shared_quiz(share_token)
+
+
+@event.listens_for(Question, 'after_insert')
+def _question_inserted(mapper, connection, target):
+    """Count a new question against its quiz"""
+    _adjust_quiz_question_count(connection, target.quiz_id, 1)
+    _evict_shared_quiz_of(connection, target.quiz_id)
+
+
+@event.listens_for(Question, 'after_update')
+def _question_updated(mapper, connection, target):
+    """Keep shared views of the quiz from serving the old question"""
+    _evict_shared_quiz_of(connection, target.quiz_id)
+
+
+@event.listens_for(Question, 'after_delete')
+def _question_deleted(mapper, connection, target):
+    """Remove a deleted question from its quiz's count"""
+    _adjust_quiz_question_count(connection, target.quiz_id, -1)
+    _evict_shared_quiz_of(connection, target.quiz_id)
+
+
+@event.listens_for(Question.correct_answer, 'set')
+@event.listens_for(Question.question_type, 'set')
+def _answer_changed(target, value, oldvalue, initiator):
+    """Invalidate the cached answer key when the answer or question type is reassigned"""
+    target._reset_answer_key()
+
+
+@event.listens_for(Question, 'refresh')
+def _question_refreshed(target, context, attrs):
+    """Invalidate the cached answer key when expired attributes are reloaded"""
+    target._reset_answer_key()
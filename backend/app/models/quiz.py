@@ -1,15 +1,90 @@
 """
 Quiz Model
 """
+import secrets
 from datetime import datetime, timezone
-from app import db
-import json
+import redis
+from sqlalchemy import event
+from sqlalchemy.orm import defer
+from app import db, redis_client
+from app.models.types import DifficultyLevel, JSONDict, JSONList, QuizStatus, TokenString
+
+# Redis hash of quiz id -> views not yet written to the database
+VIEW_COUNTS_KEY = 'counters:quiz_views'
+
+# Serialized payloads of shared quizzes, served without touching the database
+SHARED_QUIZ_CACHE_TTL = 5 * 60  # 5 minutes
+
+
+def shared_quiz_cache_key(share_token):
+    """Redis key holding the cached payload of a shared quiz"""
+    return f"quiz:shared:{share_token}"
+
+
+def evict_shared_quiz(*share_tokens):
+    """Drop cached shared quiz payloads so the next view rebuilds them"""
+    keys = [shared_quiz_cache_key(token) for token in share_tokens if token]
+    if not keys:
+        return
+    try:
+        redis_client.delete(*keys)
+    except redis.RedisError:
+        pass  # Entries expire on their own
+
+
+def _utcnow():
+    """Current time in UTC, for Python-side column defaults"""
+    return datetime.now(timezone.utc)
+
+
+def _isoformat(value):
+    """Format an optional datetime for JSON"""
+    return value.isoformat() if value else None
+
+
+# Builders for each base key of Quiz.to_dict, so callers can request a subset
+_FIELD_BUILDERS = {
+    'id': lambda quiz: quiz.id,
+    'title': lambda quiz: quiz.title,
+    'description': lambda quiz: quiz.description,
+    'difficulty_level': lambda quiz: quiz.difficulty_level,
+    'question_types': lambda quiz: quiz.get_question_types_list(),
+    'total_questions': lambda quiz: quiz.total_questions,
+    'question_count': lambda quiz: quiz.question_count,
+    'status': lambda quiz: quiz.status,
+    'is_public': lambda quiz: quiz.is_public,
+    'share_token': lambda quiz: quiz.share_token,
+    'view_count': lambda quiz: quiz.view_count,
+    'download_count': lambda quiz: quiz.download_count,
+    'created_at': lambda quiz: _isoformat(quiz.created_at),
+    'updated_at': lambda quiz: _isoformat(quiz.updated_at),
+    'published_at': lambda quiz: _isoformat(quiz.published_at),
+    'user_id': lambda quiz: quiz.user_id,
+    'source_file_id': lambda quiz: quiz.source_file_id,
+    'ai_model_used': lambda quiz: quiz.ai_model_used,
+    'generation_time': lambda quiz: quiz.generation_time,
+    'generation_status': lambda quiz: quiz.generation_status
+}
 
 
 class Quiz(db.Model):
     """Quiz model for storing generated quizzes"""
     
     __tablename__ = 'quizzes'
+    __table_args__ = (
+        db.Index('ix_quizzes_user_status_created', 'user_id', 'status', 'created_at'),
+        db.Index('ix_quizzes_user_created', 'user_id', 'created_at', 'id'),  # Keyset listing order
+        db.Index(
+            'ix_quizzes_share_token', 'share_token', unique=True,
+            postgresql_where=db.text('share_token IS NOT NULL'),
+            sqlite_where=db.text('share_token IS NOT NULL')
+        ),
+        # Trigram index so title substring search (LIKE '%...%') avoids a scan on PostgreSQL
+        db.Index(
+            'ix_quizzes_title_trgm', 'title',
+            postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'}
+        ),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -17,72 +92,67 @@ class Quiz(db.Model):
     
     # Content source
     source_text = db.Column(db.Text)  # Original text content
-    source_file_id = db.Column(db.Integer, db.ForeignKey('files.id'))
+    source_file_id = db.Column(db.Integer, db.ForeignKey('files.id', ondelete='SET NULL'))
     
     # Quiz configuration
-    difficulty_level = db.Column(db.String(20), default='medium')  # easy, medium, hard
-    question_types = db.Column(db.Text)  # JSON array of question types
+    difficulty_level = db.Column(DifficultyLevel, default='medium')  # easy, medium, hard
+    question_types = db.Column(JSONList)  # JSON array of question types
     total_questions = db.Column(db.Integer, default=10)
+    question_count = db.Column(db.Integer, nullable=False, default=0)  # Maintained by Question events
     
     # AI generation metadata
     ai_model_used = db.Column(db.String(100))
     generation_time = db.Column(db.Float)  # Time taken to generate in seconds
-    generation_parameters = db.Column(db.Text)  # JSON of parameters used
+    generation_parameters = db.Column(JSONDict)  # JSON of parameters used
+    generation_status = db.Column(db.String(20))  # pending, completed, failed (None if not AI-generated)
+    generation_error = db.Column(db.Text)
     
     # Status and sharing
-    status = db.Column(db.String(20), default='draft')  # draft, published, archived
+    status = db.Column(QuizStatus, default='draft')  # draft, published, archived
     is_public = db.Column(db.Boolean, default=False)
-    share_token = db.Column(db.String(100), unique=True)
+    share_token = db.Column(TokenString)  # Unique among shared quizzes, see __table_args__
     
     # Usage statistics
     view_count = db.Column(db.Integer, default=0)
     download_count = db.Column(db.Integer, default=0)
     
     # Timestamps
-    created_at = db.Column(db.DateTime(timezone=True), default=datetime.now(timezone.utc), nullable=False)
-    updated_at = db.Column(db.DateTime(timezone=True), default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc), nullable=False)
+    # created_at is the keyset cursor, so it is stamped in Python: on SQLite the
+    # server default stores second-precision text that doesn't compare correctly
+    # with the microsecond values cursors bind (the server default covers raw SQL)
+    created_at = db.Column(db.DateTime(timezone=True), default=_utcnow, server_default=db.func.now(), nullable=False)
+    updated_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), onupdate=db.func.now(), nullable=False)
     published_at = db.Column(db.DateTime(timezone=True))
     
     # Foreign keys
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     
     # Relationships
-    questions = db.relationship('Question', backref='quiz', lazy='dynamic', cascade='all, delete-orphan')
-    source_file = db.relationship('File', backref='quizzes')
+    # Child rows are removed (or unlinked) by the database's ON DELETE rules
+    questions = db.relationship('Question', backref='quiz', cascade='all, delete-orphan', passive_deletes=True)
+    source_file = db.relationship('File', backref=db.backref('quizzes', passive_deletes=True))
+    
+    # Field names accepted by to_dict(fields=...)
+    SERIALIZABLE_FIELDS = frozenset(_FIELD_BUILDERS)
     
     def __repr__(self):
         return f'<Quiz {self.title}>'
     
-    @property
-    def question_count(self):
-        """Get the actual number of questions in this quiz"""
-        return self.questions.count()
-    
     def get_question_types_list(self):
         """Get question types as a list"""
-        if self.question_types:
-            try:
-                return json.loads(self.question_types)
-            except json.JSONDecodeError:
-                return []
-        return []
+        return self.question_types or []
     
     def set_question_types_list(self, types_list):
         """Set question types from a list"""
-        self.question_types = json.dumps(types_list)
+        self.question_types = types_list
     
     def get_generation_parameters(self):
         """Get generation parameters as a dictionary"""
-        if self.generation_parameters:
-            try:
-                return json.loads(self.generation_parameters)
-            except json.JSONDecodeError:
-                return {}
-        return {}
+        return self.generation_parameters or {}
     
     def set_generation_parameters(self, params_dict):
         """Set generation parameters from a dictionary"""
-        self.generation_parameters = json.dumps(params_dict)
+        self.generation_parameters = params_dict
     
     def publish(self):
         """Publish the quiz"""
@@ -97,47 +167,55 @@ class Quiz(db.Model):
     
     def increment_view_count(self):
         """Increment view count"""
-        self.view_count += 1
-        db.session.commit()
+        Quiz.record_view(self.id)
+    
+    @staticmethod
+    def record_view(quiz_id):
+        """Count a view; buffered in Redis and written back in batches by the flush_view_counts task"""
+        try:
+            redis_client.hincrby(VIEW_COUNTS_KEY, quiz_id, 1)
+        except redis.RedisError:
+            Quiz.add_view_counts({quiz_id: 1})
+            db.session.commit()
+    
+    @staticmethod
+    def add_view_counts(counts):
+        """Add a {quiz id: views} mapping to the stored counts in one batch (caller must commit)"""
+        quizzes = Quiz.__table__
+        db.session.execute(
+            db.update(quizzes)
+            .where(quizzes.c.id == db.bindparam('quiz_id'))
+            .values(view_count=db.func.coalesce(quizzes.c.view_count, 0) + db.bindparam('delta')),
+            # In id order, so concurrent batches lock rows in the same order
+            [{'quiz_id': quiz_id, 'delta': delta} for quiz_id, delta in sorted(counts.items())]
+        )
     
     def increment_download_count(self):
         """Increment download count"""
-        self.download_count += 1
+        self._increment_counter(Quiz.download_count)
+    
+    def _increment_counter(self, column):
+        """Bump a usage counter in a single UPDATE so concurrent hits aren't lost"""
+        db.session.execute(
+            db.update(Quiz)
+            .where(Quiz.id == self.id)
+            .values({column: db.func.coalesce(column, 0) + 1})
+        )
         db.session.commit()
     
     def generate_share_token(self):
         """Generate a unique share token"""
-        import secrets
         self.share_token = secrets.token_urlsafe(32)
         db.session.commit()
         return self.share_token
     
-    def to_dict(self, include_questions=False, include_source=False):
-        """Convert quiz to dictionary"""
-        data = {
-            'id': self.id,
-            'title': self.title,
-            'description': self.description,
-            'difficulty_level': self.difficulty_level,
-            'question_types': self.get_question_types_list(),
-            'total_questions': self.total_questions,
-            'question_count': self.question_count,
-            'status': self.status,
-            'is_public': self.is_public,
-            'share_token': self.share_token,
-            'view_count': self.view_count,
-            'download_count': self.download_count,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'published_at': self.published_at.isoformat() if self.published_at else None,
-            'user_id': self.user_id,
-            'source_file_id': self.source_file_id,
-            'ai_model_used': self.ai_model_used,
-            'generation_time': self.generation_time
-        }
+    def to_dict(self, include_questions=False, include_source=False, fields=None):
+        """Convert quiz to dictionary, optionally limited to the given field names"""
+        keys = _FIELD_BUILDERS if fields is None else fields
+        data = {key: _FIELD_BUILDERS[key](self) for key in keys}
         
         if include_questions:
-            data['questions'] = [q.to_dict() for q in self.questions.all()]
+            data['questions'] = self._serialize_questions()
         
         if include_source:
             data['source_text'] = self.source_text
@@ -147,7 +225,52 @@ class Quiz(db.Model):
         
         return data
     
+    def _serialize_questions(self):
+        """Serialize questions from plain column rows, skipping ORM object loading"""
+        from app.models.question import Question, QUESTION_ROW, question_row_to_dict
+        
+        # scalars() yields the bundle of each row rather than a one-element Row
+        rows = db.session.scalars(
+            db.select(QUESTION_ROW)
+            .where(Question.quiz_id == self.id)
+            .execution_options(yield_per=200)
+        )
+        return [question_row_to_dict(row) for row in rows]
+    
+    @classmethod
+    def query_for_user(cls, user_id):
+        """Query a user's quizzes for listing, leaving out columns only detail views read"""
+        return cls.query.filter_by(user_id=user_id).options(
+            defer(cls.source_text),
+            defer(cls.generation_parameters)
+        )
+    
     @staticmethod
     def get_by_share_token(token):
         """Get quiz by share token"""
-        return Quiz.query.filter_by(share_token=token, is_public=True).first()
+        # Built once and cached by SQLAlchemy; later calls only rebind token
+        stmt = db.lambda_stmt(lambda: db.select(Quiz).where(
+            Quiz.share_token == token,
+            Quiz.is_public.is_(True)
+        ).limit(1))
+        return db.session.execute(stmt).scalars().first()
+
+
+# gin_trgm_ops comes from the pg_trgm extension, which must exist before the index
+event.listen(
+    Quiz.__table__, 'before_create',
+    db.DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
+
+
+@event.listens_for(Quiz, 'after_update')
+def _quiz_updated(mapper, connection, target):
+    """Evict the cached shared payload of a changed quiz, under its old and new tokens"""
+    history = db.inspect(target).attrs.share_token.history
+    evict_shared_quiz(target.share_token, *history.deleted)
+
+
+@event.listens_for(Quiz, 'after_delete')
+def _quiz_deleted(mapper, connection, target):
+    """Evict the cached shared payload of a deleted quiz"""
+    evict_shared_quiz(target.share_token)
@@ -2,14 +2,18 @@
 Subscription Model
 """
 from datetime import datetime, timezone
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, array
 from app import db
-import json
+from app.models.types import BillingInterval, JSONBDict, PlanName, SubscriptionStatus
 
 
 class Subscription(db.Model):
     """Subscription model for tracking user subscriptions and payments"""
     
     __tablename__ = 'subscriptions'
+    __table_args__ = (
+        db.Index('ix_subscriptions_user_status', 'user_id', 'status'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     
@@ -19,8 +23,8 @@ class Subscription(db.Model):
     stripe_price_id = db.Column(db.String(100))
     
     # Subscription details
-    plan_name = db.Column(db.String(50), nullable=False)  # free, premium, school
-    status = db.Column(db.String(20), nullable=False)  # active, canceled, past_due, unpaid
+    plan_name = db.Column(PlanName, nullable=False)  # free, premium, school
+    status = db.Column(SubscriptionStatus, nullable=False)  # active, canceled, past_due, unpaid, ...
     
     # Billing information
     current_period_start = db.Column(db.DateTime(timezone=True))
@@ -31,63 +35,64 @@ class Subscription(db.Model):
     # Pricing
     amount = db.Column(db.Integer)  # Amount in cents
     currency = db.Column(db.String(3), default='usd')
-    interval = db.Column(db.String(20))  # month, year
+    interval = db.Column(BillingInterval)  # month, year
     
     # Trial information
     trial_start = db.Column(db.DateTime(timezone=True))
     trial_end = db.Column(db.DateTime(timezone=True))
     
     # Usage tracking
-    usage_data = db.Column(db.Text)  # JSON data for usage tracking
+    usage_data = db.Column(JSONBDict)  # JSON data for usage tracking
     
     # Timestamps
-    created_at = db.Column(db.DateTime(timezone=True), default=datetime.now(timezone.utc), nullable=False)
-    updated_at = db.Column(db.DateTime(timezone=True), default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc), nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), nullable=False)
+    updated_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), onupdate=db.func.now(), nullable=False)
     
     # Foreign keys
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     
     def __repr__(self):
         return f'<Subscription {self.plan_name} for User {self.user_id}>'
     
-    def is_active(self):
+    def is_active(self, now=None):
         """Check if subscription is currently active"""
         if self.status != 'active':
             return False
         
-        if self.current_period_end and self.current_period_end < datetime.now(timezone.utc):
-            return False
+        if self.current_period_end:
+            if now is None:
+                now = datetime.now(timezone.utc)
+            if self.current_period_end < now:
+                return False
         
         return True
     
-    def is_in_trial(self):
+    def is_in_trial(self, now=None):
         """Check if subscription is in trial period"""
         if not self.trial_start or not self.trial_end:
             return False
         
-        now = datetime.now(timezone.utc)
+        if now is None:
+            now = datetime.now(timezone.utc)
         return self.trial_start <= now <= self.trial_end
     
-    def days_until_renewal(self):
+    def days_until_renewal(self, now=None):
         """Get days until next renewal"""
         if not self.current_period_end:
             return None
         
-        delta = self.current_period_end - datetime.now(timezone.utc)
+        if now is None:
+            now = datetime.now(timezone.utc)
+        delta = self.current_period_end - now
         return max(0, delta.days)
     
     def get_usage_data(self):
         """Get usage data as dictionary"""
-        if self.usage_data:
-            try:
-                return json.loads(self.usage_data)
-            except json.JSONDecodeError:
-                return {}
-        return {}
+        return self.usage_data or {}
     
     def set_usage_data(self, data):
         """Set usage data from dictionary"""
-        self.usage_data = json.dumps(data)
+        self.usage_data = data
     
     def update_usage(self, metric, value):
         """Update a specific usage metric"""
@@ -98,9 +103,24 @@ class Subscription(db.Model):
     
     def increment_usage(self, metric, amount=1):
         """Increment a usage metric"""
-        usage = self.get_usage_data()
-        usage[metric] = usage.get(metric, 0) + amount
-        self.set_usage_data(usage)
+        if db.session.get_bind().dialect.name != 'postgresql':
+            usage = self.get_usage_data()
+            usage[metric] = usage.get(metric, 0) + amount
+            self.set_usage_data(usage)
+            db.session.commit()
+            return
+        
+        # Bump the one key in place with jsonb_set so concurrent increments aren't lost
+        current = db.func.coalesce(Subscription.usage_data[metric].as_integer(), 0)
+        db.session.execute(
+            db.update(Subscription)
+            .where(Subscription.id == self.id)
+            .values(usage_data=db.func.jsonb_set(
+                db.func.coalesce(Subscription.usage_data, db.cast('{}', JSONB)),
+                db.cast(array([metric]), ARRAY(db.Text)),
+                db.func.to_jsonb(current + amount)
+            ))
+        )
         db.session.commit()
     
     def cancel(self, at_period_end=True):
@@ -122,6 +142,7 @@ class Subscription(db.Model):
     
     def to_dict(self):
         """Convert subscription to dictionary"""
+        now = datetime.now(timezone.utc)
         return {
             'id': self.id,
             'stripe_subscription_id': self.stripe_subscription_id,
@@ -136,9 +157,9 @@ class Subscription(db.Model):
             'interval': self.interval,
             'trial_start': self.trial_start.isoformat() if self.trial_start else None,
             'trial_end': self.trial_end.isoformat() if self.trial_end else None,
-            'is_active': self.is_active(),
-            'is_in_trial': self.is_in_trial(),
-            'days_until_renewal': self.days_until_renewal(),
+            'is_active': self.is_active(now),
+            'is_in_trial': self.is_in_trial(now),
+            'days_until_renewal': self.days_until_renewal(now),
             'usage_data': self.get_usage_data(),
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
@@ -148,10 +169,12 @@ class Subscription(db.Model):
     @staticmethod
     def get_active_subscription(user_id):
         """Get the active subscription for a user"""
-        return Subscription.query.filter_by(
-            user_id=user_id,
-            status='active'
-        ).first()
+        # Built once and cached by SQLAlchemy; later calls only rebind user_id
+        stmt = db.lambda_stmt(lambda: db.select(Subscription).where(
+            Subscription.user_id == user_id,
+            Subscription.status == 'active'
+        ).limit(1))
+        return db.session.execute(stmt).scalars().first()
     
     @staticmethod
     def create_free_subscription(user_id):
@@ -0,0 +1,68 @@
+"""
+Custom Column Types
+"""
+import orjson
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.mutable import MutableDict, MutableList
+from sqlalchemy.types import JSON, Enum, String, Text, TypeDecorator
+from app.config import SUBSCRIPTION_PLANS
+
+
+class JSONText(TypeDecorator):
+    """JSON stored in a Text column, decoded once when the row is loaded"""
+    
+    impl = Text
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        """Encode a Python value as JSON text"""
+        if value is None:
+            return None
+        return orjson.dumps(value).decode('utf-8')
+    
+    def process_result_value(self, value, dialect):
+        """Decode JSON text, treating empty or malformed values as missing"""
+        if not value:
+            return None
+        try:
+            return orjson.loads(value)
+        except orjson.JSONDecodeError:
+            return None
+
+
+# JSON columns that track in-place changes to their top-level list or dict
+JSONList = MutableList.as_mutable(JSONText)
+JSONDict = MutableDict.as_mutable(JSONText)
+
+# Dict column stored as JSONB on PostgreSQL so single keys can be updated server-side
+JSONBDict = MutableDict.as_mutable(
+    JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), 'postgresql')
+)
+
+
+# Length of secrets.token_urlsafe(32) and of the unpadded base64 SHA-256 digests
+# stored for reset and verification tokens
+TOKEN_LENGTH = 43
+
+# Token column compared byte-for-byte (C collation on PostgreSQL) for cheap exact lookups
+TokenString = String(TOKEN_LENGTH).with_variant(String(TOKEN_LENGTH, collation='C'), 'postgresql')
+
+
+# Fixed vocabularies, stored as native ENUM types on PostgreSQL
+QUESTION_TYPES = ('multiple_choice', 'true_false', 'short_answer', 'essay')
+DIFFICULTY_LEVELS = ('easy', 'medium', 'hard')
+QUIZ_STATUSES = ('draft', 'published', 'archived')
+USER_ROLES = ('teacher', 'school_admin')
+SUBSCRIPTION_STATUSES = (
+    'incomplete', 'incomplete_expired', 'trialing', 'active',
+    'past_due', 'canceled', 'unpaid', 'paused'
+)  # Stripe subscription statuses
+BILLING_INTERVALS = ('day', 'week', 'month', 'year')
+
+QuestionType = Enum(*QUESTION_TYPES, name='question_type')
+DifficultyLevel = Enum(*DIFFICULTY_LEVELS, name='difficulty_level')
+QuizStatus = Enum(*QUIZ_STATUSES, name='quiz_status')
+UserRole = Enum(*USER_ROLES, name='user_role')
+PlanName = Enum(*SUBSCRIPTION_PLANS, name='plan_name')
+SubscriptionStatus = Enum(*SUBSCRIPTION_STATUSES, name='subscription_status')
+BillingInterval = Enum(*BILLING_INTERVALS, name='billing_interval')
@@ -1,25 +1,101 @@
 """
 User Model
 """
+import base64
+import hashlib
+import secrets
 from datetime import datetime, timezone
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import event
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from werkzeug.security import check_password_hash
 from app import db
+from app.config import SUBSCRIPTION_PLANS
+from app.models.types import TokenString, UserRole
+
+# Feature names per plan, as sets for constant-time membership checks
+_PLAN_FEATURES = {key: frozenset(plan.features) for key, plan in SUBSCRIPTION_PLANS.items()}
+
+_FREE_QUIZ_LIMIT = SUBSCRIPTION_PLANS['free'].quiz_limit
+
+_password_hasher = PasswordHasher(time_cost=2, memory_cost=65536, parallelism=1)
+
+
+def configure_password_hasher(config):
+    """Set the Argon2 cost parameters from the app config"""
+    global _password_hasher
+    _password_hasher = PasswordHasher(
+        time_cost=config['ARGON2_TIME_COST'],
+        memory_cost=config['ARGON2_MEMORY_COST'],
+        parallelism=config['ARGON2_PARALLELISM']
+    )
+
+
+def hash_password(password):
+    """Hash a password with the configured Argon2 hasher"""
+    return _password_hasher.hash(password)
+
+
+def plan_has_feature(plan, feature):
+    """Check if a subscription plan includes a feature"""
+    return feature in _PLAN_FEATURES.get(plan, ())
+
+
+def subscription_is_active(plan, status, expires_at, now=None):
+    """Check if a subscription with the given plan, status and expiry is active"""
+    if plan == 'free':
+        return True
+    
+    if status != 'active':
+        return False
+    
+    if expires_at:
+        if now is None:
+            now = datetime.now(timezone.utc)
+        if expires_at < now:
+            return False
+    
+    return True
+
+
+def hash_token(token):
+    """Digest of an emailed token as stored in the database (same length as the token)"""
+    digest = hashlib.sha256(token.encode('utf-8')).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
 
 
 class User(db.Model):
     """User model for authentication and profile management"""
     
     __tablename__ = 'users'
+    __table_args__ = (
+        # Covers the columns the email lookups check, so they can be index-only scans
+        db.Index(
+            'ix_users_email_login', 'email', unique=True,
+            postgresql_include=['password_hash', 'is_active', 'id']
+        ),
+        db.Index(
+            'ix_users_reset_token', 'reset_token', unique=True,
+            postgresql_where=db.text('reset_token IS NOT NULL'),
+            sqlite_where=db.text('reset_token IS NOT NULL')
+        ),
+        db.Index(
+            'ix_users_verification_token', 'verification_token', unique=True,
+            postgresql_where=db.text('verification_token IS NOT NULL'),
+            sqlite_where=db.text('verification_token IS NOT NULL')
+        ),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(120), unique=True, nullable=False, index=True)
+    email = db.Column(db.String(120), nullable=False)  # Unique, see __table_args__
     password_hash = db.Column(db.String(255), nullable=False)
     first_name = db.Column(db.String(50), nullable=False)
     last_name = db.Column(db.String(50), nullable=False)
+    full_name = db.Column(db.String(101), index=True)  # Maintained by name events
     
     # Role-based access control
-    role = db.Column(db.String(20), nullable=False, default='teacher')  # teacher, school_admin
+    role = db.Column(UserRole, nullable=False, default='teacher')  # teacher, school_admin
     
     # Account status
     is_active = db.Column(db.Boolean, default=True, nullable=False)
@@ -33,7 +109,7 @@ class User(db.Model):
     
     # Usage tracking
     quiz_count_current_month = db.Column(db.Integer, default=0, nullable=False)
-    last_quiz_reset = db.Column(db.DateTime(timezone=True), default=datetime.now(timezone.utc))
+    last_quiz_reset = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
     
     # Profile information
     school_name = db.Column(db.String(200))
@@ -41,46 +117,68 @@ class User(db.Model):
     bio = db.Column(db.Text)
     
     # Timestamps
-    created_at = db.Column(db.DateTime(timezone=True), default=datetime.now(timezone.utc), nullable=False)
-    updated_at = db.Column(db.DateTime(timezone=True), default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc), nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), nullable=False)
+    updated_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), onupdate=db.func.now(), nullable=False)
     last_login = db.Column(db.DateTime(timezone=True))
     
     # Password reset
-    reset_token = db.Column(db.String(100))
+    reset_token = db.Column(TokenString)  # SHA-256 digest, see hash_token
     reset_token_expires = db.Column(db.DateTime(timezone=True))
     
     # Email verification
-    verification_token = db.Column(db.String(100))
+    verification_token = db.Column(TokenString)  # SHA-256 digest, see hash_token
     
-    # Relationships
-    quizzes = db.relationship('Quiz', backref='creator', lazy='dynamic', cascade='all, delete-orphan')
-    files = db.relationship('File', backref='uploader', lazy='dynamic', cascade='all, delete-orphan')
-    subscriptions = db.relationship('Subscription', backref='user', lazy='dynamic', cascade='all, delete-orphan')
+    # Relationships (deleting a user cascades in the database, see ON DELETE on the foreign keys)
+    quizzes = db.relationship('Quiz', backref='creator', cascade='all, delete-orphan', passive_deletes=True)
+    files = db.relationship('File', backref='uploader', cascade='all, delete-orphan', passive_deletes=True)
+    subscriptions = db.relationship('Subscription', backref='user', cascade='all, delete-orphan', passive_deletes=True)
     
     def __repr__(self):
         return f'<User {self.email}>'
     
     def set_password(self, password):
         """Hash and set password"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
-        """Check if provided password matches hash"""
-        return check_password_hash(self.password_hash, password)
+        """Check if provided password matches hash (caller must commit any rehash)"""
+        if not self.password_hash.startswith('$argon2'):
+            # Werkzeug pbkdf2 hash from before the switch to Argon2; upgrade it on success
+            if not check_password_hash(self.password_hash, password):
+                return False
+            self.set_password(password)
+            return True
+        
+        try:
+            _password_hasher.verify(self.password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+        
+        if _password_hasher.check_needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
     
-    @property
-    def full_name(self):
-        """Get user's full name"""
-        return f"{self.first_name} {self.last_name}"
+    def issue_verification_token(self):
+        """Set a new email verification token and return it; only its digest is stored"""
+        token = secrets.token_urlsafe(32)
+        self.verification_token = hash_token(token)
+        return token
+    
+    def issue_reset_token(self, expires_at):
+        """Set a new password reset token and return it; only its digest is stored"""
+        token = secrets.token_urlsafe(32)
+        self.reset_token = hash_token(token)
+        self.reset_token_expires = expires_at
+        return token
     
     def can_create_quiz(self):
         """Check if user can create a new quiz based on their plan"""
         if self.subscription_plan == 'free':
-            return self.quiz_count_current_month < 5
+            return self.quiz_count_current_month < _FREE_QUIZ_LIMIT
         return True  # Premium and school plans have unlimited quizzes
     
     def increment_quiz_count(self):
-        """Increment the monthly quiz count"""
+        """Increment the monthly quiz count (committed by the caller, with the quiz)"""
         # Reset count if it's a new month
         now = datetime.now(timezone.utc)
         if (now.year, now.month) != (self.last_quiz_reset.year, self.last_quiz_reset.month):
@@ -88,27 +186,32 @@ class User(db.Model):
             self.last_quiz_reset = now
         
         self.quiz_count_current_month += 1
-        db.session.commit()
+    
+    def release_quiz_count(self, charged_at):
+        """Give back a quiz charged at charged_at, unless the monthly count has been reset since"""
+        reset = self.last_quiz_reset
+        if (charged_at.year, charged_at.month) == (reset.year, reset.month) and self.quiz_count_current_month > 0:
+            self.quiz_count_current_month -= 1
     
     def has_feature(self, feature):
         """Check if user has access to a specific feature"""
-        from app.config import BaseConfig
-        
-        plan_features = BaseConfig.SUBSCRIPTION_PLANS.get(self.subscription_plan, {}).get('features', [])
-        return feature in plan_features
+        return plan_has_feature(self.subscription_plan, feature)
     
-    def is_subscription_active(self):
+    def is_subscription_active(self, now=None):
         """Check if user's subscription is active"""
-        if self.subscription_plan == 'free':
-            return True
-        
-        if self.subscription_status != 'active':
-            return False
-        
-        if self.subscription_expires_at and self.subscription_expires_at < datetime.now(timezone.utc):
-            return False
-        
-        return True
+        return subscription_is_active(
+            self.subscription_plan, self.subscription_status, self.subscription_expires_at, now
+        )
+    
+    def token_claims(self):
+        """Authorization fields carried in access tokens so checks can skip the database"""
+        expires_at = self.subscription_expires_at
+        return {
+            'role': self.role,
+            'plan': self.subscription_plan,
+            'subscription_status': self.subscription_status,
+            'subscription_expires_at': expires_at.timestamp() if expires_at else None
+        }
     
     def to_dict(self, include_sensitive=False):
         """Convert user to dictionary"""
@@ -140,3 +243,10 @@ class User(db.Model):
             })
         
         return data
+
+
+@event.listens_for(User, 'before_insert')
+@event.listens_for(User, 'before_update')
+def _store_full_name(mapper, connection, target):
+    """Keep the stored full name in step with the first and last name"""
+    target.full_name = f"{target.first_name} {target.last_name}"
@@ -1,20 +1,61 @@
 """
 AI Routes for Question Generation
 """
+import json
 import time
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, jsonify, url_for, current_app, g
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy.orm import load_only
 
 from app import db
 from app.models.user import User
 from app.models.quiz import Quiz
-from app.models.question import Question
 from app.models.file import File
-from app.utils.decorators import validate_json, require_feature
-from app.ai.question_generator import QuestionGenerator
+from app.models.types import DIFFICULTY_LEVELS
+from app.utils.decorators import validate_json, require_feature, check_quiz_ownership
+from app.ai.question_generator import get_question_generator
+from app.tasks import generate_questions_cached, generate_quiz_questions
 
 ai_bp = Blueprint('ai', __name__)
-question_generator = QuestionGenerator()
+
+
+# Static question type catalogue, serialized once since it never changes
+_QUESTION_TYPES_JSON = json.dumps({
+    'question_types': [
+        {
+            'value': 'multiple_choice',
+            'label': 'Multiple Choice',
+            'description': 'Questions with 4 answer options',
+            'supported': True
+        },
+        {
+            'value': 'true_false',
+            'label': 'True/False',
+            'description': 'Questions with true or false answers',
+            'supported': True
+        },
+        {
+            'value': 'short_answer',
+            'label': 'Short Answer',
+            'description': 'Questions requiring brief written responses',
+            'supported': True
+        },
+        {
+            'value': 'essay',
+            'label': 'Essay',
+            'description': 'Questions requiring detailed written responses',
+            'supported': False  # Not implemented yet
+        }
+    ]
+}).encode('utf-8')
+
+
+def _reject_long_text(text):
+    """413 response for text longer than the models are allowed to process, else None"""
+    limit = current_app.config['MAX_AI_TEXT_LENGTH']
+    if len(text) > limit:
+        return jsonify({'message': 'Text too long', 'limit': limit}), 413
+    return None
 
 
 @ai_bp.route('/generate-questions', methods=['POST'])
@@ -23,12 +64,12 @@ question_generator = QuestionGenerator()
 def generate_questions():
     """Generate questions from text using AI"""
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
     
-    if not user:
+    # Only the user's existence matters here
+    if db.session.query(User.id).filter_by(id=current_user_id).scalar() is None:
         return jsonify({'message': 'User not found'}), 404
     
-    data = request.get_json()
+    data = g.json_body
     text = data['text']
     num_questions = min(data['num_questions'], 50)  # Limit to 50 questions
     question_types = data.get('question_types', ['multiple_choice', 'true_false'])
@@ -37,11 +78,15 @@ def generate_questions():
     if len(text.strip()) < 100:
         return jsonify({'message': 'Text must be at least 100 characters long'}), 400
     
+    too_long = _reject_long_text(text)
+    if too_long:
+        return too_long
+    
     try:
         start_time = time.time()
         
         # Generate questions
-        generated_questions = question_generator.generate_questions(
+        generated_questions = generate_questions_cached(
             text=text,
             num_questions=num_questions,
             question_types=question_types,
@@ -84,11 +129,13 @@ def generate_questions():
 
 @ai_bp.route('/generate-quiz', methods=['POST'])
 @jwt_required()
-@validate_json(['title', 'source_text', 'num_questions'])
+@validate_json(['title', 'source_text', 'num_questions'], choices={'difficulty_level': DIFFICULTY_LEVELS})
 def generate_quiz():
     """Generate a complete quiz with questions"""
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    user = User.query.options(
+        load_only(User.subscription_plan, User.quiz_count_current_month, User.last_quiz_reset)
+    ).filter_by(id=current_user_id).first()
     
     if not user:
         return jsonify({'message': 'User not found'}), 404
@@ -101,99 +148,84 @@ def generate_quiz():
             'limit': 5 if user.subscription_plan == 'free' else -1
         }), 403
     
-    data = request.get_json()
+    data = g.json_body
     
-    try:
-        start_time = time.time()
-        
-        # Create quiz
-        quiz = Quiz(
-            title=data['title'],
-            description=data.get('description'),
-            source_text=data['source_text'],
-            source_file_id=data.get('source_file_id'),
-            difficulty_level=data.get('difficulty_level', 'medium'),
-            total_questions=data['num_questions'],
-            user_id=current_user_id
-        )
-        
-        question_types = data.get('question_types', ['multiple_choice', 'true_false'])
-        quiz.set_question_types_list(question_types)
-        
-        db.session.add(quiz)
-        db.session.commit()
-        
-        # Generate questions
-        generated_questions = question_generator.generate_questions(
-            text=data['source_text'],
-            num_questions=data['num_questions'],
-            question_types=question_types,
-            difficulty_level=data.get('difficulty_level', 'medium')
-        )
-        
-        # Save questions to database
-        for i, q in enumerate(generated_questions):
-            question = Question(
-                question_text=q.question_text,
-                question_type=q.question_type,
-                correct_answer=q.correct_answer,
-                explanation=q.explanation,
-                difficulty_level=q.difficulty_level,
-                topic=q.topic,
-                bloom_taxonomy_level=q.bloom_taxonomy_level,
-                confidence_score=q.confidence_score,
-                source_sentence=q.source_sentence,
-                order_index=i + 1,
-                quiz_id=quiz.id
-            )
-            
-            if q.options:
-                question.set_options_list(q.options)
-            
-            if q.keywords:
-                question.set_keywords_list(q.keywords)
-            
-            db.session.add(question)
-        
-        generation_time = time.time() - start_time
-        
-        # Update quiz metadata
-        quiz.ai_model_used = 'transformers + spacy'
-        quiz.generation_time = generation_time
-        quiz.set_generation_parameters({
-            'question_types': question_types,
-            'difficulty_level': data.get('difficulty_level', 'medium'),
-            'source_length': len(data['source_text'])
-        })
-        
-        db.session.commit()
-        
-        # Increment user's quiz count
-        user.increment_quiz_count()
-        
-        return jsonify({
-            'message': 'Quiz generated successfully',
-            'quiz': quiz.to_dict(include_questions=True),
-            'generation_time': generation_time,
-            'questions_generated': len(generated_questions)
-        }), 201
+    too_long = _reject_long_text(data['source_text'])
+    if too_long:
+        return too_long
     
-    except Exception as e:
-        # Rollback on error
-        db.session.rollback()
-        return jsonify({
-            'message': 'Quiz generation failed',
-            'error': str(e)
-        }), 500
+    return _start_quiz_generation(
+        user, data, data['source_text'], data.get('source_file_id')
+    )
+
+
+def _start_quiz_generation(user, data, source_text, source_file_id=None):
+    """Create a pending quiz, charge it to the user's quota and queue its questions for a background worker"""
+    quiz = Quiz(
+        title=data['title'],
+        description=data.get('description'),
+        source_text=source_text,
+        source_file_id=source_file_id,
+        difficulty_level=data.get('difficulty_level', 'medium'),
+        total_questions=data['num_questions'],
+        generation_status='pending',
+        user_id=user.id
+    )
+    
+    question_types = data.get('question_types', ['multiple_choice', 'true_false'])
+    quiz.set_question_types_list(question_types)
+    quiz.set_generation_parameters({
+        'question_types': question_types,
+        'difficulty_level': data.get('difficulty_level', 'medium'),
+        'source_length': len(source_text)
+    })
+    
+    # Charged when queued, in the quiz's own commit, so pending generations count
+    # against the limit; the task gives the quota back if generation fails
+    db.session.add(quiz)
+    user.increment_quiz_count()
+    db.session.commit()
+    
+    generate_quiz_questions.delay(quiz.id)
+    
+    return jsonify({
+        'message': 'Quiz generation started',
+        'quiz_id': quiz.id,
+        'status_url': url_for('ai.get_generation_status', quiz_id=quiz.id)
+    }), 202
+
+
+@ai_bp.route('/generate-quiz/<int:quiz_id>/status', methods=['GET'])
+@jwt_required()
+@check_quiz_ownership
+def get_generation_status(quiz_id):
+    """Get the progress of a quiz started by the generate-quiz endpoint"""
+    quiz = g.quiz
+    
+    response = {
+        'quiz_id': quiz.id,
+        'generation_status': quiz.generation_status
+    }
+    
+    if quiz.generation_status == 'completed':
+        response['quiz'] = quiz.to_dict(include_questions=True)
+        response['generation_time'] = quiz.generation_time
+        response['questions_generated'] = quiz.question_count
+    elif quiz.generation_status == 'failed':
+        response['error'] = quiz.generation_error
+    
+    return jsonify(response), 200
 
 
 @ai_bp.route('/generate-from-file', methods=['POST'])
 @jwt_required()
-@validate_json(['file_id', 'title', 'num_questions'])
+@validate_json(['file_id', 'title', 'num_questions'], choices={'difficulty_level': DIFFICULTY_LEVELS})
 def generate_quiz_from_file():
     """Generate quiz from uploaded file"""
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    user = User.query.options(
+        load_only(User.subscription_plan, User.quiz_count_current_month, User.last_quiz_reset)
+    ).filter_by(id=current_user_id).first()
     
     if not user:
         return jsonify({'message': 'User not found'}), 404
@@ -206,7 +238,7 @@ def generate_quiz_from_file():
             'limit': 5 if user.subscription_plan == 'free' else -1
         }), 403
     
-    data = request.get_json()
+    data = g.json_body
     file_id = data['file_id']
     
     # Get file
@@ -221,12 +253,12 @@ def generate_quiz_from_file():
     if file.extraction_status != 'success':
         return jsonify({'message': 'File text extraction failed'}), 400
     
-    # Use the file's extracted text
-    data['source_text'] = file.extracted_text
-    data['source_file_id'] = file_id
+    too_long = _reject_long_text(file.extracted_text)
+    if too_long:
+        return too_long
     
-    # Call the generate_quiz function
-    return generate_quiz()
+    # Generate from the file's extracted text
+    return _start_quiz_generation(user, data, file.extracted_text, file_id)
 
 
 @ai_bp.route('/extract-concepts', methods=['POST'])
@@ -234,14 +266,18 @@ def generate_quiz_from_file():
 @validate_json(['text'])
 def extract_concepts():
     """Extract key concepts from text"""
-    data = request.get_json()
+    data = g.json_body
     text = data['text']
     
     if len(text.strip()) < 50:
         return jsonify({'message': 'Text must be at least 50 characters long'}), 400
     
+    too_long = _reject_long_text(text)
+    if too_long:
+        return too_long
+    
     try:
-        concepts = question_generator.extract_key_concepts(text)
+        concepts = get_question_generator().extract_key_concepts(text)
         
         return jsonify({
             'concepts': concepts[:20],  # Limit to top 20 concepts
@@ -258,31 +294,4 @@ def extract_concepts():
 @ai_bp.route('/question-types', methods=['GET'])
 def get_question_types():
     """Get available question types for AI generation"""
-    return jsonify({
-        'question_types': [
-            {
-                'value': 'multiple_choice',
-                'label': 'Multiple Choice',
-                'description': 'Questions with 4 answer options',
-                'supported': True
-            },
-            {
-                'value': 'true_false',
-                'label': 'True/False',
-                'description': 'Questions with true or false answers',
-                'supported': True
-            },
-            {
-                'value': 'short_answer',
-                'label': 'Short Answer',
-                'description': 'Questions requiring brief written responses',
-                'supported': True
-            },
-            {
-                'value': 'essay',
-                'label': 'Essay',
-                'description': 'Questions requiring detailed written responses',
-                'supported': False  # Not implemented yet
-            }
-        ]
-    }), 200
+    return Response(_QUESTION_TYPES_JSON, mimetype='application/json')
@@ -1,7 +1,7 @@
 """
 Authentication Routes
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, jsonify, g
 from flask_jwt_extended import (
     create_access_token, create_refresh_token, jwt_required,
     get_jwt_identity, get_jwt
@@ -9,23 +9,29 @@ from flask_jwt_extended import (
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from datetime import datetime, timezone, timedelta
-import secrets
+import string
 import re
 
 from app import db, redis_client, limiter, mail
-from app.models.user import User
+from app.models.user import User, hash_token
 from app.models.subscription import Subscription
-from app.utils.decorators import validate_json
+from app.utils.decorators import validate_json, load_user
 from flask import url_for, current_app
 from flask_mail import Message
+from sqlalchemy.orm import load_only
 
 auth_bp = Blueprint('auth', __name__)
 
+_EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+_UPPERCASE = frozenset(string.ascii_uppercase)
+_LOWERCASE = frozenset(string.ascii_lowercase)
+
+MAX_PASSWORD_LENGTH = 128
+
 
 def is_valid_email(email):
     """Validate email format"""
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return re.match(pattern, email) is not None
+    return _EMAIL_RE.match(email) is not None
 
 
 def is_strong_password(password):
@@ -33,22 +39,28 @@ def is_strong_password(password):
     if len(password) < 8:
         return False, "Password must be at least 8 characters long"
     
-    if not re.search(r'[A-Z]', password):
+    # Bounds the character scan and the hashing work a single request can cause
+    if len(password) > MAX_PASSWORD_LENGTH:
+        return False, f"Password must be at most {MAX_PASSWORD_LENGTH} characters long"
+    
+    # One pass to collect the distinct characters, then set checks per class
+    chars = set(password)
+    
+    if chars.isdisjoint(_UPPERCASE):
         return False, "Password must contain at least one uppercase letter"
     
-    if not re.search(r'[a-z]', password):
+    if chars.isdisjoint(_LOWERCASE):
         return False, "Password must contain at least one lowercase letter"
     
-    if not re.search(r'\d', password):
+    if not any(map(str.isdecimal, chars)):
         return False, "Password must contain at least one number"
     
     return True, "Password is strong"
 
 
-def send_verification_email(user):
+def send_verification_email(user, token):
     """Send email verification link to user"""
     try:
-        token = user.verification_token
         verification_url = url_for('auth.verify_email', token=token, _external=True)
 
         msg = Message(
@@ -75,10 +87,9 @@ def send_verification_email(user):
         return False
 
 
-def send_password_reset_email(user):
+def send_password_reset_email(user, token):
     """Send password reset link to user"""
     try:
-        token = user.reset_token
         reset_url = url_for('auth.reset_password', token=token, _external=True)
 
         msg = Message(
@@ -111,7 +122,7 @@ def send_password_reset_email(user):
 @validate_json(['email', 'password', 'first_name', 'last_name'])
 def register():
     """Register a new user"""
-    data = request.get_json()
+    data = g.json_body
     
     # Validate input
     email = data['email'].lower().strip()
@@ -129,7 +140,7 @@ def register():
         return jsonify({'message': message}), 400
     
     # Check if user already exists
-    if User.query.filter_by(email=email).first():
+    if db.session.query(User.id).filter_by(email=email).first():
         return jsonify({'message': 'Email already registered'}), 409
     
     # Create new user
@@ -144,7 +155,7 @@ def register():
     user.set_password(password)
     
     # Generate verification token
-    user.verification_token = secrets.token_urlsafe(32)
+    verification_token = user.issue_verification_token()
     
     db.session.add(user)
     db.session.commit()
@@ -153,10 +164,10 @@ def register():
     Subscription.create_free_subscription(user.id)
 
     # Send verification email
-    send_verification_email(user)
+    send_verification_email(user, verification_token)
 
     # Create tokens
-    access_token = create_access_token(identity=user.id)
+    access_token = create_access_token(identity=user.id, additional_claims=user.token_claims())
     refresh_token = create_refresh_token(identity=user.id)
     
     return jsonify({
@@ -172,7 +183,7 @@ def register():
 @validate_json(['email', 'password'])
 def login():
     """Login user"""
-    data = request.get_json()
+    data = g.json_body
     
     email = data['email'].lower().strip()
     password = data['password']
@@ -191,7 +202,7 @@ def login():
     db.session.commit()
     
     # Create tokens
-    access_token = create_access_token(identity=user.id)
+    access_token = create_access_token(identity=user.id, additional_claims=user.token_claims())
     refresh_token = create_refresh_token(identity=user.id)
     
     return jsonify({
@@ -207,12 +218,16 @@ def login():
 def refresh():
     """Refresh access token"""
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    user = User.query.options(load_only(
+        User.is_active, User.role, User.subscription_plan,
+        User.subscription_status, User.subscription_expires_at
+    )).filter_by(id=current_user_id).first()
     
     if not user or not user.is_active:
         return jsonify({'message': 'User not found or inactive'}), 404
     
-    access_token = create_access_token(identity=current_user_id)
+    # Fresh claims, so plan and role changes reach new access tokens
+    access_token = create_access_token(identity=current_user_id, additional_claims=user.token_claims())
     
     return jsonify({
         'access_token': access_token
@@ -223,23 +238,21 @@ def refresh():
 @jwt_required()
 def logout():
     """Logout user (revoke token)"""
-    jti = get_jwt()['jti']
+    token = get_jwt()
     
-    # Add token to blacklist
-    redis_client.set(f"revoked_token:{jti}", "true", ex=timedelta(hours=1))
+    # Add token to blacklist until it would have expired anyway
+    expires_in = token['exp'] - int(datetime.now(timezone.utc).timestamp())
+    redis_client.set(f"revoked_token:{token['jti']}", "true", ex=max(expires_in, 1))
     
     return jsonify({'message': 'Successfully logged out'}), 200
 
 
 @auth_bp.route('/me', methods=['GET'])
 @jwt_required()
+@load_user
 def get_current_user():
     """Get current user information"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if not user:
-        return jsonify({'message': 'User not found'}), 404
+    user = g.user
     
     return jsonify({
         'user': user.to_dict(include_sensitive=True)
@@ -251,19 +264,18 @@ def get_current_user():
 @validate_json(['email'])
 def forgot_password():
     """Request password reset"""
-    data = request.get_json()
+    data = g.json_body
     email = data['email'].lower().strip()
     
     user = User.query.filter_by(email=email).first()
     
     if user:
         # Generate reset token
-        user.reset_token = secrets.token_urlsafe(32)
-        user.reset_token_expires = datetime.now(timezone.utc) + timedelta(hours=1)
+        reset_token = user.issue_reset_token(datetime.now(timezone.utc) + timedelta(hours=1))
         db.session.commit()
 
         # Send password reset email
-        send_password_reset_email(user)
+        send_password_reset_email(user, reset_token)
     
     # Always return success to prevent email enumeration
     return jsonify({
@@ -276,7 +288,7 @@ def forgot_password():
 @validate_json(['token', 'password'])
 def reset_password():
     """Reset password with token"""
-    data = request.get_json()
+    data = g.json_body
     token = data['token']
     password = data['password']
     
@@ -286,7 +298,7 @@ def reset_password():
         return jsonify({'message': message}), 400
     
     # Find user by reset token
-    user = User.query.filter_by(reset_token=token).first()
+    user = User.query.filter_by(reset_token=hash_token(token)).first()
     
     if not user or not user.reset_token_expires or user.reset_token_expires < datetime.now(timezone.utc):
         return jsonify({'message': 'Invalid or expired reset token'}), 400
@@ -304,10 +316,10 @@ def reset_password():
 @validate_json(['token'])
 def verify_email():
     """Verify email address"""
-    data = request.get_json()
+    data = g.json_body
     token = data['token']
     
-    user = User.query.filter_by(verification_token=token).first()
+    user = User.query.filter_by(verification_token=hash_token(token)).first()
     
     if not user:
         return jsonify({'message': 'Invalid verification token'}), 400
@@ -324,18 +336,18 @@ def verify_email():
 @validate_json(['email'])
 def resend_verification():
     """Resend email verification"""
-    data = request.get_json()
+    data = g.json_body
     email = data['email'].lower().strip()
     
     user = User.query.filter_by(email=email).first()
     
     if user and not user.is_verified:
         # Generate new verification token
-        user.verification_token = secrets.token_urlsafe(32)
+        verification_token = user.issue_verification_token()
         db.session.commit()
 
         # Send verification email
-        send_verification_email(user)
+        send_verification_email(user, verification_token)
     
     return jsonify({
         'message': 'If the email exists and is unverified, a verification link has been sent'
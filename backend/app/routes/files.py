@@ -2,7 +2,9 @@
 File Routes
 """
 import os
-from flask import Blueprint, request, jsonify, send_file, current_app
+import hashlib
+from functools import lru_cache
+from flask import Blueprint, request, jsonify, send_file, current_app, make_response, g
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.utils import secure_filename
 
@@ -10,10 +12,29 @@ from app import db
 from app.models.user import User
 from app.models.file import File
 from app.utils.decorators import check_file_ownership
-from app.ai.document_processor import DocumentProcessor
+from app.tasks import document_processor, extract_file_text
 
 files_bp = Blueprint('files', __name__)
-document_processor = DocumentProcessor()
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+@lru_cache(maxsize=4096)
+def ensure_user_folder(upload_folder, user_id):
+    """Create a user's upload folder if needed, once per process; returns its path"""
+    user_folder = os.path.join(upload_folder, str(user_id))
+    os.makedirs(user_folder, exist_ok=True)
+    return user_folder
+
+
+def save_and_hash(file_storage, file_path):
+    """Write an uploaded file to disk, hashing it in the same pass; returns (sha256 hex, size)"""
+    content_hash = hashlib.sha256()
+    with open(file_path, 'wb') as out:
+        while chunk := file_storage.stream.read(UPLOAD_CHUNK_SIZE):
+            out.write(chunk)
+            content_hash.update(chunk)
+        return content_hash.hexdigest(), out.tell()
 
 
 @files_bp.route('', methods=['GET'])
@@ -57,9 +78,9 @@ def get_files():
 def upload_file():
     """Upload a file"""
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
     
-    if not user:
+    # Only the user's existence matters here
+    if db.session.query(User.id).filter_by(id=current_user_id).scalar() is None:
         return jsonify({'message': 'User not found'}), 404
     
     if 'file' not in request.files:
@@ -81,16 +102,18 @@ def upload_file():
     unique_filename = File.generate_unique_filename(original_filename)
     
     # Create upload directory if it doesn't exist
-    upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-    user_folder = os.path.join(upload_folder, str(current_user_id))
-    os.makedirs(user_folder, exist_ok=True)
+    user_folder = ensure_user_folder(
+        current_app.config.get('UPLOAD_FOLDER', 'uploads'), current_user_id
+    )
     
     # Save file
     file_path = os.path.join(user_folder, unique_filename)
-    file.save(file_path)
+    content_hash, file_size = save_and_hash(file, file_path)
     
     # Validate file
-    validation_result = document_processor.validate_file(file_path, original_filename)
+    validation_result = document_processor.validate_file(
+        file_path, original_filename, content_hash=content_hash, file_size=file_size
+    )
     
     if not validation_result['is_valid']:
         # Remove invalid file
@@ -115,23 +138,8 @@ def upload_file():
     db.session.add(file_record)
     db.session.commit()
     
-    # Start text extraction in background (would use Celery in production)
-    try:
-        extraction_result = document_processor.extract_text(
-            file_path, 
-            file_record.file_extension
-        )
-        
-        if extraction_result['success']:
-            file_record.extracted_text = extraction_result['text']
-            file_record.page_count = extraction_result['metadata'].get('page_count')
-            file_record.mark_as_processed(success=True)
-            file_record.calculate_word_count()
-        else:
-            file_record.mark_as_processed(success=False, error=extraction_result['error'])
-    
-    except Exception as e:
-        file_record.mark_as_processed(success=False, error=str(e))
+    # Text extraction runs on a background worker; the record stays pending until it finishes
+    extract_file_text.delay(file_record.id)
     
     return jsonify({
         'message': 'File uploaded successfully',
@@ -144,10 +152,7 @@ def upload_file():
 @check_file_ownership
 def get_file(file_id):
     """Get file details"""
-    file = File.query.get(file_id)
-    
-    if not file:
-        return jsonify({'message': 'File not found'}), 404
+    file = g.file
     
     return jsonify({
         'file': file.to_dict(include_content=True)
@@ -159,10 +164,7 @@ def get_file(file_id):
 @check_file_ownership
 def download_file(file_id):
     """Download a file"""
-    file = File.query.get(file_id)
-    
-    if not file:
-        return jsonify({'message': 'File not found'}), 404
+    file = g.file
     
     file_path = file.get_absolute_path()
     
@@ -171,6 +173,16 @@ def download_file(file_id):
     
     # Increment download count
     file.increment_download_count()
+    db.session.commit()
+    
+    # Behind nginx, hand the transfer to the proxy rather than streaming it through Python
+    accel_prefix = current_app.config.get('UPLOAD_ACCEL_REDIRECT_PREFIX')
+    if accel_prefix:
+        response = make_response('')
+        response.mimetype = file.mime_type or 'application/octet-stream'
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{file.file_path}"
+        response.headers.set('Content-Disposition', 'attachment', filename=file.original_filename)
+        return response
     
     return send_file(
         file_path,
@@ -184,10 +196,7 @@ def download_file(file_id):
 @check_file_ownership
 def delete_file(file_id):
     """Delete a file"""
-    file = File.query.get(file_id)
-    
-    if not file:
-        return jsonify({'message': 'File not found'}), 404
+    file = g.file
     
     # Delete file from disk
     file.delete_from_disk()
@@ -204,10 +213,7 @@ def delete_file(file_id):
 @check_file_ownership
 def extract_text(file_id):
     """Re-extract text from a file"""
-    file = File.query.get(file_id)
-    
-    if not file:
-        return jsonify({'message': 'File not found'}), 404
+    file = g.file
     
     if not file.can_extract_text():
         return jsonify({'message': 'Text extraction not supported for this file type'}), 400
@@ -228,6 +234,7 @@ def extract_text(file_id):
             file.page_count = extraction_result['metadata'].get('page_count')
             file.mark_as_processed(success=True)
             file.calculate_word_count()
+            db.session.commit()
             
             return jsonify({
                 'message': 'Text extracted successfully',
@@ -235,6 +242,7 @@ def extract_text(file_id):
             }), 200
         else:
             file.mark_as_processed(success=False, error=extraction_result['error'])
+            db.session.commit()
             return jsonify({
                 'message': 'Text extraction failed',
                 'error': extraction_result['error']
@@ -242,6 +250,7 @@ def extract_text(file_id):
     
     except Exception as e:
         file.mark_as_processed(success=False, error=str(e))
+        db.session.commit()
         return jsonify({
             'message': 'Text extraction failed',
             'error': str(e)
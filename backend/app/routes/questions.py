@@ -1,53 +1,81 @@
 """
 Question Routes
 """
-from flask import Blueprint, request, jsonify
+import hashlib
+import json
+from flask import Blueprint, Response, request, jsonify, g
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy.orm import joinedload
 
 from app import db
-from app.models.quiz import Quiz
-from app.models.question import Question
+from app.models.quiz import Quiz, evict_shared_quiz
+from app.models.question import Question, QUESTION_ROW, question_row_to_dict
+from app.models.types import DIFFICULTY_LEVELS, QUESTION_TYPES
 from app.utils.decorators import validate_json, check_quiz_ownership
 
 questions_bp = Blueprint('questions', __name__)
 
 
+def _static_json(payload):
+    """Serialize a static payload once, with an ETag for its body"""
+    body = json.dumps(payload)
+    return body, hashlib.sha1(body.encode('utf-8')).hexdigest()
+
+
+# Static catalogues, serialized and fingerprinted once at import
+_QUESTION_TYPES_JSON = _static_json({'question_types': Question.get_question_types()})
+_DIFFICULTY_LEVELS_JSON = _static_json({'difficulty_levels': Question.get_difficulty_levels()})
+
+
+def _static_json_response(static_json):
+    """Browser/CDN-cacheable response for a static body, answering 304 when the ETag matches"""
+    body, etag = static_json
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = 3600
+    return response.make_conditional(request)
+
+
+def _get_question(question_id):
+    """Get a question with its quiz's owner loaded by the same query"""
+    return db.session.get(
+        Question, question_id, options=[joinedload(Question.quiz).load_only(Quiz.user_id)]
+    )
+
+
 @questions_bp.route('/quiz/<int:quiz_id>/questions', methods=['GET'])
 @jwt_required()
 @check_quiz_ownership
 def get_quiz_questions(quiz_id):
     """Get questions for a quiz"""
-    quiz = Quiz.query.get(quiz_id)
-    
-    if not quiz:
-        return jsonify({'message': 'Quiz not found'}), 404
-    
-    questions = Question.query.filter_by(quiz_id=quiz_id, is_active=True)\
-                            .order_by(Question.order_index)\
-                            .all()
+    # Plain column rows, skipping ORM object loading
+    rows = db.session.scalars(
+        db.select(QUESTION_ROW)
+        .where(Question.quiz_id == quiz_id, Question.is_active.is_(True))
+        .order_by(Question.order_index)
+    )
     
     return jsonify({
-        'questions': [q.to_dict() for q in questions]
+        'questions': [question_row_to_dict(row) for row in rows]
     }), 200
 
 
 @questions_bp.route('/quiz/<int:quiz_id>/questions', methods=['POST'])
 @jwt_required()
 @check_quiz_ownership
-@validate_json(['question_text', 'question_type', 'correct_answer'])
+@validate_json(
+    ['question_text', 'question_type', 'correct_answer'],
+    choices={'question_type': QUESTION_TYPES, 'difficulty_level': DIFFICULTY_LEVELS}
+)
 def create_question(quiz_id):
     """Create a new question for a quiz"""
-    quiz = Quiz.query.get(quiz_id)
+    data = g.json_body
     
-    if not quiz:
-        return jsonify({'message': 'Quiz not found'}), 404
-    
-    data = request.get_json()
-    
-    # Get the next order index
-    max_order = db.session.query(db.func.max(Question.order_index))\
-                         .filter_by(quiz_id=quiz_id)\
-                         .scalar() or 0
+    # Next order index, computed by the INSERT itself rather than a separate SELECT
+    next_order = db.select(db.func.coalesce(db.func.max(Question.order_index), 0) + 1)\
+                   .where(Question.quiz_id == quiz_id)\
+                   .scalar_subquery()
     
     question = Question(
         question_text=data['question_text'],
@@ -57,7 +85,7 @@ def create_question(quiz_id):
         difficulty_level=data.get('difficulty_level', 'medium'),
         topic=data.get('topic'),
         bloom_taxonomy_level=data.get('bloom_taxonomy_level'),
-        order_index=max_order + 1,
+        order_index=next_order,
         quiz_id=quiz_id
     )
     
@@ -80,7 +108,7 @@ def create_question(quiz_id):
 @jwt_required()
 def get_question(question_id):
     """Get a specific question"""
-    question = Question.query.get(question_id)
+    question = _get_question(question_id)
     
     if not question:
         return jsonify({'message': 'Question not found'}), 404
@@ -97,10 +125,10 @@ def get_question(question_id):
 
 @questions_bp.route('/<int:question_id>', methods=['PUT'])
 @jwt_required()
-@validate_json()
+@validate_json(choices={'difficulty_level': DIFFICULTY_LEVELS})
 def update_question(question_id):
     """Update a question"""
-    question = Question.query.get(question_id)
+    question = _get_question(question_id)
     
     if not question:
         return jsonify({'message': 'Question not found'}), 404
@@ -110,7 +138,7 @@ def update_question(question_id):
     if question.quiz.user_id != current_user_id:
         return jsonify({'message': 'You do not own this question'}), 403
     
-    data = request.get_json()
+    data = g.json_body
     
     # Update allowed fields
     allowed_fields = [
@@ -141,18 +169,33 @@ def update_question(question_id):
 @jwt_required()
 def delete_question(question_id):
     """Delete a question"""
-    question = Question.query.get(question_id)
+    current_user_id = get_jwt_identity()
     
-    if not question:
-        return jsonify({'message': 'Question not found'}), 404
+    # Ownership is part of the DELETE, so no row is loaded first
+    owned_quiz_ids = db.select(Quiz.id).where(Quiz.user_id == current_user_id)
+    quiz_id = db.session.scalar(
+        db.delete(Question)
+        .where(Question.id == question_id, Question.quiz_id.in_(owned_quiz_ids))
+        .returning(Question.quiz_id)
+        .execution_options(synchronize_session=False)
+    )
     
-    # Check if user owns the quiz
-    current_user_id = get_jwt_identity()
-    if question.quiz.user_id != current_user_id:
+    if quiz_id is None:
+        # Only the failure path pays for telling a missing question from someone else's
+        exists = db.session.scalar(db.select(Question.id).where(Question.id == question_id))
+        if exists is None:
+            return jsonify({'message': 'Question not found'}), 404
         return jsonify({'message': 'You do not own this question'}), 403
     
-    db.session.delete(question)
+    # Bulk deletes skip the question events, so keep the count and shared view in step here
+    share_token = db.session.scalar(
+        db.update(Quiz)
+        .where(Quiz.id == quiz_id)
+        .values(question_count=Quiz.question_count - 1)
+        .returning(Quiz.share_token)
+    )
     db.session.commit()
+    evict_shared_quiz(share_token)
     
     return jsonify({'message': 'Question deleted successfully'}), 200
 
@@ -163,36 +206,44 @@ def delete_question(question_id):
 @validate_json(['question_orders'])
 def reorder_questions(quiz_id):
     """Reorder questions in a quiz"""
-    quiz = Quiz.query.get(quiz_id)
-    
-    if not quiz:
-        return jsonify({'message': 'Quiz not found'}), 404
-    
-    data = request.get_json()
-    question_orders = data['question_orders']  # List of {id, order_index}
-    
-    # Update order indices
-    for item in question_orders:
-        question = Question.query.get(item['id'])
-        if question and question.quiz_id == quiz_id:
-            question.order_index = item['order_index']
+    data = g.json_body
+    
+    # List of {id, order_index}; ids sent as strings are accepted, since a string
+    # id would otherwise match no question and be dropped without notice
+    try:
+        question_orders = [
+            {'id': int(item['id']), 'order_index': int(item['order_index'])}
+            for item in data['question_orders']
+        ]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'message': 'question_orders must be a list of {id, order_index} integers'}), 400
+    
+    # Only questions belonging to this quiz may be moved
+    requested_ids = [item['id'] for item in question_orders]
+    valid_ids = set(db.session.scalars(
+        db.select(Question.id).where(Question.quiz_id == quiz_id, Question.id.in_(requested_ids))
+    ))
+    
+    # Update order indices in one bulk UPDATE by primary key
+    mappings = [item for item in question_orders if item['id'] in valid_ids]
+    if mappings:
+        db.session.execute(db.update(Question), mappings)
     
     db.session.commit()
     
+    # Bulk updates skip the question events that evict shared views
+    evict_shared_quiz(g.quiz.share_token)
+    
     return jsonify({'message': 'Questions reordered successfully'}), 200
 
 
 @questions_bp.route('/types', methods=['GET'])
 def get_question_types():
     """Get available question types"""
-    return jsonify({
-        'question_types': Question.get_question_types()
-    }), 200
+    return _static_json_response(_QUESTION_TYPES_JSON)
 
 
 @questions_bp.route('/difficulty-levels', methods=['GET'])
 def get_difficulty_levels():
     """Get available difficulty levels"""
-    return jsonify({
-        'difficulty_levels': Question.get_difficulty_levels()
-    }), 200
+    return _static_json_response(_DIFFICULTY_LEVELS_JSON)
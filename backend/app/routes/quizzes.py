@@ -1,15 +1,21 @@
 """
 Quiz Routes
 """
-from flask import Blueprint, request, jsonify
+import base64
+import binascii
+import hashlib
+import json
+import redis
+from flask import Blueprint, request, jsonify, g, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timezone
+from sqlalchemy.orm import joinedload
 
-from app import db
-from app.models.user import User
-from app.models.quiz import Quiz
+from app import db, redis_client
+from app.models.quiz import Quiz, SHARED_QUIZ_CACHE_TTL, evict_shared_quiz, shared_quiz_cache_key
 from app.models.question import Question
-from app.utils.decorators import validate_json, check_quiz_ownership
+from app.models.types import DIFFICULTY_LEVELS, QUIZ_STATUSES
+from app.utils.decorators import validate_json, check_quiz_ownership, load_user
 
 quizzes_bp = Blueprint('quizzes', __name__)
 
@@ -25,15 +31,31 @@ def get_quizzes():
     per_page = min(request.args.get('per_page', 10, type=int), 100)
     status = request.args.get('status')
     search = request.args.get('search')
+    fields = request.args.get('fields')
+    fields = fields.split(',') if fields else None
+    
+    if fields:
+        unknown = set(fields).difference(Quiz.SERIALIZABLE_FIELDS)
+        if unknown:
+            return jsonify({'message': f"Unknown fields: {', '.join(sorted(unknown))}"}), 400
     
     # Build query
-    query = Quiz.query.filter_by(user_id=current_user_id)
+    query = Quiz.query_for_user(current_user_id)
     
     if status:
+        if status not in QUIZ_STATUSES:
+            return jsonify({'message': 'Invalid status'}), 400
         query = query.filter_by(status=status)
     
     if search:
-        query = query.filter(Quiz.title.contains(search))
+        # Backed by the title trigram index on PostgreSQL; the search text is matched literally
+        query = query.filter(Quiz.title.contains(search, autoescape=True))
+    
+    # Keyset pagination: ?after=<next_cursor> (empty for the first page) seeks
+    # past the previous page instead of counting and skipping rows
+    after = request.args.get('after')
+    if after is not None:
+        return _get_quizzes_after(query, after, per_page, fields)
     
     # Order by creation date (newest first)
     query = query.order_by(Quiz.created_at.desc())
@@ -45,7 +67,7 @@ def get_quizzes():
         error_out=False
     )
     
-    quizzes = [quiz.to_dict() for quiz in pagination.items]
+    quizzes = [quiz.to_dict(fields=fields) for quiz in pagination.items]
     
     return jsonify({
         'quizzes': quizzes,
@@ -60,16 +82,57 @@ def get_quizzes():
     }), 200
 
 
+def _encode_cursor(quiz):
+    """Opaque cursor for the position just after a quiz in the listing order"""
+    position = json.dumps([quiz.created_at.isoformat(), quiz.id])
+    return base64.urlsafe_b64encode(position.encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor):
+    """(created_at, id) position from a cursor; raises ValueError if it is malformed"""
+    try:
+        created_at, quiz_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.fromisoformat(created_at), int(quiz_id)
+    except (TypeError, binascii.Error, UnicodeError) as e:
+        raise ValueError(str(e)) from e
+
+
+def _get_quizzes_after(query, cursor, per_page, fields):
+    """One page of a keyset-paginated quiz listing, newest first"""
+    listing = query
+    if cursor:
+        try:
+            created_at, quiz_id = _decode_cursor(cursor)
+        except ValueError:
+            return jsonify({'message': 'Invalid cursor'}), 400
+        query = query.filter(db.tuple_(Quiz.created_at, Quiz.id) < (created_at, quiz_id))
+    
+    # One extra row tells whether another page follows
+    items = query.order_by(Quiz.created_at.desc(), Quiz.id.desc()).limit(per_page + 1).all()
+    has_next = len(items) > per_page
+    items = items[:per_page]
+    
+    pagination = {
+        'per_page': per_page,
+        'has_next': has_next,
+        'next_cursor': _encode_cursor(items[-1]) if has_next else None
+    }
+    if request.args.get('include_total', type=int):
+        pagination['total'] = listing.count()
+    
+    return jsonify({
+        'quizzes': [quiz.to_dict(fields=fields) for quiz in items],
+        'pagination': pagination
+    }), 200
+
+
 @quizzes_bp.route('', methods=['POST'])
 @jwt_required()
-@validate_json(['title'])
+@validate_json(['title'], choices={'difficulty_level': DIFFICULTY_LEVELS})
+@load_user
 def create_quiz():
     """Create a new quiz"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if not user:
-        return jsonify({'message': 'User not found'}), 404
+    user = g.user
     
     # Check if user can create quiz
     if not user.can_create_quiz():
@@ -79,7 +142,7 @@ def create_quiz():
             'limit': 5 if user.subscription_plan == 'free' else -1
         }), 403
     
-    data = request.get_json()
+    data = g.json_body
     
     # Create quiz
     quiz = Quiz(
@@ -89,17 +152,16 @@ def create_quiz():
         source_file_id=data.get('source_file_id'),
         difficulty_level=data.get('difficulty_level', 'medium'),
         total_questions=data.get('total_questions', 10),
-        user_id=current_user_id
+        user_id=user.id
     )
     
     if 'question_types' in data:
         quiz.set_question_types_list(data['question_types'])
     
+    # Quiz and quota increment are stored together
     db.session.add(quiz)
-    db.session.commit()
-    
-    # Increment user's quiz count
     user.increment_quiz_count()
+    db.session.commit()
     
     return jsonify({
         'message': 'Quiz created successfully',
@@ -109,13 +171,12 @@ def create_quiz():
 
 @quizzes_bp.route('/<int:quiz_id>', methods=['GET'])
 @jwt_required()
-@check_quiz_ownership
+@check_quiz_ownership(options=[joinedload(Quiz.source_file)])
 def get_quiz(quiz_id):
     """Get a specific quiz"""
-    quiz = Quiz.query.get(quiz_id)
-    
-    if not quiz:
-        return jsonify({'message': 'Quiz not found'}), 404
+    # Loaded by the ownership check with its source columns and file; questions
+    # are serialized from a row query
+    quiz = g.quiz
     
     return jsonify({
         'quiz': quiz.to_dict(include_questions=True, include_source=True)
@@ -125,15 +186,12 @@ def get_quiz(quiz_id):
 @quizzes_bp.route('/<int:quiz_id>', methods=['PUT'])
 @jwt_required()
 @check_quiz_ownership
-@validate_json()
+@validate_json(choices={'difficulty_level': DIFFICULTY_LEVELS, 'status': QUIZ_STATUSES})
 def update_quiz(quiz_id):
     """Update a quiz"""
-    quiz = Quiz.query.get(quiz_id)
+    quiz = g.quiz
     
-    if not quiz:
-        return jsonify({'message': 'Quiz not found'}), 404
-    
-    data = request.get_json()
+    data = g.json_body
     
     # Update allowed fields
     allowed_fields = ['title', 'description', 'difficulty_level', 'status', 'is_public']
@@ -154,16 +212,27 @@ def update_quiz(quiz_id):
 
 @quizzes_bp.route('/<int:quiz_id>', methods=['DELETE'])
 @jwt_required()
-@check_quiz_ownership
 def delete_quiz(quiz_id):
     """Delete a quiz"""
-    quiz = Quiz.query.get(quiz_id)
+    current_user_id = get_jwt_identity()
     
-    if not quiz:
-        return jsonify({'message': 'Quiz not found'}), 404
+    # Ownership is part of the DELETE; questions go with it via ON DELETE CASCADE
+    deleted = db.session.execute(
+        db.delete(Quiz)
+        .where(Quiz.id == quiz_id, Quiz.user_id == current_user_id)
+        .returning(Quiz.share_token)
+        .execution_options(synchronize_session=False)
+    ).first()
+    
+    if deleted is None:
+        # Only the failure path pays for telling a missing quiz from someone else's
+        exists = db.session.scalar(db.select(Quiz.id).where(Quiz.id == quiz_id))
+        if exists is None:
+            return jsonify({'message': 'Quiz not found'}), 404
+        return jsonify({'message': 'You do not own this quiz'}), 403
     
-    db.session.delete(quiz)
     db.session.commit()
+    evict_shared_quiz(deleted.share_token)
     
     return jsonify({'message': 'Quiz deleted successfully'}), 200
 
@@ -173,10 +242,7 @@ def delete_quiz(quiz_id):
 @check_quiz_ownership
 def publish_quiz(quiz_id):
     """Publish a quiz"""
-    quiz = Quiz.query.get(quiz_id)
-    
-    if not quiz:
-        return jsonify({'message': 'Quiz not found'}), 404
+    quiz = g.quiz
     
     if quiz.question_count == 0:
         return jsonify({'message': 'Cannot publish quiz without questions'}), 400
@@ -194,10 +260,7 @@ def publish_quiz(quiz_id):
 @check_quiz_ownership
 def generate_share_link(quiz_id):
     """Generate a share link for a quiz"""
-    quiz = Quiz.query.get(quiz_id)
-    
-    if not quiz:
-        return jsonify({'message': 'Quiz not found'}), 404
+    quiz = g.quiz
     
     if quiz.status != 'published':
         return jsonify({'message': 'Only published quizzes can be shared'}), 400
@@ -214,14 +277,38 @@ def generate_share_link(quiz_id):
 @quizzes_bp.route('/shared/<share_token>', methods=['GET'])
 def get_shared_quiz(share_token):
     """Get a shared quiz by token"""
-    quiz = Quiz.get_by_share_token(share_token)
-    
-    if not quiz:
-        return jsonify({'message': 'Quiz not found or not shared'}), 404
+    cache_key = shared_quiz_cache_key(share_token)
+    
+    try:
+        quiz_id, body, etag = redis_client.hmget(cache_key, 'quiz_id', 'body', 'etag')
+    except redis.RedisError:
+        quiz_id = body = etag = None
+    
+    if body is None or etag is None:
+        quiz = Quiz.get_by_share_token(share_token)
+        
+        if not quiz:
+            return jsonify({'message': 'Quiz not found or not shared'}), 404
+        
+        quiz_id = quiz.id
+        body = current_app.json.dumps({'quiz': quiz.to_dict(include_questions=True)})
+        # Fingerprint of the body itself, so question edits change it too
+        etag = hashlib.sha1(body.encode('utf-8')).hexdigest()
+        
+        try:
+            pipe = redis_client.pipeline()
+            pipe.hset(cache_key, mapping={'quiz_id': quiz_id, 'body': body, 'etag': etag})
+            pipe.expire(cache_key, SHARED_QUIZ_CACHE_TTL)
+            pipe.execute()
+        except redis.RedisError:
+            pass
     
     # Increment view count
-    quiz.increment_view_count()
-    
-    return jsonify({
-        'quiz': quiz.to_dict(include_questions=True)
-    }), 200
+    Quiz.record_view(int(quiz_id))
+    
+    # Revalidations with a matching ETag get an empty 304
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag if isinstance(etag, str) else etag.decode('ascii'))
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    return response.make_conditional(request)
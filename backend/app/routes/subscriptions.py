@@ -1,13 +1,13 @@
 """
 Subscription Routes
 """
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, jsonify, g
+from flask_jwt_extended import jwt_required
 
 from app import db
-from app.models.user import User
 from app.models.subscription import Subscription
-from app.utils.decorators import validate_json
+from app.tasks import sync_subscription_cancellation
+from app.utils.decorators import validate_json, load_user
 
 subscriptions_bp = Blueprint('subscriptions', __name__)
 
@@ -18,21 +18,18 @@ def get_subscription_plans():
     from app.config import BaseConfig
     
     return jsonify({
-        'plans': BaseConfig.SUBSCRIPTION_PLANS
+        'plans': {key: plan.to_dict() for key, plan in BaseConfig.SUBSCRIPTION_PLANS.items()}
     }), 200
 
 
 @subscriptions_bp.route('/current', methods=['GET'])
 @jwt_required()
+@load_user
 def get_current_subscription():
     """Get current user's subscription"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    user = g.user
     
-    if not user:
-        return jsonify({'message': 'User not found'}), 404
-    
-    subscription = Subscription.get_active_subscription(current_user_id)
+    subscription = Subscription.get_active_subscription(user.id)
     
     return jsonify({
         'user_subscription': {
@@ -49,31 +46,28 @@ def get_current_subscription():
 
 @subscriptions_bp.route('/usage', methods=['GET'])
 @jwt_required()
+@load_user
 def get_usage_stats():
     """Get user's usage statistics"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if not user:
-        return jsonify({'message': 'User not found'}), 404
+    user = g.user
     
     # Get quiz count for current month
     from datetime import datetime, timezone
     from app.models.quiz import Quiz
+    from app.models.file import File
     
     current_month_start = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     
-    quiz_count_this_month = Quiz.query.filter(
-        Quiz.user_id == current_user_id,
-        Quiz.created_at >= current_month_start
-    ).count()
-    
-    # Get total stats
-    total_quizzes = Quiz.query.filter_by(user_id=current_user_id).count()
-    published_quizzes = Quiz.query.filter_by(user_id=current_user_id, status='published').count()
-    
-    from app.models.file import File
-    total_files = File.query.filter_by(user_id=current_user_id).count()
+    # All counts in one round-trip: one pass over the user's quizzes plus a file count subquery
+    total_files_subquery = db.select(db.func.count(File.id))\
+                             .where(File.user_id == user.id)\
+                             .scalar_subquery()
+    total_quizzes, quiz_count_this_month, published_quizzes, total_files = db.session.query(
+        db.func.count(Quiz.id),
+        db.func.count(Quiz.id).filter(Quiz.created_at >= current_month_start),
+        db.func.count(Quiz.id).filter(Quiz.status == 'published'),
+        total_files_subquery
+    ).filter(Quiz.user_id == user.id).one()
     
     return jsonify({
         'usage': {
@@ -91,15 +85,10 @@ def get_usage_stats():
 @subscriptions_bp.route('/create-checkout-session', methods=['POST'])
 @jwt_required()
 @validate_json(['plan'])
+@load_user
 def create_checkout_session():
     """Create Stripe checkout session for subscription"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if not user:
-        return jsonify({'message': 'User not found'}), 404
-    
-    data = request.get_json()
+    data = g.json_body
     plan = data['plan']
     
     from app.config import BaseConfig
@@ -120,24 +109,22 @@ def create_checkout_session():
 
 @subscriptions_bp.route('/cancel', methods=['POST'])
 @jwt_required()
+@load_user
 def cancel_subscription():
     """Cancel current subscription"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if not user:
-        return jsonify({'message': 'User not found'}), 404
+    user = g.user
     
     if user.subscription_plan == 'free':
         return jsonify({'message': 'Cannot cancel free plan'}), 400
     
-    subscription = Subscription.get_active_subscription(current_user_id)
+    subscription = Subscription.get_active_subscription(user.id)
     
     if not subscription:
         return jsonify({'message': 'No active subscription found'}), 404
     
-    # Cancel subscription (at period end)
+    # Cancel subscription (at period end); Stripe is updated in the background
     subscription.cancel(at_period_end=True)
+    sync_subscription_cancellation.delay(subscription.id)
     
     return jsonify({
         'message': 'Subscription will be canceled at the end of the current period',
@@ -147,16 +134,13 @@ def cancel_subscription():
 
 @subscriptions_bp.route('/reactivate', methods=['POST'])
 @jwt_required()
+@load_user
 def reactivate_subscription():
     """Reactivate a canceled subscription"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if not user:
-        return jsonify({'message': 'User not found'}), 404
+    user = g.user
     
     subscription = Subscription.query.filter_by(
-        user_id=current_user_id
+        user_id=user.id
     ).order_by(Subscription.created_at.desc()).first()
     
     if not subscription:
@@ -165,8 +149,9 @@ def reactivate_subscription():
     if not subscription.cancel_at_period_end:
         return jsonify({'message': 'Subscription is not canceled'}), 400
     
-    # Reactivate subscription
+    # Reactivate subscription; Stripe is updated in the background
     subscription.reactivate()
+    sync_subscription_cancellation.delay(subscription.id)
     
     return jsonify({
         'message': 'Subscription reactivated successfully',
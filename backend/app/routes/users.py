@@ -1,25 +1,23 @@
 """
 User Routes
 """
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, jsonify, g
+from flask_jwt_extended import jwt_required
 
 from app import db
-from app.models.user import User
-from app.utils.decorators import validate_json
+from app.models.quiz import Quiz, evict_shared_quiz
+from app.routes.auth import is_strong_password
+from app.utils.decorators import validate_json, load_user
 
 users_bp = Blueprint('users', __name__)
 
 
 @users_bp.route('/profile', methods=['GET'])
 @jwt_required()
+@load_user
 def get_profile():
     """Get current user profile"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if not user:
-        return jsonify({'message': 'User not found'}), 404
+    user = g.user
     
     return jsonify({
         'user': user.to_dict(include_sensitive=True)
@@ -29,15 +27,12 @@ def get_profile():
 @users_bp.route('/profile', methods=['PUT'])
 @jwt_required()
 @validate_json()
+@load_user
 def update_profile():
     """Update user profile"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if not user:
-        return jsonify({'message': 'User not found'}), 404
+    user = g.user
     
-    data = request.get_json()
+    data = g.json_body
     
     # Update allowed fields
     allowed_fields = ['first_name', 'last_name', 'school_name', 'subject_areas', 'bio']
@@ -56,15 +51,12 @@ def update_profile():
 @users_bp.route('/change-password', methods=['POST'])
 @jwt_required()
 @validate_json(['current_password', 'new_password'])
+@load_user
 def change_password():
     """Change user password"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if not user:
-        return jsonify({'message': 'User not found'}), 404
+    user = g.user
     
-    data = request.get_json()
+    data = g.json_body
     current_password = data['current_password']
     new_password = data['new_password']
     
@@ -72,9 +64,10 @@ def change_password():
     if not user.check_password(current_password):
         return jsonify({'message': 'Current password is incorrect'}), 400
     
-    # Validate new password strength
-    if len(new_password) < 8:
-        return jsonify({'message': 'New password must be at least 8 characters long'}), 400
+    # Validate new password strength (and its length cap) as registration does
+    is_strong, message = is_strong_password(new_password)
+    if not is_strong:
+        return jsonify({'message': message}), 400
     
     # Update password
     user.set_password(new_password)
@@ -86,23 +79,26 @@ def change_password():
 @users_bp.route('/delete-account', methods=['DELETE'])
 @jwt_required()
 @validate_json(['password'])
+@load_user
 def delete_account():
     """Delete user account"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    user = g.user
     
-    if not user:
-        return jsonify({'message': 'User not found'}), 404
-    
-    data = request.get_json()
+    data = g.json_body
     password = data['password']
     
     # Verify password
     if not user.check_password(password):
         return jsonify({'message': 'Password is incorrect'}), 400
     
-    # Delete user and all related data (cascade delete)
+    # Shared quiz payloads to evict, since the database cascade skips the quiz events
+    share_tokens = db.session.scalars(
+        db.select(Quiz.share_token).where(Quiz.user_id == user.id, Quiz.share_token.isnot(None))
+    ).all()
+    
+    # Delete user; related rows go with it via ON DELETE CASCADE, without being loaded
     db.session.delete(user)
     db.session.commit()
+    evict_shared_quiz(*share_tokens)
     
     return jsonify({'message': 'Account deleted successfully'}), 200
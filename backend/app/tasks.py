@@ -0,0 +1,269 @@
+"""
+Background Tasks
+"""
+import time
+import json
+import hashlib
+from dataclasses import asdict
+import orjson
+import redis
+import stripe
+from flask import current_app
+
+from app import celery, db, redis_client
+from app.ai.document_processor import DocumentProcessor
+from app.ai.question_generator import GeneratedQuestion, get_question_generator
+
+document_processor = DocumentProcessor()
+
+# Extraction results are cached by content hash so re-uploads of the same
+# document skip text extraction entirely
+EXTRACTION_CACHE_TTL = 24 * 60 * 60  # 1 day
+
+# Generated questions are cached by source text and parameters so regenerating
+# from the same input skips the NLP and transformer passes; bump the version
+# whenever the models or prompts change
+GENERATION_CACHE_VERSION = 1
+GENERATION_CACHE_TTL = 24 * 60 * 60  # 1 day
+
+# Longest a counter flush may hold its lock before another worker can take over
+COUNTER_FLUSH_LOCK_TIMEOUT = 5 * 60  # 5 minutes
+
+
+def extract_text_cached(file_path, file_extension, content_hash):
+    """Extract text from a file, reusing a cached result for identical content"""
+    cache_key = f"extracted:{content_hash}:{file_extension}"
+    
+    try:
+        cached = redis_client.get(cache_key)
+        if cached:
+            return orjson.loads(cached)
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Extraction cache unavailable: {str(e)}")
+    
+    result = document_processor.extract_text(file_path, file_extension)
+    
+    if result['success']:
+        try:
+            redis_client.setex(cache_key, EXTRACTION_CACHE_TTL, orjson.dumps(result))
+        except redis.RedisError as e:
+            current_app.logger.warning(f"Extraction cache unavailable: {str(e)}")
+    
+    return result
+
+
+def generate_questions_cached(text, num_questions, question_types, difficulty_level):
+    """Generate questions for the text, reusing a cached result for identical input"""
+    params = json.dumps([num_questions, sorted(question_types), difficulty_level])
+    digest = hashlib.sha256(f"{params}\n{text}".encode('utf-8')).hexdigest()
+    cache_key = f"generated:v{GENERATION_CACHE_VERSION}:{digest}"
+    
+    try:
+        cached = redis_client.get(cache_key)
+        if cached:
+            return [GeneratedQuestion(**q) for q in orjson.loads(cached)]
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Generation cache unavailable: {str(e)}")
+    
+    generated_questions = get_question_generator().generate_questions(
+        text=text,
+        num_questions=num_questions,
+        question_types=question_types,
+        difficulty_level=difficulty_level
+    )
+    
+    if generated_questions:
+        try:
+            redis_client.setex(
+                cache_key,
+                GENERATION_CACHE_TTL,
+                orjson.dumps([asdict(q) for q in generated_questions])
+            )
+        except redis.RedisError as e:
+            current_app.logger.warning(f"Generation cache unavailable: {str(e)}")
+    
+    return generated_questions
+
+
+@celery.task
+def extract_file_text(file_id):
+    """Extract and store the text of an uploaded file"""
+    from app.models.file import File
+    
+    file_record = db.session.get(File, file_id)
+    if not file_record:
+        return
+    
+    try:
+        extraction_result = extract_text_cached(
+            file_record.get_absolute_path(),
+            file_record.file_extension,
+            file_record.content_hash
+        )
+        
+        if extraction_result['success']:
+            file_record.extracted_text = extraction_result['text']
+            file_record.page_count = extraction_result['metadata'].get('page_count')
+            file_record.mark_as_processed(success=True)
+            file_record.calculate_word_count()
+        else:
+            file_record.mark_as_processed(success=False, error=extraction_result['error'])
+    
+    except Exception as e:
+        file_record.mark_as_processed(success=False, error=str(e))
+    
+    db.session.commit()
+
+
+@celery.task
+def generate_quiz_questions(quiz_id):
+    """Generate and store the questions of a quiz created by the generate-quiz endpoint"""
+    from app.models.quiz import Quiz
+    from app.models.question import Question
+    from app.models.user import User
+    
+    quiz = db.session.get(Quiz, quiz_id)
+    
+    # Late acks mean a task can be redelivered after it already finished; only a
+    # pending quiz still needs its questions (and still holds its quota charge)
+    if not quiz or quiz.generation_status != 'pending':
+        return
+    
+    params = quiz.get_generation_parameters()
+    
+    try:
+        start_time = time.time()
+        
+        generated_questions = generate_questions_cached(
+            text=quiz.source_text,
+            num_questions=quiz.total_questions,
+            question_types=quiz.get_question_types_list(),
+            difficulty_level=params.get('difficulty_level', 'medium')
+        )
+        
+        # Save questions to database in one multi-row INSERT; generated ids aren't
+        # fetched back (no RETURNING) since questions are always served from a fresh
+        # row query (Quiz._serialize_questions), never from these objects
+        question_rows = [
+            {
+                'question_text': q.question_text,
+                'question_type': q.question_type,
+                'options': q.options or None,
+                'correct_answer': q.correct_answer,
+                'explanation': q.explanation,
+                'difficulty_level': q.difficulty_level,
+                'topic': q.topic,
+                'keywords': q.keywords or None,
+                'bloom_taxonomy_level': q.bloom_taxonomy_level,
+                'confidence_score': q.confidence_score,
+                'source_sentence': q.source_sentence,
+                'order_index': i + 1,
+                'quiz_id': quiz.id
+            }
+            for i, q in enumerate(generated_questions)
+        ]
+        if question_rows:
+            db.session.execute(db.insert(Question), question_rows)
+        
+        # Bulk inserts skip the per-question events that maintain the count
+        quiz.question_count = len(question_rows)
+        
+        # Update quiz metadata; stored in the same commit as the questions
+        quiz.ai_model_used = 'transformers + spacy'
+        quiz.generation_time = time.time() - start_time
+        quiz.generation_status = 'completed'
+        db.session.commit()
+    
+    except Exception as e:
+        db.session.rollback()
+        quiz.generation_status = 'failed'
+        quiz.generation_error = str(e)
+        
+        # Give back the quota charged when the generation was queued
+        user = db.session.get(User, quiz.user_id)
+        if user:
+            user.release_quiz_count(quiz.created_at)
+        db.session.commit()
+
+
+def _take_buffered_counts(key):
+    """Move a Redis counter hash aside and return ({id: count}, key to delete once stored)"""
+    # Counts arriving during the flush start a fresh hash; a batch left over
+    # from an interrupted flush is returned first
+    flushing_key = f"{key}:flushing"
+    if not redis_client.exists(flushing_key):
+        try:
+            redis_client.rename(key, flushing_key)
+        except redis.ResponseError:
+            return {}, flushing_key  # Nothing buffered
+    
+    counts = redis_client.hgetall(flushing_key)
+    return {int(row_id): int(delta) for row_id, delta in counts.items()}, flushing_key
+
+
+def _flush_buffered_counts(key, add_counts):
+    """Write a Redis counter hash back with add_counts, one worker at a time"""
+    # Overlapping flushes would both pick up a leftover batch and count it twice
+    lock = redis_client.lock(f"{key}:lock", timeout=COUNTER_FLUSH_LOCK_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        return
+    
+    try:
+        counts, flushing_key = _take_buffered_counts(key)
+        if counts:
+            add_counts(counts)
+            db.session.commit()
+        
+        redis_client.delete(flushing_key)
+    finally:
+        lock.release()
+
+
+@celery.task
+def flush_download_counts():
+    """Write the download counts buffered in Redis back to the files table"""
+    from app.models.file import File, DOWNLOAD_COUNTS_KEY
+    
+    _flush_buffered_counts(DOWNLOAD_COUNTS_KEY, File.add_download_counts)
+
+
+@celery.task
+def flush_view_counts():
+    """Write the shared quiz view counts buffered in Redis back to the quizzes table"""
+    from app.models.quiz import Quiz, VIEW_COUNTS_KEY
+    
+    _flush_buffered_counts(VIEW_COUNTS_KEY, Quiz.add_view_counts)
+
+
+@celery.task(
+    bind=True,
+    autoretry_for=(stripe.error.APIConnectionError, stripe.error.RateLimitError),
+    retry_backoff=True,
+    max_retries=8
+)
+def sync_subscription_cancellation(self, subscription_id):
+    """Push a subscription's local cancellation state to Stripe"""
+    from app.models.subscription import Subscription
+    
+    subscription = db.session.get(Subscription, subscription_id)
+    api_key = current_app.config.get('STRIPE_SECRET_KEY')
+    if not subscription or not subscription.stripe_subscription_id or not api_key:
+        return
+    
+    # Sends the current local state rather than the requested change, so retries
+    # and out-of-order cancel/reactivate tasks settle on what the database says;
+    # the key ties Stripe's deduplication to that state
+    updated_at = int(subscription.updated_at.timestamp())
+    if subscription.status == 'canceled':
+        stripe.Subscription.cancel(
+            subscription.stripe_subscription_id,
+            api_key=api_key,
+            idempotency_key=f"subscription-{subscription.id}-cancel"
+        )
+    else:
+        stripe.Subscription.modify(
+            subscription.stripe_subscription_id,
+            cancel_at_period_end=bool(subscription.cancel_at_period_end),
+            api_key=api_key,
+            idempotency_key=f"subscription-{subscription.id}-{subscription.cancel_at_period_end}-{updated_at}"
+        )
@@ -1,75 +1,104 @@
 """
 Custom Decorators
 """
-from functools import wraps
-from flask import jsonify, request
-from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
-from app.models.user import User
+from functools import partial, wraps
+from flask import g, jsonify, request
+from datetime import datetime, timezone
+from flask_jwt_extended import get_jwt, get_jwt_identity, verify_jwt_in_request
+from sqlalchemy.orm import defer
+from app import db
+from app.models.user import User, plan_has_feature, subscription_is_active
+
+# Subscription plans from lowest to highest tier
+_PLAN_LEVELS = {'free': 0, 'premium': 1, 'school': 2}
 
 
 def require_auth(f):
     """Decorator to require authentication"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        try:
-            verify_jwt_in_request()
-            return f(*args, **kwargs)
-        except Exception as e:
-            return jsonify({'message': 'Authentication required'}), 401
+        verify_jwt_in_request()
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def get_current_user():
+    """Get the authenticated user, loading it at most once per request"""
+    if 'user' not in g:
+        g.user = db.session.get(User, get_jwt_identity())
+    return g.user
+
+
+def load_user(f):
+    """Decorator to load the authenticated user into g.user (apply after jwt_required)"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not get_current_user():
+            return jsonify({'message': 'User not found'}), 404
+        return f(*args, **kwargs)
     return decorated_function
 
 
+def _subscription_claims():
+    """Get (plan, status, expires_at) from the token, or from the user for older tokens"""
+    claims = get_jwt()
+    if 'plan' in claims:
+        expires_at = claims.get('subscription_expires_at')
+        if expires_at is not None:
+            expires_at = datetime.fromtimestamp(expires_at, timezone.utc)
+        return claims['plan'], claims.get('subscription_status'), expires_at
+    
+    user = get_current_user()
+    if not user:
+        return None
+    return user.subscription_plan, user.subscription_status, user.subscription_expires_at
+
+
 def require_role(role):
     """Decorator to require specific role"""
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            try:
-                verify_jwt_in_request()
-                current_user_id = get_jwt_identity()
-                user = User.query.get(current_user_id)
-                
-                if not user or user.role != role:
-                    return jsonify({'message': 'Insufficient permissions'}), 403
-                
-                return f(*args, **kwargs)
-            except Exception as e:
-                return jsonify({'message': 'Authentication required'}), 401
+            verify_jwt_in_request()
+            # Role is carried in the token; older tokens fall back to the database
+            user_role = get_jwt().get('role')
+            if user_role is None:
+                user_role = db.session.query(User.role).filter_by(id=get_jwt_identity()).scalar()
+            
+            if user_role != role:
+                return jsonify({'message': 'Insufficient permissions'}), 403
+            
+            return f(*args, **kwargs)
         return decorated_function
     return decorator
 
 
 def require_subscription(plan_level='free'):
     """Decorator to require specific subscription level"""
+    required_level = _PLAN_LEVELS.get(plan_level, 0)
+    
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            try:
-                verify_jwt_in_request()
-                current_user_id = get_jwt_identity()
-                user = User.query.get(current_user_id)
-                
-                if not user:
-                    return jsonify({'message': 'User not found'}), 404
-                
-                if not user.is_subscription_active():
-                    return jsonify({'message': 'Active subscription required'}), 403
-                
-                # Check subscription level hierarchy
-                plan_hierarchy = {'free': 0, 'premium': 1, 'school': 2}
-                user_level = plan_hierarchy.get(user.subscription_plan, 0)
-                required_level = plan_hierarchy.get(plan_level, 0)
-                
-                if user_level < required_level:
-                    return jsonify({
-                        'message': f'{plan_level.title()} subscription required',
-                        'current_plan': user.subscription_plan,
-                        'required_plan': plan_level
-                    }), 403
-                
-                return f(*args, **kwargs)
-            except Exception as e:
-                return jsonify({'message': 'Authentication required'}), 401
+            verify_jwt_in_request()
+            subscription = _subscription_claims()
+            
+            if not subscription:
+                return jsonify({'message': 'User not found'}), 404
+            
+            plan, status, expires_at = subscription
+            if not subscription_is_active(plan, status, expires_at):
+                return jsonify({'message': 'Active subscription required'}), 403
+            
+            # Check subscription level hierarchy
+            if _PLAN_LEVELS.get(plan, 0) < required_level:
+                return jsonify({
+                    'message': f'{plan_level.title()} subscription required',
+                    'current_plan': plan,
+                    'required_plan': plan_level
+                }), 403
+            
+            return f(*args, **kwargs)
         return decorated_function
     return decorator
 
@@ -79,44 +108,50 @@ def require_feature(feature_name):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            try:
-                verify_jwt_in_request()
-                current_user_id = get_jwt_identity()
-                user = User.query.get(current_user_id)
-                
-                if not user:
-                    return jsonify({'message': 'User not found'}), 404
-                
-                if not user.has_feature(feature_name):
-                    return jsonify({
-                        'message': f'Feature "{feature_name}" not available in your plan',
-                        'current_plan': user.subscription_plan
-                    }), 403
-                
-                return f(*args, **kwargs)
-            except Exception as e:
-                return jsonify({'message': 'Authentication required'}), 401
+            verify_jwt_in_request()
+            subscription = _subscription_claims()
+            
+            if not subscription:
+                return jsonify({'message': 'User not found'}), 404
+            
+            plan = subscription[0]
+            if not plan_has_feature(plan, feature_name):
+                return jsonify({
+                    'message': f'Feature "{feature_name}" not available in your plan',
+                    'current_plan': plan
+                }), 403
+            
+            return f(*args, **kwargs)
         return decorated_function
     return decorator
 
 
-def validate_json(required_fields=None):
-    """Decorator to validate JSON request data"""
+def validate_json(required_fields=None, choices=None):
+    """Decorator to validate JSON request data, leaving the parsed body in g.json_body
+    
+    choices maps fields to their allowed values (checked when the field is given), so
+    values bound for ENUM columns are rejected with a 400 rather than a database error.
+    """
+    # Fixed per route, so frozen once when the route is decorated
+    required_fields = tuple(required_fields or ())
+    choices = tuple((choices or {}).items())
+    
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             if not request.is_json:
                 return jsonify({'message': 'Request must be JSON'}), 400
             
+            # Parsed once (by orjson, see app.json) and handed to the view
             data = request.get_json()
             if not data:
                 return jsonify({'message': 'No JSON data provided'}), 400
             
+            if not isinstance(data, dict):
+                return jsonify({'message': 'JSON body must be an object'}), 400
+            
             if required_fields:
-                missing_fields = []
-                for field in required_fields:
-                    if field not in data or data[field] is None:
-                        missing_fields.append(field)
+                missing_fields = [field for field in required_fields if data.get(field) is None]
                 
                 if missing_fields:
                     return jsonify({
@@ -124,35 +159,59 @@ def validate_json(required_fields=None):
                         'missing_fields': missing_fields
                     }), 400
             
+            if choices:
+                invalid_fields = [
+                    field for field, allowed in choices
+                    if data.get(field) is not None and data[field] not in allowed
+                ]
+                
+                if invalid_fields:
+                    return jsonify({
+                        'message': 'Invalid field values',
+                        'invalid_fields': invalid_fields
+                    }), 400
+            
+            g.json_body = data
             return f(*args, **kwargs)
         return decorated_function
     return decorator
 
 
-def check_quiz_ownership(f):
-    """Decorator to check if user owns the quiz"""
+def check_quiz_ownership(f=None, *, options=None):
+    """Decorator to check if user owns the quiz, leaving it in g.quiz
+    
+    Used bare, or as check_quiz_ownership(options=[...]) to load the quiz with the
+    loader options its view needs instead of the default deferred text columns.
+    """
+    if f is None:
+        return partial(check_quiz_ownership, options=options)
+    
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        try:
-            verify_jwt_in_request()
-            current_user_id = get_jwt_identity()
-            
-            # Get quiz_id from URL parameters
-            quiz_id = kwargs.get('quiz_id') or request.view_args.get('quiz_id')
-            if not quiz_id:
-                return jsonify({'message': 'Quiz ID required'}), 400
-            
-            from app.models.quiz import Quiz
-            quiz = Quiz.query.get(quiz_id)
-            if not quiz:
-                return jsonify({'message': 'Quiz not found'}), 404
-            
-            if quiz.user_id != current_user_id:
-                return jsonify({'message': 'You do not own this quiz'}), 403
-            
-            return f(*args, **kwargs)
-        except Exception as e:
-            return jsonify({'message': 'Authentication required'}), 401
+        verify_jwt_in_request()
+        current_user_id = get_jwt_identity()
+        
+        # Get quiz_id from URL parameters
+        quiz_id = kwargs.get('quiz_id') or request.view_args.get('quiz_id')
+        if not quiz_id:
+            return jsonify({'message': 'Quiz ID required'}), 400
+        
+        # Large text columns load only if the handler reads them, unless it says otherwise
+        from app.models.quiz import Quiz
+        loader_options = options if options is not None else (
+            defer(Quiz.source_text), defer(Quiz.generation_parameters)
+        )
+        quiz = Quiz.query.options(*loader_options).filter_by(id=quiz_id).first()
+        if not quiz:
+            return jsonify({'message': 'Quiz not found'}), 404
+        
+        if quiz.user_id != current_user_id:
+            return jsonify({'message': 'You do not own this quiz'}), 403
+        
+        # Handed to the view so it doesn't load the quiz again
+        g.quiz = quiz
+        
+        return f(*args, **kwargs)
     return decorated_function
 
 
@@ -160,24 +219,25 @@ def check_file_ownership(f):
     """Decorator to check if user owns the file"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        try:
-            verify_jwt_in_request()
-            current_user_id = get_jwt_identity()
-            
-            # Get file_id from URL parameters
-            file_id = kwargs.get('file_id') or request.view_args.get('file_id')
-            if not file_id:
-                return jsonify({'message': 'File ID required'}), 400
-            
-            from app.models.file import File
-            file = File.query.get(file_id)
-            if not file:
-                return jsonify({'message': 'File not found'}), 404
-            
-            if file.user_id != current_user_id:
-                return jsonify({'message': 'You do not own this file'}), 403
-            
-            return f(*args, **kwargs)
-        except Exception as e:
-            return jsonify({'message': 'Authentication required'}), 401
+        verify_jwt_in_request()
+        current_user_id = get_jwt_identity()
+        
+        # Get file_id from URL parameters
+        file_id = kwargs.get('file_id') or request.view_args.get('file_id')
+        if not file_id:
+            return jsonify({'message': 'File ID required'}), 400
+        
+        # Extracted text loads only if the handler reads it
+        from app.models.file import File
+        file = File.query.options(defer(File.extracted_text)).filter_by(id=file_id).first()
+        if not file:
+            return jsonify({'message': 'File not found'}), 404
+        
+        if file.user_id != current_user_id:
+            return jsonify({'message': 'You do not own this file'}), 403
+        
+        # Handed to the view so it doesn't load the file again
+        g.file = file
+        
+        return f(*args, **kwargs)
     return decorated_function
@@ -1,104 +1,91 @@
 """
 Error Handlers
 """
-from flask import jsonify
+import orjson
+from flask import current_app
 from werkzeug.exceptions import HTTPException
 from sqlalchemy.exc import SQLAlchemyError
 from marshmallow import ValidationError
 import logging
 
 
+def _error_body(error, message):
+    """Serialize a fixed error payload once, at import"""
+    return orjson.dumps({'error': error, 'message': message})
+
+
+# Bodies of the errors whose payload never varies, so handlers skip encoding
+_DATABASE_ERROR_BODY = _error_body('Database Error', 'A database error occurred')
+_INTERNAL_ERROR_BODY = _error_body('Internal Server Error', 'An unexpected error occurred')
+
+# HTTP errors answered straight from this table by one shared handler
+_STATIC_ERROR_BODIES = {
+    401: _error_body('Unauthorized', 'Authentication required'),
+    403: _error_body('Forbidden', 'You do not have permission to access this resource'),
+    404: _error_body('Not Found', 'The requested resource was not found'),
+    413: _error_body('File Too Large', 'The uploaded file is too large'),
+    415: _error_body('Unsupported Media Type', 'The file type is not supported'),
+    429: _error_body('Rate Limit Exceeded', 'Too many requests. Please try again later.'),
+}
+
+
+def _body_response(body, status):
+    """Wrap an encoded JSON body in a response with its status"""
+    # The body is already bytes, so the WSGI server can take it without the encoding pass
+    return current_app.response_class(
+        body, status=status, mimetype='application/json', direct_passthrough=True
+    )
+
+
+def _json_response(payload, status):
+    """Encode an error payload with orjson straight into a response with its status"""
+    # Non-string keys for validation details keyed by list index
+    return _body_response(orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS), status)
+
+
 def register_error_handlers(app):
     """Register error handlers for the Flask app"""
+    # Tracebacks are always kept in debug; elsewhere LOG_TRACEBACKS decides
+    log_tracebacks = app.debug or app.config.get('LOG_TRACEBACKS', True)
     
     @app.errorhandler(ValidationError)
     def handle_validation_error(error):
         """Handle Marshmallow validation errors"""
-        return jsonify({
+        return _json_response({
             'error': 'Validation Error',
             'message': 'Invalid input data',
             'details': error.messages
-        }), 400
+        }, 400)
     
     @app.errorhandler(SQLAlchemyError)
     def handle_database_error(error):
         """Handle database errors"""
-        app.logger.error(f'Database error: {str(error)}')
-        return jsonify({
-            'error': 'Database Error',
-            'message': 'A database error occurred'
-        }), 500
-    
-    @app.errorhandler(404)
-    def handle_not_found(error):
-        """Handle 404 errors"""
-        return jsonify({
-            'error': 'Not Found',
-            'message': 'The requested resource was not found'
-        }), 404
-    
-    @app.errorhandler(401)
-    def handle_unauthorized(error):
-        """Handle 401 errors"""
-        return jsonify({
-            'error': 'Unauthorized',
-            'message': 'Authentication required'
-        }), 401
-    
-    @app.errorhandler(403)
-    def handle_forbidden(error):
-        """Handle 403 errors"""
-        return jsonify({
-            'error': 'Forbidden',
-            'message': 'You do not have permission to access this resource'
-        }), 403
-    
-    @app.errorhandler(429)
-    def handle_rate_limit(error):
-        """Handle rate limit errors"""
-        return jsonify({
-            'error': 'Rate Limit Exceeded',
-            'message': 'Too many requests. Please try again later.'
-        }), 429
+        app.logger.error('Database error: %s', error)
+        return _body_response(_DATABASE_ERROR_BODY, 500)
     
-    @app.errorhandler(413)
-    def handle_file_too_large(error):
-        """Handle file too large errors"""
-        return jsonify({
-            'error': 'File Too Large',
-            'message': 'The uploaded file is too large'
-        }), 413
+    def handle_static_error(error):
+        """Handle HTTP errors with a fixed payload"""
+        return _body_response(_STATIC_ERROR_BODIES[error.code], error.code)
     
-    @app.errorhandler(415)
-    def handle_unsupported_media_type(error):
-        """Handle unsupported media type errors"""
-        return jsonify({
-            'error': 'Unsupported Media Type',
-            'message': 'The file type is not supported'
-        }), 415
+    for code in _STATIC_ERROR_BODIES:
+        app.register_error_handler(code, handle_static_error)
     
     @app.errorhandler(500)
     def handle_internal_error(error):
         """Handle internal server errors"""
-        app.logger.error(f'Internal server error: {str(error)}')
-        return jsonify({
-            'error': 'Internal Server Error',
-            'message': 'An unexpected error occurred'
-        }), 500
+        app.logger.error('Internal server error: %s', error)
+        return _body_response(_INTERNAL_ERROR_BODY, 500)
     
     @app.errorhandler(HTTPException)
     def handle_http_exception(error):
         """Handle other HTTP exceptions"""
-        return jsonify({
+        return _json_response({
             'error': error.name,
             'message': error.description
-        }), error.code
+        }, error.code)
     
     @app.errorhandler(Exception)
     def handle_generic_exception(error):
         """Handle any other exceptions"""
-        app.logger.error(f'Unhandled exception: {str(error)}', exc_info=True)
-        return jsonify({
-            'error': 'Internal Server Error',
-            'message': 'An unexpected error occurred'
-        }), 500
+        app.logger.error('Unhandled exception: %s', error, exc_info=log_tracebacks)
+        return _body_response(_INTERNAL_ERROR_BODY, 500)
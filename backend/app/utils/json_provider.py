@@ -0,0 +1,28 @@
+"""
+JSON Provider
+"""
+import orjson
+from flask.json.provider import DefaultJSONProvider
+
+# Allow int keys (e.g. per-id count mappings) like the standard json module does
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes and decodes with orjson"""
+    
+    def dumps(self, obj, **kwargs):
+        """Serialize data as a JSON string"""
+        return orjson.dumps(obj, default=self.default, option=_ORJSON_OPTIONS).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        """Deserialize data from a JSON string or bytes"""
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        """Build a JSON response, encoding straight to bytes"""
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=_ORJSON_OPTIONS),
+            mimetype=self.mimetype
+        )
@@ -0,0 +1,14 @@
+"""
+Celery Worker Entry Point
+
+    celery -A celery_worker.celery worker --loglevel=info
+    celery -A celery_worker.celery beat --loglevel=info
+"""
+import os
+from app import create_app, celery
+
+__all__ = ['app', 'celery']
+
+# Configure Celery (broker, task modules, routes, beat schedule) and bind the
+# Flask app to its tasks before the worker or beat reads any of it
+app = create_app(os.getenv('FLASK_ENV', 'production'))
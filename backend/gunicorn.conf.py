@@ -0,0 +1,24 @@
+"""
+Gunicorn Configuration
+"""
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', '4'))
+
+# Threaded workers: Argon2 password hashing and model inference release the GIL,
+# so other requests in the same worker keep running while one is hashing
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+# Import the app once in the master so workers fork with it already loaded
+preload_app = True
+
+
+def when_ready(server):
+    """Load the AI models in the master so forked workers share their pages copy-on-write"""
+    if os.getenv('AI_PRELOAD_MODELS', 'true').lower() != 'true':
+        return
+    
+    from app.ai.question_generator import get_question_generator
+    get_question_generator().warm_up()
@@ -4,10 +4,12 @@ Revision ID: 001
 Revises:
 Create Date: 2025-09-09 11:45:00.000000
 
+Creates the schema of the original models (users, files, quizzes, questions,
+subscriptions), which later revisions alter in place.
+
 """
 from alembic import op
 import sqlalchemy as sa
-from sqlalchemy.dialects import postgresql
 
 # revision identifiers, used by Alembic.
 revision = '001'
@@ -17,117 +19,142 @@ depends_on = None
 
 
 def upgrade():
-    # ### commands auto generated by Alembic - please adjust! ###
-    op.create_table('user',
+    op.create_table('users',
         sa.Column('id', sa.Integer(), nullable=False),
         sa.Column('email', sa.String(length=120), nullable=False),
+        sa.Column('password_hash', sa.String(length=255), nullable=False),
         sa.Column('first_name', sa.String(length=50), nullable=False),
         sa.Column('last_name', sa.String(length=50), nullable=False),
-        sa.Column('password_hash', sa.String(length=256), nullable=False),
         sa.Column('role', sa.String(length=20), nullable=False),
-        sa.Column('school_name', sa.String(length=100), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        sa.Column('is_verified', sa.Boolean(), nullable=False),
+        sa.Column('subscription_plan', sa.String(length=20), nullable=False),
+        sa.Column('subscription_status', sa.String(length=20), nullable=False),
+        sa.Column('subscription_expires_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('stripe_customer_id', sa.String(length=100), nullable=True),
+        sa.Column('quiz_count_current_month', sa.Integer(), nullable=False),
+        sa.Column('last_quiz_reset', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('school_name', sa.String(length=200), nullable=True),
         sa.Column('subject_areas', sa.Text(), nullable=True),
-        sa.Column('is_active', sa.Boolean(), nullable=True),
-        sa.Column('is_verified', sa.Boolean(), nullable=True),
-        sa.Column('verification_token', sa.String(length=100), nullable=True),
+        sa.Column('bio', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('last_login', sa.DateTime(timezone=True), nullable=True),
         sa.Column('reset_token', sa.String(length=100), nullable=True),
-        sa.Column('reset_token_expires', sa.DateTime(), nullable=True),
-        sa.Column('last_login', sa.DateTime(), nullable=True),
-        sa.Column('created_at', sa.DateTime(), nullable=True),
-        sa.Column('updated_at', sa.DateTime(), nullable=True),
-        sa.PrimaryKeyConstraint('id'),
-        sa.UniqueConstraint('email')
+        sa.Column('reset_token_expires', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('verification_token', sa.String(length=100), nullable=True),
+        sa.PrimaryKeyConstraint('id')
     )
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
 
-    op.create_table('file',
+    op.create_table('files',
         sa.Column('id', sa.Integer(), nullable=False),
         sa.Column('filename', sa.String(length=255), nullable=False),
         sa.Column('original_filename', sa.String(length=255), nullable=False),
         sa.Column('file_path', sa.String(length=500), nullable=False),
         sa.Column('file_size', sa.Integer(), nullable=False),
-        sa.Column('file_type', sa.String(length=10), nullable=False),
-        sa.Column('mime_type', sa.String(length=100), nullable=False),
-        sa.Column('content_hash', sa.String(length=64), nullable=False),
-        sa.Column('word_count', sa.Integer(), nullable=True),
-        sa.Column('page_count', sa.Integer(), nullable=True),
-        sa.Column('processing_status', sa.String(length=20), nullable=True),
-        sa.Column('processing_error', sa.Text(), nullable=True),
+        sa.Column('mime_type', sa.String(length=100), nullable=True),
+        sa.Column('file_extension', sa.String(length=10), nullable=True),
         sa.Column('extracted_text', sa.Text(), nullable=True),
+        sa.Column('extraction_status', sa.String(length=20), nullable=True),
+        sa.Column('extraction_error', sa.Text(), nullable=True),
+        sa.Column('page_count', sa.Integer(), nullable=True),
+        sa.Column('word_count', sa.Integer(), nullable=True),
+        sa.Column('character_count', sa.Integer(), nullable=True),
+        sa.Column('is_processed', sa.Boolean(), nullable=True),
+        sa.Column('processing_started_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('processing_completed_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('is_safe', sa.Boolean(), nullable=True),
+        sa.Column('virus_scan_status', sa.String(length=20), nullable=True),
+        sa.Column('content_hash', sa.String(length=64), nullable=True),
+        sa.Column('download_count', sa.Integer(), nullable=True),
+        sa.Column('last_accessed', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
         sa.Column('user_id', sa.Integer(), nullable=False),
-        sa.Column('created_at', sa.DateTime(), nullable=True),
-        sa.Column('updated_at', sa.DateTime(), nullable=True),
-        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
-        sa.PrimaryKeyConstraint('id'),
-        sa.UniqueConstraint('content_hash')
-    )
-
-    op.create_table('subscription',
-        sa.Column('id', sa.Integer(), nullable=False),
-        sa.Column('user_id', sa.Integer(), nullable=False),
-        sa.Column('plan_name', sa.String(length=50), nullable=False),
-        sa.Column('plan_level', sa.String(length=20), nullable=False),
-        sa.Column('stripe_subscription_id', sa.String(length=100), nullable=True),
-        sa.Column('stripe_customer_id', sa.String(length=100), nullable=True),
-        sa.Column('status', sa.String(length=20), nullable=False),
-        sa.Column('current_period_start', sa.DateTime(), nullable=True),
-        sa.Column('current_period_end', sa.DateTime(), nullable=True),
-        sa.Column('trial_end', sa.DateTime(), nullable=True),
-        sa.Column('cancel_at_period_end', sa.Boolean(), nullable=True),
-        sa.Column('usage_quiz_count', sa.Integer(), nullable=True),
-        sa.Column('usage_question_count', sa.Integer(), nullable=True),
-        sa.Column('usage_file_count', sa.Integer(), nullable=True),
-        sa.Column('usage_storage_mb', sa.Integer(), nullable=True),
-        sa.Column('created_at', sa.DateTime(), nullable=True),
-        sa.Column('updated_at', sa.DateTime(), nullable=True),
-        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
         sa.PrimaryKeyConstraint('id')
     )
 
-    op.create_table('quiz',
+    op.create_table('quizzes',
         sa.Column('id', sa.Integer(), nullable=False),
         sa.Column('title', sa.String(length=200), nullable=False),
         sa.Column('description', sa.Text(), nullable=True),
         sa.Column('source_text', sa.Text(), nullable=True),
-        sa.Column('difficulty_level', sa.String(length=20), nullable=False),
-        sa.Column('total_questions', sa.Integer(), nullable=False),
+        sa.Column('source_file_id', sa.Integer(), nullable=True),
+        sa.Column('difficulty_level', sa.String(length=20), nullable=True),
         sa.Column('question_types', sa.Text(), nullable=True),
+        sa.Column('total_questions', sa.Integer(), nullable=True),
+        sa.Column('ai_model_used', sa.String(length=100), nullable=True),
+        sa.Column('generation_time', sa.Float(), nullable=True),
         sa.Column('generation_parameters', sa.Text(), nullable=True),
-        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('is_public', sa.Boolean(), nullable=True),
         sa.Column('share_token', sa.String(length=100), nullable=True),
         sa.Column('view_count', sa.Integer(), nullable=True),
         sa.Column('download_count', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('published_at', sa.DateTime(timezone=True), nullable=True),
         sa.Column('user_id', sa.Integer(), nullable=False),
-        sa.Column('created_at', sa.DateTime(), nullable=True),
-        sa.Column('updated_at', sa.DateTime(), nullable=True),
-        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.ForeignKeyConstraint(['source_file_id'], ['files.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
         sa.PrimaryKeyConstraint('id'),
         sa.UniqueConstraint('share_token')
     )
 
-    op.create_table('question',
+    op.create_table('questions',
         sa.Column('id', sa.Integer(), nullable=False),
         sa.Column('question_text', sa.Text(), nullable=False),
-        sa.Column('question_type', sa.String(length=20), nullable=False),
-        sa.Column('correct_answer', sa.Text(), nullable=False),
+        sa.Column('question_type', sa.String(length=50), nullable=False),
+        sa.Column('difficulty_level', sa.String(length=20), nullable=True),
         sa.Column('options', sa.Text(), nullable=True),
+        sa.Column('correct_answer', sa.Text(), nullable=True),
         sa.Column('explanation', sa.Text(), nullable=True),
-        sa.Column('topic', sa.String(length=100), nullable=True),
-        sa.Column('difficulty_level', sa.String(length=20), nullable=False),
+        sa.Column('topic', sa.String(length=200), nullable=True),
+        sa.Column('keywords', sa.Text(), nullable=True),
+        sa.Column('bloom_taxonomy_level', sa.String(length=50), nullable=True),
+        sa.Column('confidence_score', sa.Float(), nullable=True),
+        sa.Column('source_sentence', sa.Text(), nullable=True),
         sa.Column('order_index', sa.Integer(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
         sa.Column('quiz_id', sa.Integer(), nullable=False),
-        sa.Column('created_at', sa.DateTime(), nullable=True),
-        sa.Column('updated_at', sa.DateTime(), nullable=True),
-        sa.ForeignKeyConstraint(['quiz_id'], ['quiz.id'], ),
+        sa.ForeignKeyConstraint(['quiz_id'], ['quizzes.id'], ),
         sa.PrimaryKeyConstraint('id')
     )
-    # ### end Alembic commands ###
+
+    op.create_table('subscriptions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('stripe_subscription_id', sa.String(length=100), nullable=True),
+        sa.Column('stripe_customer_id', sa.String(length=100), nullable=True),
+        sa.Column('stripe_price_id', sa.String(length=100), nullable=True),
+        sa.Column('plan_name', sa.String(length=50), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('current_period_start', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('current_period_end', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('cancel_at_period_end', sa.Boolean(), nullable=True),
+        sa.Column('canceled_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('amount', sa.Integer(), nullable=True),
+        sa.Column('currency', sa.String(length=3), nullable=True),
+        sa.Column('interval', sa.String(length=20), nullable=True),
+        sa.Column('trial_start', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('trial_end', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('usage_data', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('stripe_subscription_id')
+    )
 
 
 def downgrade():
-    # ### commands auto generated by Alembic - please adjust! ###
-    op.drop_table('question')
-    op.drop_table('quiz')
-    op.drop_table('subscription')
-    op.drop_table('file')
-    op.drop_table('user')
-    # ### end Alembic commands ###
\ No newline at end of file
+    op.drop_table('subscriptions')
+    op.drop_table('questions')
+    op.drop_table('quizzes')
+    op.drop_table('files')
+    op.drop_index('ix_users_email', table_name='users')
+    op.drop_table('users')
@@ -0,0 +1,197 @@
+"""Denormalized columns, native enums and query indexes
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-15 09:00:00.000000
+
+Brings a PostgreSQL database created from the previous models up to the current
+ones: question_count, full_name and the async generation columns, native ENUM
+types for the fixed vocabularies, server-side timestamp defaults, token columns
+sized for stored digests, and the indexes the listing and lookup queries use.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+# Values frozen as of this revision (see app/models/types.py)
+ENUMS = {
+    'question_type': ('multiple_choice', 'true_false', 'short_answer', 'essay'),
+    'difficulty_level': ('easy', 'medium', 'hard'),
+    'quiz_status': ('draft', 'published', 'archived'),
+    'user_role': ('teacher', 'school_admin'),
+    'plan_name': ('free', 'premium', 'school'),
+    'subscription_status': (
+        'incomplete', 'incomplete_expired', 'trialing', 'active',
+        'past_due', 'canceled', 'unpaid', 'paused'
+    ),
+    'billing_interval': ('day', 'week', 'month', 'year'),
+}
+
+# (table, column, enum type, previous VARCHAR length)
+ENUM_COLUMNS = (
+    ('questions', 'question_type', 'question_type', 50),
+    ('questions', 'difficulty_level', 'difficulty_level', 20),
+    ('quizzes', 'difficulty_level', 'difficulty_level', 20),
+    ('quizzes', 'status', 'quiz_status', 20),
+    ('users', 'role', 'user_role', 20),
+    ('subscriptions', 'plan_name', 'plan_name', 50),
+    ('subscriptions', 'status', 'subscription_status', 20),
+    ('subscriptions', 'interval', 'billing_interval', 20),
+)
+
+TIMESTAMPED_TABLES = ('users', 'quizzes', 'questions', 'files', 'subscriptions')
+
+TOKEN_LENGTH = 43
+
+
+def _enum(name):
+    return postgresql.ENUM(*ENUMS[name], name=name, create_type=False)
+
+
+def upgrade():
+    # New columns
+    op.add_column('quizzes', sa.Column('question_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('quizzes', sa.Column('generation_status', sa.String(length=20), nullable=True))
+    op.add_column('quizzes', sa.Column('generation_error', sa.Text(), nullable=True))
+    op.add_column('users', sa.Column('full_name', sa.String(length=101), nullable=True))
+
+    # The ORM supplies the count from here on; the server default only fills existing rows
+    op.execute(
+        'UPDATE quizzes SET question_count = '
+        '(SELECT count(*) FROM questions WHERE questions.quiz_id = quizzes.id)'
+    )
+    op.alter_column('quizzes', 'question_count', server_default=None)
+
+    # Maintained by User events from here on
+    op.execute("UPDATE users SET full_name = first_name || ' ' || last_name")
+
+    # Native ENUM types for the fixed vocabularies
+    bind = op.get_bind()
+    for name in ENUMS:
+        _enum(name).create(bind, checkfirst=True)
+
+    for table, column, enum_name, _ in ENUM_COLUMNS:
+        op.alter_column(
+            table, column,
+            type_=_enum(enum_name),
+            postgresql_using=f'{column}::text::{enum_name}'
+        )
+
+    # Usage data moves to JSONB so single keys can be updated server-side
+    op.alter_column(
+        'subscriptions', 'usage_data',
+        type_=postgresql.JSONB(),
+        postgresql_using="NULLIF(usage_data, '')::jsonb"
+    )
+
+    # Timestamps are filled in by the database
+    for table in TIMESTAMPED_TABLES:
+        op.alter_column(table, 'created_at', server_default=sa.func.now())
+        op.alter_column(table, 'updated_at', server_default=sa.func.now())
+    op.alter_column('users', 'last_quiz_reset', server_default=sa.func.now())
+
+    # Reset and verification tokens are now stored as digests, so outstanding
+    # plaintext tokens can no longer be matched; users request new ones
+    op.execute('UPDATE users SET reset_token = NULL, reset_token_expires = NULL, verification_token = NULL')
+    for column in ('reset_token', 'verification_token'):
+        op.alter_column(
+            'users', column,
+            type_=sa.String(length=TOKEN_LENGTH, collation='C'),
+            existing_type=sa.String(length=100)
+        )
+    op.alter_column(
+        'quizzes', 'share_token',
+        type_=sa.String(length=TOKEN_LENGTH, collation='C'),
+        existing_type=sa.String(length=100)
+    )
+
+    # Uniqueness moves to (partial) unique indexes
+    op.drop_index('ix_users_email', table_name='users')
+    op.create_index(
+        'ix_users_email_login', 'users', ['email'], unique=True,
+        postgresql_include=['password_hash', 'is_active', 'id']
+    )
+    op.create_index(
+        'ix_users_reset_token', 'users', ['reset_token'], unique=True,
+        postgresql_where=sa.text('reset_token IS NOT NULL')
+    )
+    op.create_index(
+        'ix_users_verification_token', 'users', ['verification_token'], unique=True,
+        postgresql_where=sa.text('verification_token IS NOT NULL')
+    )
+    op.create_index('ix_users_full_name', 'users', ['full_name'])
+
+    op.drop_constraint('quizzes_share_token_key', 'quizzes', type_='unique')
+    op.create_index(
+        'ix_quizzes_share_token', 'quizzes', ['share_token'], unique=True,
+        postgresql_where=sa.text('share_token IS NOT NULL')
+    )
+
+    # Listing and lookup indexes
+    op.create_index('ix_quizzes_user_status_created', 'quizzes', ['user_id', 'status', 'created_at'])
+    op.create_index('ix_quizzes_user_created', 'quizzes', ['user_id', 'created_at', 'id'])
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index(
+        'ix_quizzes_title_trgm', 'quizzes', ['title'],
+        postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'}
+    )
+    op.create_index('ix_questions_quiz_order', 'questions', ['quiz_id', 'order_index'])
+    op.create_index('ix_files_content_hash', 'files', ['content_hash'])
+    op.create_index('ix_files_user_created', 'files', ['user_id', 'created_at'])
+    op.create_index('ix_subscriptions_user_status', 'subscriptions', ['user_id', 'status'])
+
+
+def downgrade():
+    op.drop_index('ix_subscriptions_user_status', table_name='subscriptions')
+    op.drop_index('ix_files_user_created', table_name='files')
+    op.drop_index('ix_files_content_hash', table_name='files')
+    op.drop_index('ix_questions_quiz_order', table_name='questions')
+    op.drop_index('ix_quizzes_title_trgm', table_name='quizzes')
+    op.drop_index('ix_quizzes_user_created', table_name='quizzes')
+    op.drop_index('ix_quizzes_user_status_created', table_name='quizzes')
+
+    op.drop_index('ix_quizzes_share_token', table_name='quizzes')
+    op.alter_column('quizzes', 'share_token', type_=sa.String(length=100))
+    op.create_unique_constraint('quizzes_share_token_key', 'quizzes', ['share_token'])
+
+    op.drop_index('ix_users_full_name', table_name='users')
+    op.drop_index('ix_users_verification_token', table_name='users')
+    op.drop_index('ix_users_reset_token', table_name='users')
+    op.drop_index('ix_users_email_login', table_name='users')
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+    for column in ('reset_token', 'verification_token'):
+        op.alter_column('users', column, type_=sa.String(length=100))
+
+    op.alter_column('users', 'last_quiz_reset', server_default=None)
+    for table in TIMESTAMPED_TABLES:
+        op.alter_column(table, 'created_at', server_default=None)
+        op.alter_column(table, 'updated_at', server_default=None)
+
+    op.alter_column(
+        'subscriptions', 'usage_data',
+        type_=sa.Text(),
+        postgresql_using='usage_data::text'
+    )
+
+    for table, column, enum_name, length in ENUM_COLUMNS:
+        op.alter_column(
+            table, column,
+            type_=sa.String(length=length),
+            postgresql_using=f'{column}::text'
+        )
+    bind = op.get_bind()
+    for name in ENUMS:
+        _enum(name).drop(bind, checkfirst=True)
+
+    op.drop_column('users', 'full_name')
+    op.drop_column('quizzes', 'generation_error')
+    op.drop_column('quizzes', 'generation_status')
+    op.drop_column('quizzes', 'question_count')
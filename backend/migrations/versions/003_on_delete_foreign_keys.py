@@ -0,0 +1,45 @@
+"""ON DELETE rules on foreign keys
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-15 10:00:00.000000
+
+Quiz and account deletes are single DELETE statements that leave dependent rows
+to the database, so the foreign keys cascade (or unlink the source file).
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+# (table, column, referenced table, ON DELETE rule), constraints named as PostgreSQL does
+FOREIGN_KEYS = (
+    ('questions', 'quiz_id', 'quizzes', 'CASCADE'),
+    ('quizzes', 'user_id', 'users', 'CASCADE'),
+    ('quizzes', 'source_file_id', 'files', 'SET NULL'),
+    ('files', 'user_id', 'users', 'CASCADE'),
+    ('subscriptions', 'user_id', 'users', 'CASCADE'),
+)
+
+
+def _replace_foreign_keys(with_rules):
+    for table, column, referred_table, ondelete in FOREIGN_KEYS:
+        name = f'{table}_{column}_fkey'
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(
+            name, table, referred_table, [column], ['id'],
+            ondelete=ondelete if with_rules else None
+        )
+
+
+def upgrade():
+    _replace_foreign_keys(with_rules=True)
+
+
+def downgrade():
+    _replace_foreign_keys(with_rules=False)
@@ -1,40 +1,104 @@
 """
 Test Configuration
 """
-import pytest
-import tempfile
 import os
+from functools import partial
+
+# Tests never download models; set before the app (and any Hugging Face import) loads
+os.environ.setdefault('TRANSFORMERS_OFFLINE', '1')
+os.environ.setdefault('HF_HUB_OFFLINE', '1')
+
+import orjson
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event, orm
 from app import create_app, db
+from app.models.quiz import Quiz
 from app.models.user import User
 from app.models.subscription import Subscription
 
+# Statements that manage the per-test transaction rather than query data
+_TRANSACTION_CONTROL = ('BEGIN', 'SAVEPOINT', 'RELEASE', 'ROLLBACK')
 
-@pytest.fixture
+
+@pytest.fixture(scope='session')
 def app():
-    """Create application for testing"""
-    # Create temporary database
-    db_fd, db_path = tempfile.mkstemp()
-    
+    """Create application and schema once for the test session"""
+    # The database comes from TestingConfig (in-memory SQLite by default), since
+    # the engine is built when create_app initializes Flask-SQLAlchemy
     app = create_app('testing')
-    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
-    app.config['TESTING'] = True
-    app.config['WTF_CSRF_ENABLED'] = False
     
     with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            # pysqlite's own transaction handling breaks SAVEPOINTs; let SQLAlchemy emit BEGIN
+            @event.listens_for(db.engine, 'connect')
+            def disable_pysqlite_transactions(dbapi_connection, connection_record):
+                dbapi_connection.isolation_level = None
+            
+            @event.listens_for(db.engine, 'begin')
+            def begin_transaction(connection):
+                connection.exec_driver_sql('BEGIN')
+        
         db.create_all()
-        yield app
-        db.drop_all()
     
-    os.close(db_fd)
-    os.unlink(db_path)
+    yield app
+    
+    with app.app_context():
+        db.drop_all()
+        db.engine.dispose()
 
 
-@pytest.fixture
+@pytest.fixture(autouse=True)
+def db_session(app):
+    """Run each test in its own app context inside a transaction that is rolled back"""
+    with app.app_context():
+        connection = db.engine.connect()
+        transaction = connection.begin()
+        
+        # Commits in the code under test only release a SAVEPOINT of the outer transaction
+        app_session = db.session
+        db.session = orm.scoped_session(orm.sessionmaker(
+            bind=connection,
+            join_transaction_mode='create_savepoint',
+            query_cls=db.Query
+        ))
+        
+        yield db.session
+        
+        db.session.remove()
+        db.session = app_session
+        transaction.rollback()
+        connection.close()
+
+
+@pytest.fixture(scope='session')
 def client(app):
-    """Create test client"""
+    """Create test client, shared by the whole (serial) test session"""
     return app.test_client()
 
 
+@pytest.fixture(autouse=True)
+def clear_client_cookies(client):
+    """Keep cookies set in one test from reaching the next"""
+    yield
+    # Werkzeug 2.3 has no public way to empty the client's cookie store
+    client._cookies.clear()
+
+
+@pytest.fixture
+def query_counter(app):
+    """Record SQL statements executed while the test runs, excluding transaction control"""
+    statements = []
+    
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not statement.startswith(_TRANSACTION_CONTROL):
+            statements.append(statement)
+    
+    event.listen(db.engine, 'before_cursor_execute', record)
+    yield statements
+    event.remove(db.engine, 'before_cursor_execute', record)
+
+
 @pytest.fixture
 def runner(app):
     """Create test CLI runner"""
@@ -44,68 +108,80 @@ def runner(app):
 @pytest.fixture
 def user(app):
     """Create test user"""
-    with app.app_context():
-        user = User(
-            email='test@example.com',
-            first_name='Test',
-            last_name='User',
-            role='teacher',
-            is_verified=True
-        )
-        user.set_password('password123')
-        
-        db.session.add(user)
-        db.session.commit()
-        
-        # Create subscription
-        Subscription.create_free_subscription(user.id)
-        
-        return user
+    user = User(
+        email='test@example.com',
+        first_name='Test',
+        last_name='User',
+        role='teacher',
+        is_verified=True
+    )
+    user.set_password('password123')
+    
+    # Flushed for its id; the subscription's commit stores both in one transaction
+    db.session.add(user)
+    db.session.flush()
+    
+    # Create subscription
+    Subscription.create_free_subscription(user.id)
+    
+    return user
 
 
 @pytest.fixture
 def admin_user(app):
     """Create test admin user"""
-    with app.app_context():
-        user = User(
-            email='admin@example.com',
-            first_name='Admin',
-            last_name='User',
-            role='school_admin',
-            is_verified=True,
-            subscription_plan='school'
-        )
-        user.set_password('admin123')
-        
-        db.session.add(user)
-        db.session.commit()
-        
-        return user
+    user = User(
+        email='admin@example.com',
+        first_name='Admin',
+        last_name='User',
+        role='school_admin',
+        is_verified=True,
+        subscription_plan='school'
+    )
+    user.set_password('admin123')
+    
+    db.session.add(user)
+    db.session.commit()
+    
+    return user
 
 
 @pytest.fixture
-def auth_headers(client, user):
-    """Get authentication headers for test user"""
-    response = client.post('/api/auth/login', json={
-        'email': user.email,
-        'password': 'password123'
-    })
-    
-    data = response.get_json()
-    token = data['access_token']
+def quiz_factory():
+    """Create and commit quizzes, defaulting the fields a test doesn't care about"""
+    def create_quiz(**fields):
+        quiz = Quiz(**{'title': 'Test Quiz', 'description': 'Test description', **fields})
+        db.session.add(quiz)
+        db.session.commit()
+        return quiz
     
+    return create_quiz
+
+
+def json_of(response):
+    """Decode a JSON response body with orjson"""
+    return orjson.loads(response.data)
+
+
+def _bearer_headers(user):
+    """Authorization headers with an access token issued as login would, minus the HTTP round-trip"""
+    token = create_access_token(identity=user.id, additional_claims=user.token_claims())
     return {'Authorization': f'Bearer {token}'}
 
 
 @pytest.fixture
-def admin_auth_headers(client, admin_user):
+def auth_headers(user):
+    """Get authentication headers for test user"""
+    return _bearer_headers(user)
+
+
+@pytest.fixture
+def admin_auth_headers(admin_user):
     """Get authentication headers for admin user"""
-    response = client.post('/api/auth/login', json={
-        'email': admin_user.email,
-        'password': 'admin123'
-    })
-    
-    data = response.get_json()
-    token = data['access_token']
-    
-    return {'Authorization': f'Bearer {token}'}
+    return _bearer_headers(admin_user)
+
+
+@pytest.fixture
+def quiz_post(client, auth_headers):
+    """POST to /api/quizzes as the test user; pass the body as json="""
+    return partial(client.post, '/api/quizzes', headers=auth_headers)
@@ -2,7 +2,9 @@
 Authentication Tests
 """
 import pytest
+from app import db
 from app.models.user import User
+from conftest import json_of
 
 
 class TestAuth:
@@ -18,36 +20,27 @@ class TestAuth:
         })
         
         assert response.status_code == 201
-        data = response.get_json()
+        data = json_of(response)
         assert 'access_token' in data
         assert 'user' in data
         assert data['user']['email'] == 'newuser@example.com'
     
-    def test_register_invalid_email(self, client):
-        """Test registration with invalid email"""
+    @pytest.mark.parametrize('email, password, expected_message', [
+        ('invalid-email', 'Password123!', 'Invalid email format'),
+        ('newuser@example.com', 'weak', 'Password must be at least 8 characters'),
+    ], ids=['invalid_email', 'weak_password'])
+    def test_register_invalid_input(self, client, email, password, expected_message):
+        """Test registration with an invalid email or a weak password"""
         response = client.post('/api/auth/register', json={
-            'email': 'invalid-email',
-            'password': 'Password123!',
+            'email': email,
+            'password': password,
             'first_name': 'New',
             'last_name': 'User'
         })
         
         assert response.status_code == 400
-        data = response.get_json()
-        assert 'Invalid email format' in data['message']
-    
-    def test_register_weak_password(self, client):
-        """Test registration with weak password"""
-        response = client.post('/api/auth/register', json={
-            'email': 'newuser@example.com',
-            'password': 'weak',
-            'first_name': 'New',
-            'last_name': 'User'
-        })
-        
-        assert response.status_code == 400
-        data = response.get_json()
-        assert 'Password must be at least 8 characters' in data['message']
+        data = json_of(response)
+        assert expected_message in data['message']
     
     def test_register_duplicate_email(self, client, user):
         """Test registration with existing email"""
@@ -59,7 +52,7 @@ class TestAuth:
         })
         
         assert response.status_code == 409
-        data = response.get_json()
+        data = json_of(response)
         assert 'Email already registered' in data['message']
     
     def test_login_success(self, client, user):
@@ -70,31 +63,24 @@ class TestAuth:
         })
         
         assert response.status_code == 200
-        data = response.get_json()
+        data = json_of(response)
         assert 'access_token' in data
         assert 'user' in data
         assert data['user']['email'] == user.email
     
-    def test_login_invalid_credentials(self, client, user):
-        """Test login with invalid credentials"""
+    @pytest.mark.parametrize('email, password', [
+        ('test@example.com', 'wrongpassword'),
+        ('nonexistent@example.com', 'password123'),
+    ], ids=['wrong_password', 'nonexistent_user'])
+    def test_login_rejected(self, client, user, email, password):
+        """Test login with a wrong password or an unknown email"""
         response = client.post('/api/auth/login', json={
-            'email': user.email,
-            'password': 'wrongpassword'
+            'email': email,
+            'password': password
         })
         
         assert response.status_code == 401
-        data = response.get_json()
-        assert 'Invalid email or password' in data['message']
-    
-    def test_login_nonexistent_user(self, client):
-        """Test login with nonexistent user"""
-        response = client.post('/api/auth/login', json={
-            'email': 'nonexistent@example.com',
-            'password': 'password123'
-        })
-        
-        assert response.status_code == 401
-        data = response.get_json()
+        data = json_of(response)
         assert 'Invalid email or password' in data['message']
     
     def test_get_current_user(self, client, auth_headers):
@@ -102,10 +88,20 @@ class TestAuth:
         response = client.get('/api/auth/me', headers=auth_headers)
         
         assert response.status_code == 200
-        data = response.get_json()
+        data = json_of(response)
         assert 'user' in data
         assert data['user']['email'] == 'test@example.com'
     
+    def test_get_current_user_single_query(self, client, auth_headers, query_counter):
+        """Test that loading the current user takes one query"""
+        # Load the user from the database rather than the identity map
+        db.session.expire_all()
+        query_counter.clear()
+        response = client.get('/api/auth/me', headers=auth_headers)
+        
+        assert response.status_code == 200
+        assert len(query_counter) == 1
+    
     def test_get_current_user_unauthorized(self, client):
         """Test getting current user without auth"""
         response = client.get('/api/auth/me')
@@ -117,7 +113,7 @@ class TestAuth:
         response = client.post('/api/auth/logout', headers=auth_headers)
         
         assert response.status_code == 200
-        data = response.get_json()
+        data = json_of(response)
         assert 'Successfully logged out' in data['message']
     
     def test_forgot_password(self, client, user):
@@ -127,7 +123,7 @@ class TestAuth:
         })
         
         assert response.status_code == 200
-        data = response.get_json()
+        data = json_of(response)
         assert 'password reset link has been sent' in data['message']
     
     def test_forgot_password_nonexistent_email(self, client):
@@ -2,32 +2,42 @@
 Quiz Tests
 """
 import pytest
+from datetime import datetime, timezone
 from app import db
 from app.models.quiz import Quiz
 from app.models.question import Question
+from conftest import json_of
 
 
 class TestQuizzes:
     """Test quiz endpoints"""
     
-    def test_create_quiz(self, client, auth_headers):
+    def test_create_quiz(self, quiz_post, user):
         """Test creating a new quiz"""
-        response = client.post('/api/quizzes', 
-            headers=auth_headers,
-            json={
-                'title': 'Test Quiz',
-                'description': 'A test quiz',
-                'source_text': 'This is test content for the quiz.',
-                'difficulty_level': 'medium',
-                'total_questions': 5
-            }
-        )
+        response = quiz_post(json={
+            'title': 'Test Quiz',
+            'description': 'A test quiz',
+            'source_text': 'This is test content for the quiz.',
+            'difficulty_level': 'medium',
+            'total_questions': 5
+        })
         
         assert response.status_code == 201
-        data = response.get_json()
+        data = json_of(response)
         assert 'quiz' in data
         assert data['quiz']['title'] == 'Test Quiz'
         assert data['quiz']['status'] == 'draft'
+        
+        # Charged to the quota in the quiz's own commit
+        db.session.refresh(user)
+        assert user.quiz_count_current_month == 1
+    
+    def test_create_quiz_invalid_difficulty(self, quiz_post):
+        """Test values outside the ENUM vocabularies are rejected before the database"""
+        response = quiz_post(json={'title': 'Test Quiz', 'difficulty_level': 'impossible'})
+        
+        assert response.status_code == 400
+        assert json_of(response)['invalid_fields'] == ['difficulty_level']
     
     def test_create_quiz_unauthorized(self, client):
         """Test creating quiz without authentication"""
@@ -37,71 +47,133 @@ class TestQuizzes:
         
         assert response.status_code == 401
     
-    def test_get_quizzes(self, client, auth_headers, user):
+    def test_get_quizzes(self, client, auth_headers, user, quiz_factory):
         """Test getting user's quizzes"""
         # Create a test quiz
-        quiz = Quiz(
-            title='Test Quiz',
-            description='Test description',
-            user_id=user.id
-        )
-        db.session.add(quiz)
-        db.session.commit()
+        quiz_factory(user_id=user.id)
         
         response = client.get('/api/quizzes', headers=auth_headers)
         
         assert response.status_code == 200
-        data = response.get_json()
+        data = json_of(response)
         assert 'quizzes' in data
         assert len(data['quizzes']) == 1
         assert data['quizzes'][0]['title'] == 'Test Quiz'
     
-    def test_get_quiz_by_id(self, client, auth_headers, user):
-        """Test getting a specific quiz"""
-        quiz = Quiz(
-            title='Test Quiz',
-            description='Test description',
-            user_id=user.id
-        )
-        db.session.add(quiz)
+    def test_get_quizzes_with_fields(self, client, auth_headers, user, quiz_factory):
+        """Test limiting the quiz listing to selected fields"""
+        quiz = quiz_factory(user_id=user.id)
+        
+        response = client.get('/api/quizzes?fields=id,title', headers=auth_headers)
+        
+        assert response.status_code == 200
+        data = json_of(response)
+        assert data['quizzes'][0] == {'id': quiz.id, 'title': 'Test Quiz'}
+        
+        response = client.get('/api/quizzes?fields=id,secret', headers=auth_headers)
+        assert response.status_code == 400
+    
+    def test_get_quizzes_keyset(self, client, auth_headers, user):
+        """Test paging through quizzes with cursors"""
+        created_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        for i, day in enumerate([1, 2, 2]):
+            db.session.add(Quiz(
+                title=f'Quiz {i}',
+                user_id=user.id,
+                created_at=created_at.replace(day=day)
+            ))
         db.session.commit()
         
+        response = client.get('/api/quizzes?after=&per_page=2&include_total=1', headers=auth_headers)
+        
+        assert response.status_code == 200
+        data = json_of(response)
+        assert [q['title'] for q in data['quizzes']] == ['Quiz 2', 'Quiz 1']
+        assert data['pagination']['has_next'] is True
+        assert data['pagination']['total'] == 3
+        
+        cursor = data['pagination']['next_cursor']
+        response = client.get(f'/api/quizzes?after={cursor}&per_page=2', headers=auth_headers)
+        
+        data = json_of(response)
+        assert [q['title'] for q in data['quizzes']] == ['Quiz 0']
+        assert data['pagination']['has_next'] is False
+        assert data['pagination']['next_cursor'] is None
+        
+        response = client.get('/api/quizzes?after=not-a-cursor', headers=auth_headers)
+        assert response.status_code == 400
+    
+    def test_get_quizzes_keyset_default_timestamps(self, client, auth_headers, user, quiz_factory):
+        """Test cursors over quizzes stamped by the column default, created within the same second"""
+        for i in range(5):
+            quiz_factory(title=f'Quiz {i}', user_id=user.id)
+        
+        titles = []
+        cursor = ''
+        while cursor is not None:
+            response = client.get(f'/api/quizzes?after={cursor}&per_page=2', headers=auth_headers)
+            data = json_of(response)
+            titles += [q['title'] for q in data['quizzes']]
+            cursor = data['pagination']['next_cursor']
+        
+        assert titles == [f'Quiz {i}' for i in reversed(range(5))]
+    
+    def test_get_quiz_by_id(self, client, auth_headers, user, quiz_factory):
+        """Test getting a specific quiz"""
+        quiz = quiz_factory(user_id=user.id)
+        
         response = client.get(f'/api/quizzes/{quiz.id}', headers=auth_headers)
         
         assert response.status_code == 200
-        data = response.get_json()
+        data = json_of(response)
         assert 'quiz' in data
         assert data['quiz']['title'] == 'Test Quiz'
     
+    def test_get_quiz_with_questions(self, client, auth_headers, user, quiz_factory):
+        """Test a quiz is returned with its questions"""
+        quiz = quiz_factory(user_id=user.id)
+        db.session.add(Question(
+            question_text='Test question?',
+            question_type='true_false',
+            correct_answer='True',
+            quiz_id=quiz.id
+        ))
+        db.session.commit()
+        
+        response = client.get(f'/api/quizzes/{quiz.id}', headers=auth_headers)
+        
+        assert response.status_code == 200
+        questions = json_of(response)['quiz']['questions']
+        assert [question['question_text'] for question in questions] == ['Test question?']
+    
+    def test_get_quiz_queries(self, client, auth_headers, user, quiz_factory, query_counter):
+        """Test the quiz is loaded once, by the ownership check"""
+        quiz_id = quiz_factory(user_id=user.id).id
+        
+        query_counter.clear()
+        response = client.get(f'/api/quizzes/{quiz_id}', headers=auth_headers)
+        
+        assert response.status_code == 200
+        # The quiz with its source file, then the question rows
+        assert len(query_counter) == 2
+    
     def test_get_quiz_not_found(self, client, auth_headers):
         """Test getting nonexistent quiz"""
         response = client.get('/api/quizzes/999', headers=auth_headers)
         
         assert response.status_code == 404
     
-    def test_get_quiz_not_owned(self, client, auth_headers, admin_user):
+    def test_get_quiz_not_owned(self, client, auth_headers, admin_user, quiz_factory):
         """Test getting quiz not owned by user"""
-        quiz = Quiz(
-            title='Admin Quiz',
-            description='Admin description',
-            user_id=admin_user.id
-        )
-        db.session.add(quiz)
-        db.session.commit()
+        quiz = quiz_factory(title='Admin Quiz', description='Admin description', user_id=admin_user.id)
         
         response = client.get(f'/api/quizzes/{quiz.id}', headers=auth_headers)
         
         assert response.status_code == 403
     
-    def test_update_quiz(self, client, auth_headers, user):
+    def test_update_quiz(self, client, auth_headers, user, quiz_factory):
         """Test updating a quiz"""
-        quiz = Quiz(
-            title='Original Title',
-            description='Original description',
-            user_id=user.id
-        )
-        db.session.add(quiz)
-        db.session.commit()
+        quiz = quiz_factory(title='Original Title', description='Original description', user_id=user.id)
         
         response = client.put(f'/api/quizzes/{quiz.id}',
             headers=auth_headers,
@@ -112,29 +184,134 @@ class TestQuizzes:
         )
         
         assert response.status_code == 200
-        data = response.get_json()
+        data = json_of(response)
         assert data['quiz']['title'] == 'Updated Title'
         assert data['quiz']['description'] == 'Updated description'
+        
+        response = client.put(f'/api/quizzes/{quiz.id}', headers=auth_headers, json={'status': 'deleted'})
+        assert response.status_code == 400
     
-    def test_delete_quiz(self, client, auth_headers, user):
+    def test_delete_quiz(self, client, auth_headers, user, quiz_factory):
         """Test deleting a quiz"""
-        quiz = Quiz(
-            title='Test Quiz',
-            description='Test description',
-            user_id=user.id
-        )
-        db.session.add(quiz)
-        db.session.commit()
+        quiz = quiz_factory(user_id=user.id)
         quiz_id = quiz.id
         
         response = client.delete(f'/api/quizzes/{quiz_id}', headers=auth_headers)
         
         assert response.status_code == 200
         
-        # Verify quiz is deleted
-        deleted_quiz = Quiz.query.get(quiz_id)
+        # Verify quiz is deleted, reading the database rather than the identity map
+        db.session.expire_all()
+        deleted_quiz = db.session.get(Quiz, quiz_id)
         assert deleted_quiz is None
     
+    def test_delete_quiz_cascades_questions(self, client, auth_headers, user, quiz_factory):
+        """Test deleting a quiz removes its questions in the database"""
+        quiz = quiz_factory(user_id=user.id)
+        quiz_id = quiz.id
+        
+        db.session.add(Question(
+            question_text='Test question?',
+            question_type='true_false',
+            correct_answer='True',
+            quiz_id=quiz_id
+        ))
+        db.session.commit()
+        
+        response = client.delete(f'/api/quizzes/{quiz_id}', headers=auth_headers)
+        
+        assert response.status_code == 200
+        assert db.session.scalar(
+            db.select(db.func.count(Question.id)).where(Question.quiz_id == quiz_id)
+        ) == 0
+    
+    def test_delete_other_users_quiz(self, client, auth_headers, admin_user, quiz_factory):
+        """Test a quiz owned by someone else is not deleted"""
+        quiz = quiz_factory(title='Admin Quiz', user_id=admin_user.id)
+        quiz_id = quiz.id
+        
+        response = client.delete(f'/api/quizzes/{quiz_id}', headers=auth_headers)
+        
+        assert response.status_code == 403
+        assert db.session.scalar(
+            db.select(db.func.count(Quiz.id)).where(Quiz.id == quiz_id)
+        ) == 1
+    
+    def test_delete_other_users_question(self, client, auth_headers, admin_user, quiz_factory):
+        """Test a question in someone else's quiz is not deleted"""
+        quiz = quiz_factory(title='Admin Quiz', user_id=admin_user.id)
+        question = Question(
+            question_text='Test question?',
+            question_type='true_false',
+            correct_answer='True',
+            quiz_id=quiz.id
+        )
+        db.session.add(question)
+        db.session.commit()
+        question_id = question.id
+        
+        response = client.delete(f'/api/questions/{question_id}', headers=auth_headers)
+        
+        assert response.status_code == 403
+        assert db.session.scalar(
+            db.select(db.func.count(Question.id)).where(Question.id == question_id)
+        ) == 1
+        
+        response = client.delete('/api/questions/999', headers=auth_headers)
+        assert response.status_code == 404
+    
+    def test_delete_quiz_not_found(self, client, auth_headers):
+        """Test deleting nonexistent quiz"""
+        response = client.delete('/api/quizzes/999', headers=auth_headers)
+        
+        assert response.status_code == 404
+    
+    def test_get_quiz_questions(self, client, auth_headers, user, quiz_factory):
+        """Test listing a quiz's active questions in order"""
+        quiz = quiz_factory(user_id=user.id)
+        db.session.add_all([
+            Question(question_text='Second?', question_type='true_false',
+                     correct_answer='True', order_index=2, quiz_id=quiz.id),
+            Question(question_text='First?', question_type='true_false',
+                     correct_answer='True', order_index=1, quiz_id=quiz.id),
+            Question(question_text='Removed?', question_type='true_false',
+                     correct_answer='True', order_index=3, is_active=False, quiz_id=quiz.id)
+        ])
+        db.session.commit()
+        
+        response = client.get(f'/api/questions/quiz/{quiz.id}/questions', headers=auth_headers)
+        
+        assert response.status_code == 200
+        questions = json_of(response)['questions']
+        assert [question['question_text'] for question in questions] == ['First?', 'Second?']
+    
+    def test_reorder_questions(self, client, auth_headers, user, quiz_factory):
+        """Test reordering questions, with ids sent as integers or strings"""
+        quiz = quiz_factory(user_id=user.id)
+        first, second = (
+            Question(question_text=f'Question {i}?', question_type='true_false',
+                     correct_answer='True', order_index=i, quiz_id=quiz.id)
+            for i in (1, 2)
+        )
+        db.session.add_all([first, second])
+        db.session.commit()
+        
+        response = client.post(f'/api/questions/quiz/{quiz.id}/reorder', headers=auth_headers, json={
+            'question_orders': [
+                {'id': first.id, 'order_index': 2},
+                {'id': str(second.id), 'order_index': 1}
+            ]
+        })
+        
+        assert response.status_code == 200
+        db.session.expire_all()
+        assert (first.order_index, second.order_index) == (2, 1)
+        
+        response = client.post(f'/api/questions/quiz/{quiz.id}/reorder', headers=auth_headers, json={
+            'question_orders': [{'id': 'first', 'order_index': 1}]
+        })
+        assert response.status_code == 400
+    
     def test_publish_quiz(self, client, auth_headers, user):
         """Test publishing a quiz"""
         quiz = Quiz(
@@ -142,55 +319,40 @@ class TestQuizzes:
             description='Test description',
             user_id=user.id
         )
-        db.session.add(quiz)
-        db.session.commit()
         
-        # Add a question so quiz can be published
-        question = Question(
+        # Add a question so quiz can be published (saved with the quiz in one commit)
+        Question(
             question_text='Test question?',
             question_type='multiple_choice',
             correct_answer='A',
-            quiz_id=quiz.id
+            quiz=quiz
         )
-        db.session.add(question)
+        db.session.add(quiz)
         db.session.commit()
         
         response = client.post(f'/api/quizzes/{quiz.id}/publish', headers=auth_headers)
         
         assert response.status_code == 200
-        data = response.get_json()
+        data = json_of(response)
         assert data['quiz']['status'] == 'published'
     
-    def test_publish_quiz_without_questions(self, client, auth_headers, user):
+    def test_publish_quiz_without_questions(self, client, auth_headers, user, quiz_factory):
         """Test publishing quiz without questions"""
-        quiz = Quiz(
-            title='Test Quiz',
-            description='Test description',
-            user_id=user.id
-        )
-        db.session.add(quiz)
-        db.session.commit()
+        quiz = quiz_factory(user_id=user.id)
         
         response = client.post(f'/api/quizzes/{quiz.id}/publish', headers=auth_headers)
         
         assert response.status_code == 400
-        data = response.get_json()
+        data = json_of(response)
         assert 'Cannot publish quiz without questions' in data['message']
     
-    def test_generate_share_link(self, client, auth_headers, user):
+    def test_generate_share_link(self, client, auth_headers, user, quiz_factory):
         """Test generating share link for quiz"""
-        quiz = Quiz(
-            title='Test Quiz',
-            description='Test description',
-            status='published',
-            user_id=user.id
-        )
-        db.session.add(quiz)
-        db.session.commit()
+        quiz = quiz_factory(status='published', user_id=user.id)
         
         response = client.post(f'/api/quizzes/{quiz.id}/share', headers=auth_headers)
         
         assert response.status_code == 200
-        data = response.get_json()
+        data = json_of(response)
         assert 'share_token' in data
         assert 'share_url' in data